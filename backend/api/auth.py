@@ -4,6 +4,8 @@ from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identi
 from werkzeug.security import generate_password_hash, check_password_hash
 from models.user import User
 from models.db import get_db
+from services.auth_cache import credential_cache, lookup_api_key, looks_like_jwt
+from services.write_behind import record_api_key_use
 from bson.objectid import ObjectId
 from datetime import datetime, timedelta
 import secrets
@@ -27,35 +29,15 @@ def auth_required(f):
             if auth_header.startswith('Bearer '):
                 token = auth_header.split(' ')[1]
                 
-                # First try as API key
-                key_data = db.api_keys.find_one({
-                    'key': token,
-                    'is_active': True
-                })
+                # First try as API key (JWTs are never API keys)
+                key_data = None if looks_like_jwt(token) else lookup_api_key(db, token)
                 
                 if key_data:
-                    # Update last used timestamp
-                    db.api_keys.update_one(
-                        {'_id': key_data['_id']},
-                        {'$set': {'last_used': datetime.utcnow()}}
-                    )
-                    
-                    # Get user information
-                    user = db.users.find_one({'_id': key_data['user_id']})
-                    if not user:
+                    if not key_data['user_exists']:
                         return {'message': 'User not found'}, 404
                     
-                    # Create audit log entry
-                    audit_entry = {
-                        'action': f'api_request_{request.method.lower()}',
-                        'action_type': 'api',
-                        'performed_by': user['name'],
-                        'user_id': key_data['user_id'],
-                        'organization': user['organization'],
-                        'timestamp': datetime.utcnow(),
-                        'details': f"API request to {request.path} using API key '{key_data['name']}'"
-                    }
-                    db.audit_log.insert_one(audit_entry)
+                    # Queue last_used and the audit entry; written in batches off the hot path
+                    record_api_key_use(db, key_data, request.method, request.path)
                     
                     # Set user ID for the request
                     request.user_id = str(key_data['user_id'])
@@ -200,6 +182,8 @@ class Profile(Resource):
                     {'_id': ObjectId(user_id)},
                     {'$set': updates}
                 )
+                # Cached API key credentials carry the user's name and organization
+                credential_cache.invalidate_user(user_id)
                 
             response = make_response({'message': 'Profile updated successfully'})
             response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
@@ -471,6 +455,37 @@ class ApiKeys(Resource):
         response.headers.add('Access-Control-Allow-Credentials', 'true')
         return response
 
+@auth_ns.route('/api-keys/<key_id>')
+class ApiKey(Resource):
+    @jwt_required()
+    def delete(self, key_id):
+        """Deactivate an API key"""
+        current_user_id = get_jwt_identity()
+        db = get_db()
+        
+        result = db.api_keys.update_one(
+            {
+                '_id': ObjectId(key_id),
+                'user_id': ObjectId(current_user_id)
+            },
+            {'$set': {
+                'is_active': False,
+                'deactivated_at': datetime.utcnow()
+            }}
+        )
+        
+        if result.matched_count == 0:
+            return {'message': 'API key not found'}, 404
+        
+        # Drop the key from this worker's credential cache right away; other
+        # workers pick the change up within AUTH_CACHE_TTL seconds
+        credential_cache.invalidate_key_id(key_id)
+        
+        response = make_response({'message': 'API key deactivated successfully'})
+        response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
+        response.headers.add('Access-Control-Allow-Credentials', 'true')
+        return response
+
 @auth_ns.route('/settings/retention')
 class RetentionSettings(Resource):
     @jwt_required()
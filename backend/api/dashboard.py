@@ -1,10 +1,33 @@
 from flask_restx import Namespace, Resource, fields
-from flask import request, make_response, current_app
+from flask import request, make_response, current_app, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models.db import get_db, db
 from bson import ObjectId
-from datetime import datetime
+from bson.errors import InvalidId
+from werkzeug.http import quote_etag
+from pymongo.errors import OperationFailure
+from services.chart_cache import chart_cache
+from services.source_versions import get_source_states, get_source_versions
+from services.http_cache import make_etag, cache_headers, no_store_headers, is_not_modified, not_modified
+from services.chart_snapshots import public_snapshots
+from services.rollups import register_rollups, prune_rollups, read_rollups
+from services.downsample import DOWNSAMPLE_METHODS, downsample
+from services.transform import top_group_totals
+from services.live_updates import live_updates
+from services.serialization import dumps
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, wait
+import base64
+import binascii
+import hashlib
+import hmac
 import json
+import jwt
+import math
+import os
+import threading
+import time
+from urllib.parse import urlencode, parse_qsl
 
 dashboard_ns = Namespace('dashboard', description='Dashboard operations')
 
@@ -38,6 +61,18 @@ class Dashboards(Resource):
                 print("User not found")
                 return {'message': 'User not found'}, 404
                 
+            # The list changes only when a dashboard is added, removed or
+            # updated, so validate it from ids and updated_at alone. No
+            # Last-Modified: a deletion would not move it forward.
+            stamps = list(db.dashboards.find(
+                {'organization': user['organization']},
+                {'updated_at': 1}
+            ).sort('_id', 1))
+            etag = make_etag('dashboards', [(str(stamp['_id']), stamp.get('updated_at')) for stamp in stamps])
+            headers = cache_headers(etag)
+            if is_not_modified(etag):
+                return not_modified(headers)
+            
             print(f"Fetching dashboards for organization: {user['organization']}")
             dashboards = list(db.dashboards.find({
                 'organization': user['organization']
@@ -45,17 +80,17 @@ class Dashboards(Resource):
             
             print(f"Found {len(dashboards)} dashboards")
             result = [{
-                'id': str(dashboard['_id']),
+                'id': dashboard['_id'],
                 'name': dashboard['name'],
                 'description': dashboard.get('description', ''),
-                'created_at': dashboard['created_at'].isoformat(),
-                'updated_at': dashboard['updated_at'].isoformat(),
+                'created_at': dashboard['created_at'],
+                'updated_at': dashboard['updated_at'],
                 'charts': dashboard.get('charts', []),
                 'charts_count': len(dashboard.get('charts', []))
             } for dashboard in dashboards]
             
             print("Returning dashboards:", result)
-            return result
+            return result, 200, headers
         except Exception as e:
             print(f"Error in GET /dashboard: {str(e)}")
             return {'message': f'Error fetching dashboards: {str(e)}'}, 500
@@ -70,6 +105,10 @@ class Dashboards(Resource):
         
         user = db.users.find_one({'_id': ObjectId(current_user_id)})
         
+        error = validate_charts(data['charts'])
+        if error:
+            return {'message': error}, 400
+        
         dashboard = {
             'name': data['name'],
             'description': data.get('description', ''),
@@ -81,6 +120,7 @@ class Dashboards(Resource):
         }
         
         result = db.dashboards.insert_one(dashboard)
+        register_rollups(db, data['charts'])
         
         # Create audit log entry for dashboard and chart creation
         audit_entry = {
@@ -128,14 +168,19 @@ class Dashboard(Resource):
         if not dashboard:
             return {'message': 'Dashboard not found'}, 404
         
+        etag = make_etag('dashboard', str(dashboard['_id']), dashboard['updated_at'])
+        headers = cache_headers(etag, dashboard['updated_at'])
+        if is_not_modified(etag, dashboard['updated_at']):
+            return not_modified(headers)
+        
         return {
-            'id': str(dashboard['_id']),
+            'id': dashboard['_id'],
             'name': dashboard['name'],
             'description': dashboard.get('description', ''),
-            'created_at': dashboard['created_at'].isoformat(),
-            'updated_at': dashboard['updated_at'].isoformat(),
+            'created_at': dashboard['created_at'],
+            'updated_at': dashboard['updated_at'],
             'charts': dashboard['charts']
-        }
+        }, 200, headers
     
     @jwt_required()
     @dashboard_ns.expect(dashboard_model)
@@ -155,6 +200,10 @@ class Dashboard(Resource):
         if not dashboard:
             return {'message': 'Dashboard not found'}, 404
         
+        error = validate_charts(data['charts'])
+        if error:
+            return {'message': error}, 400
+        
         updates = {
             'name': data['name'],
             'description': data.get('description', ''),
@@ -166,6 +215,8 @@ class Dashboard(Resource):
             {'_id': ObjectId(dashboard_id)},
             {'$set': updates}
         )
+        register_rollups(db, data['charts'])
+        prune_rollups(db, [chart for chart in dashboard.get('charts', []) if chart not in data['charts']])
         
         return {'message': 'Dashboard updated successfully'}
     
@@ -175,21 +226,356 @@ class Dashboard(Resource):
         db = get_db()
         user = db.users.find_one({'_id': ObjectId(get_jwt_identity())})
         
-        result = db.dashboards.delete_one({
+        dashboard = db.dashboards.find_one_and_delete({
             '_id': ObjectId(dashboard_id),
             'organization': user['organization']
         })
         
-        if result.deleted_count == 0:
+        if not dashboard:
             return {'message': 'Dashboard not found'}, 404
+        prune_rollups(db, dashboard.get('charts', []))
             
         return {'message': 'Dashboard deleted successfully'}
 
+# Thread pool for chart queries, created lazily in each worker process
+query_executor = None
+query_executor_pid = None
+query_executor_lock = threading.Lock()
+
+def get_query_executor():
+    global query_executor, query_executor_pid
+    pid = os.getpid()
+    if query_executor is not None and query_executor_pid == pid:
+        return query_executor
+    with query_executor_lock:
+        # Concurrent first requests must share one pool
+        if query_executor is None or query_executor_pid != pid:
+            query_executor = ThreadPoolExecutor(
+                max_workers=current_app.config.get('DASHBOARD_QUERY_WORKERS', 8),
+                thread_name_prefix='chart-query'
+            )
+            query_executor_pid = pid
+        return query_executor
+
+def empty_chart_data(chart):
+    return {
+        'labels': [],
+        'datasets': [{
+            'label': chart.get('title', 'Untitled'),
+            'data': []
+        }]
+    }
+
+# A $facet stage returns a single document, which must fit in 16MB
+MAX_BSON_DOCUMENT_BYTES = 16 * 1024 * 1024
+# Used when the server can't tell us the average raw_data document size
+DEFAULT_RAW_DOC_BYTES = 4096
+# Bytes assumed per grouped result ({_id, value})
+GROUPED_RESULT_BYTES = 512
+
+# Server-side budget for a single chart aggregation
+CHART_QUERY_MAX_TIME_MS = int(os.getenv('CHART_QUERY_MAX_TIME_MS', '30000'))
+# Largest random sample a chart preview may request
+CHART_SAMPLE_MAX_SIZE = int(os.getenv('CHART_SAMPLE_MAX_SIZE', '100000'))
+# z for the 95% confidence intervals reported on sampled charts
+SAMPLE_Z = 1.96
+
+# Time bucket units: $dateToString format of the bucket key and bucket width.
+# Keys are ISO strings, which sort in time order and parse back for gap filling.
+TIME_BUCKETS = {
+    'minute': ('%Y-%m-%dT%H:%M:00', timedelta(minutes=1)),
+    'hour': ('%Y-%m-%dT%H:00:00', timedelta(hours=1)),
+    'day': ('%Y-%m-%dT00:00:00', timedelta(days=1)),
+}
+BUCKET_KEY_FORMAT = '%Y-%m-%dT%H:%M:%S'
+RANGE_UNITS = {'m': 'minutes', 'h': 'hours', 'd': 'days'}
+# Most buckets a time series chart returns or fills
+CHART_MAX_BUCKETS = int(os.getenv('CHART_MAX_BUCKETS', '5000'))
+# Most points a line chart reads before downsampling, and the default it is reduced to
+CHART_MAX_SERIES_POINTS = int(os.getenv('CHART_MAX_SERIES_POINTS', '100000'))
+CHART_DEFAULT_POINTS = int(os.getenv('CHART_DEFAULT_POINTS', '1000'))
+# Results with more rows than this are not put in the chart cache
+CHART_CACHE_MAX_ROWS = int(os.getenv('CHART_CACHE_MAX_ROWS', '5000'))
+
+raw_doc_size_estimate = {'bytes': None, 'expires': 0}
+
+def get_raw_doc_size(db):
+    """Average raw_data document size from collStats, refreshed every 5 minutes"""
+    now = time.monotonic()
+    if raw_doc_size_estimate['bytes'] is None or raw_doc_size_estimate['expires'] < now:
+        try:
+            size = db.command('collStats', 'raw_data').get('avgObjSize') or DEFAULT_RAW_DOC_BYTES
+        except Exception:
+            size = DEFAULT_RAW_DOC_BYTES
+        raw_doc_size_estimate['bytes'] = size
+        raw_doc_size_estimate['expires'] = now + 300
+    return raw_doc_size_estimate['bytes']
+
+def estimate_pipeline_output_bytes(pipeline, raw_doc_bytes):
+    """
+    Upper bound for a chart pipeline's output size, or None if its output
+    is not bounded by a trailing $limit.
+    """
+    limit = None
+    grouped = False
+    for stage in pipeline:
+        if '$group' in stage:
+            grouped = True
+            limit = None
+        elif '$limit' in stage:
+            limit = stage['$limit']
+    if limit is None:
+        return None
+    return limit * (GROUPED_RESULT_BYTES if grouped else raw_doc_bytes)
+
+def plan_chart_queries(charts, build_pipeline, raw_doc_bytes, max_facet_bytes=MAX_BSON_DOCUMENT_BYTES // 2, indexes=None):
+    """
+    Groups charts by their $match stage (data_source and time range) so
+    each slice of a source is scanned once.
+
+    Returns a list of query tasks. A task for several charts runs one
+    aggregation: the shared $match followed by a $facet with one branch per
+    chart. Charts whose output is unbounded, or would push the combined
+    facet document past `max_facet_bytes`, get a task of their own.
+    `indexes` restricts planning to those positions in `charts`.
+    """
+    by_match = {}
+    for index in (range(len(charts)) if indexes is None else indexes):
+        pipeline = build_pipeline(charts[index])
+        match_key = json.dumps(pipeline[0], sort_keys=True, default=str)
+        by_match.setdefault(match_key, []).append((index, pipeline))
+    
+    tasks = []
+    for planned in by_match.values():
+        facet_indexes = []
+        facet_bytes = 0
+        for index, pipeline in planned:
+            estimate = estimate_pipeline_output_bytes(pipeline, raw_doc_bytes)
+            if len(planned) > 1 and estimate is not None and facet_bytes + estimate <= max_facet_bytes:
+                facet_indexes.append((index, pipeline))
+                facet_bytes += estimate
+            else:
+                tasks.append({'charts': [index], 'pipelines': {index: pipeline}, 'facet': False})
+        
+        if len(facet_indexes) == 1:
+            index, pipeline = facet_indexes[0]
+            tasks.append({'charts': [index], 'pipelines': {index: pipeline}, 'facet': False})
+        elif facet_indexes:
+            first_pipeline = facet_indexes[0][1]
+            tasks.append({
+                'charts': [index for index, _ in facet_indexes],
+                'pipelines': dict(facet_indexes),
+                'facet': True,
+                'data_source': first_pipeline[0]['$match']['data_source'],
+                'match': first_pipeline[0]
+            })
+    return tasks
+
+def build_facet_pipeline(task):
+    """Combines the per-chart pipelines of a task under one $match"""
+    return [
+        task['match'],
+        {'$facet': {
+            str(index): pipeline[1:]  # every chart pipeline in a task starts with the same $match
+            for index, pipeline in task['pipelines'].items()
+        }}
+    ]
+
+def parse_range(value):
+    """Parses a relative range like '15m', '24h' or '7d' into a timedelta"""
+    if not isinstance(value, str) or len(value) < 2 or value[-1] not in RANGE_UNITS:
+        return None
+    try:
+        amount = float(value[:-1])
+    except ValueError:
+        return None
+    return timedelta(**{RANGE_UNITS[value[-1]]: amount}) if amount > 0 else None
+
+def parse_timestamp(value):
+    """Parses an ISO 8601 timestamp into a naive UTC datetime, like raw_data.timestamp"""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def get_time_bucket(chart):
+    bucket = (chart.get('config') or {}).get('time_bucket')
+    return bucket if bucket in TIME_BUCKETS else None
+
+def floor_to_bucket(value, bucket):
+    value = value.replace(second=0, microsecond=0)
+    if bucket in ('hour', 'day'):
+        value = value.replace(minute=0)
+    if bucket == 'day':
+        value = value.replace(hour=0)
+    return value
+
+def get_time_range(chart, now=None):
+    """
+    Returns the (start, end) timestamp filter of a chart from config.range
+    (relative to now) or config.from / config.to, either may be None.
+    Relative starts are floored to the bucket (or minute) so the pipeline,
+    and with it the cache key, stays the same for the whole bucket.
+    """
+    config = chart.get('config') or {}
+    start = end = None
+    delta = parse_range(config.get('range'))
+    if delta:
+        start = floor_to_bucket((now or datetime.utcnow()) - delta, get_time_bucket(chart) or 'minute')
+    if config.get('from'):
+        start = parse_timestamp(config['from'])
+    if config.get('to'):
+        end = parse_timestamp(config['to'])
+    return start, end
+
+def has_valid_time_range(chart):
+    """False if config.from or config.to is not an ISO 8601 timestamp"""
+    try:
+        get_time_range(chart)
+    except (ValueError, TypeError, AttributeError):
+        return False
+    return True
+
+def validate_charts(charts):
+    """Returns an error message for the first chart with an invalid time range, or None"""
+    for chart in charts:
+        if not has_valid_time_range(chart):
+            return f"Invalid time range in chart '{chart.get('title')}': from and to must be ISO 8601 timestamps"
+    return None
+
+def fill_time_gaps(rows, bucket, start=None, end=None, fill='null'):
+    """
+    Adds a row for every empty bucket between the start of the range (or
+    the first bucket) and its end (or now, for open ranges, else the last
+    bucket). Empty buckets get 0, None or the previous value depending on
+    `fill`. Rows are returned unchanged if that would exceed
+    CHART_MAX_BUCKETS.
+    """
+    step = TIME_BUCKETS[bucket][1]
+    values = {row['_id']: row.get('value') for row in rows if row.get('_id')}
+    keys = sorted(values)
+    if not keys and start is None:
+        return rows
+    first = floor_to_bucket(start, bucket) if start else parse_timestamp(keys[0])
+    if end:
+        last = floor_to_bucket(end - timedelta(microseconds=1), bucket)
+    else:
+        last = floor_to_bucket(datetime.utcnow(), bucket) if start else parse_timestamp(keys[-1])
+    if keys:
+        first = min(first, parse_timestamp(keys[0]))
+        last = max(last, parse_timestamp(keys[-1]))
+    if (last - first) // step + 1 > CHART_MAX_BUCKETS:
+        return rows
+    
+    filled = []
+    previous = None
+    current = first
+    while current <= last:
+        key = current.strftime(BUCKET_KEY_FORMAT)
+        if key in values:
+            value = previous = values[key]
+        elif fill == 'zero':
+            value = 0
+        elif fill == 'previous':
+            value = previous
+        else:
+            value = None
+        filled.append({'_id': key, 'value': value})
+        current += step
+    return filled
+
+def is_series_chart(chart):
+    """Line and time-bucketed charts show every point in key order, not a top 20"""
+    return chart.get('type') == 'line' or get_time_bucket(chart) is not None
+
+def get_target_points(chart):
+    """Points a series chart is reduced to: config.max_points, else the default"""
+    try:
+        points = int((chart.get('config') or {}).get('max_points') or CHART_DEFAULT_POINTS)
+    except (TypeError, ValueError):
+        points = CHART_DEFAULT_POINTS
+    return max(points, 3)
+
+def downsample_rows(chart, rows):
+    """Reduces a series to its target resolution with config.downsample (lttb or minmax)"""
+    target = get_target_points(chart)
+    method = (chart.get('config') or {}).get('downsample', 'lttb')
+    if method not in DOWNSAMPLE_METHODS or len(rows) <= target:
+        return rows
+    keep = downsample([row.get('_id') for row in rows], [row.get('value') for row in rows], target, method)
+    return [rows[i] for i in keep]
+
+def aggregate_expression(agg_type, measure_field):
+    """$group accumulator for a chart aggregate"""
+    if agg_type == 'sum':
+        return {'$sum': measure_field}
+    if agg_type == 'avg':
+        return {'$avg': measure_field}
+    if agg_type == 'count':
+        return {'$sum': 1}
+    if agg_type == 'min':
+        return {'$min': measure_field}
+    if agg_type == 'max':
+        return {'$max': measure_field}
+    # 'none' or any other value: the first value, after a sort on _id
+    return {'$first': measure_field}
+
+def get_sample_size(chart):
+    """
+    Sample size a chart opted into with config.sample, or None for exact
+    results. Time-bucketed charts are always exact, since per-bucket sample
+    totals can't be scaled without a population per bucket.
+    """
+    if get_time_bucket(chart):
+        return None
+    try:
+        size = int((chart.get('config') or {}).get('sample') or 0)
+    except (TypeError, ValueError):
+        return None
+    return min(size, CHART_SAMPLE_MAX_SIZE) if size > 0 else None
+
+def apply_sample_estimates(rows, aggregate, sample_size, population):
+    """
+    Scales grouped results computed over a $sample of `sample_size` rows to
+    the `population` of the source and adds a 95% margin of error to each
+    row. sum and count are scaled by population / sample; avg is unbiased
+    as is; min and max are only bounds and get no margin.
+    """
+    n = min(sample_size, population)
+    if not n:
+        return rows
+    # Finite population correction
+    fpc = math.sqrt((population - n) / (population - 1)) if population > 1 else 0.0
+    estimated = []
+    for row in rows:
+        group_rows = row.get('n') or 0
+        stddev = row.get('stddev') or 0.0
+        mean = row.get('mean') or 0.0
+        margin = None
+        value = row.get('value')
+        if aggregate == 'count':
+            p = group_rows / n
+            value = population * p
+            margin = SAMPLE_Z * population * math.sqrt(p * (1 - p) / n) * fpc
+        elif aggregate == 'sum' and value is not None:
+            # Sum estimator over z_i = x_i for rows in the group, 0 elsewhere
+            sum_squares = (group_rows - 1) * stddev ** 2 + group_rows * mean ** 2
+            variance = max(sum_squares / n - (value / n) ** 2, 0.0)
+            value = population * value / n
+            margin = SAMPLE_Z * population * math.sqrt(variance / n) * fpc
+        elif aggregate == 'avg' and group_rows:
+            margin = SAMPLE_Z * stddev / math.sqrt(group_rows) * fpc
+        estimated.append({'_id': row['_id'], 'value': value, 'margin': margin})
+    return estimated
+
+def is_document_too_large(error):
+    return getattr(error, 'code', None) in (10334, 17419) or 'too large' in str(error).lower()
+
 @dashboard_ns.route('/<dashboard_id>/data')
 class DashboardData(Resource):
     @jwt_required()
     def get(self, dashboard_id):
-        """Get data for all charts in a dashboard"""
+        """Get data for all charts in a dashboard, or only those named in ?charts="""
         try:
             print(f"GET /dashboard/{dashboard_id}/data - Fetching chart data")
             db = get_db()
@@ -211,89 +597,338 @@ class DashboardData(Resource):
                 print("Dashboard not found")
                 return {'message': 'Dashboard not found'}, 404
             
-            print(f"Found dashboard with {len(dashboard.get('charts', []))} charts")
-            charts_data = {}
-            for chart in dashboard.get('charts', []):
-                print(f"Processing chart: {chart.get('title')}")
-                # Query data based on chart configuration
-                pipeline = self._build_aggregation_pipeline(chart)
-                print(f"Aggregation pipeline: {pipeline}")
-                data = list(db.raw_data.aggregate(pipeline))
-                print(f"Raw data count: {len(data)}")
-                
-                # Transform data for chart visualization
-                transformed_data = self._transform_data_for_chart(chart, data)
-                print(f"Transformed data: {transformed_data}")
-                
-                charts_data[chart['title']] = {
-                    'type': chart['type'],
-                    'data': transformed_data
-                }
+            charts = dashboard.get('charts', [])
+            requested = request.args.get('charts')
+            if requested:
+                titles = {title.strip() for title in requested.split(',') if title.strip()}
+                charts = [chart for chart in charts if chart.get('title') in titles]
+            
+            # Request-wide overrides: a time range for every chart, and
+            # interactive previews approximated from a random sample
+            overrides = {key: request.args[key] for key in ('range', 'from', 'to') if request.args.get(key)}
+            sample = request.args.get('sample', type=int)
+            if sample and sample > 0:
+                overrides['sample'] = sample
+            # Series resolution, e.g. one point per pixel of the chart's width
+            points = request.args.get('points', type=int) or request.args.get('width', type=int)
+            if points and points > 0:
+                overrides['max_points'] = points
+            if overrides:
+                charts = [
+                    dict(chart, config=dict(chart['config'], **overrides)) if 'config' in chart else chart
+                    for chart in charts
+                ]
+                if not has_valid_time_range({'config': overrides}):
+                    return {'message': 'Invalid time range'}, 400
+            
+            sources = get_source_states(db, [chart.get('data_source') for chart in charts])
+            if any(get_sample_size(chart) for chart in charts):
+                # Samples differ on every run
+                headers = no_store_headers()
+            else:
+                etag, last_modified = self._get_validators(dashboard, charts, sources)
+                headers = cache_headers(etag, last_modified)
+                if is_not_modified(etag, last_modified):
+                    print("Chart data not modified")
+                    return not_modified(headers)
+            
+            print(f"Found dashboard with {len(charts)} charts to evaluate")
+            versions = {name: state['version'] for name, state in sources.items()}
+            charts_data = self._evaluate_charts(db, charts, versions)
             
+            partial = any(chart_data.get('partial') for chart_data in charts_data.values())
+            if partial:
+                # Don't let a later revalidation pin charts that timed out
+                headers = no_store_headers()
+            headers['X-Partial-Content'] = 'true' if partial else 'false'
             print("Returning charts data")
-            return charts_data
+            return charts_data, 200, headers
         except Exception as e:
             print(f"Error in GET /dashboard/{dashboard_id}/data: {str(e)}")
             return {'message': f'Error fetching dashboard data: {str(e)}'}, 500
     
+    def _get_validators(self, dashboard, charts, sources):
+        """
+        Returns the (ETag, Last-Modified) of the chart data, derived from its
+        inputs so that a match skips every aggregation: the dashboard's
+        updated_at, the effective chart configs and pipelines (relative
+        ranges resolve to a floored start) and the version of each source.
+        Time-bucketed charts without an end gain buckets as time passes, so
+        the current bucket is part of the tag, and dashboards with relative
+        or open ranges have no Last-Modified.
+        """
+        now = datetime.utcnow()
+        open_buckets = [
+            floor_to_bucket(now, get_time_bucket(chart))
+            if get_time_bucket(chart) and not chart['config'].get('to') else None
+            for chart in charts
+        ]
+        etag = make_etag(
+            'dashboard-data',
+            str(dashboard['_id']),
+            dashboard['updated_at'],
+            charts,
+            [self._build_aggregation_pipeline(chart) if has_valid_time_range(chart) else None for chart in charts],
+            {name: state['version'] for name, state in sources.items()},
+            open_buckets
+        )
+        relative = any(parse_range((chart.get('config') or {}).get('range')) for chart in charts)
+        if relative or any(open_buckets):
+            return etag, None
+        stamps = [state['updated_at'] for state in sources.values() if state['updated_at']]
+        return etag, max([dashboard['updated_at']] + stamps)
+    
+    def _evaluate_charts(self, db, charts, versions=None):
+        """
+        Plans the chart queries (one $facet aggregation per shared data
+        source where possible) and runs them concurrently on the shared
+        query pool. Charts that miss the dashboard deadline, fail or have
+        an invalid time range are returned empty and marked partial instead
+        of failing the dashboard.
+        """
+        deadline_ms = current_app.config.get('DASHBOARD_DEADLINE_MS', 10000)
+        deadline = time.monotonic() + deadline_ms / 1000.0
+        
+        # Charts with a ready rollup are answered from it in O(groups)
+        results = read_rollups(db, charts)
+        for index, chart in enumerate(charts):
+            if index not in results and not has_valid_time_range(chart):
+                # Saved before time ranges were validated; fails only this chart
+                results[index] = 'invalid'
+        
+        # Serve what we can from the result cache; keys include the source
+        # version, which ingestion bumps whenever the underlying rows change
+        if versions is None:
+            versions = get_source_versions(db, [chart.get('data_source') for chart in charts])
+        cache_keys = {}
+        pending = []
+        for index, chart in enumerate(charts):
+            if index in results:
+                continue
+            if get_sample_size(chart):
+                # Samples differ on every run, so they are never cached
+                pending.append(index)
+                continue
+            cache_keys[index] = chart_cache.make_key(
+                chart.get('data_source'),
+                self._build_aggregation_pipeline(chart),
+                versions.get(chart.get('data_source'), 0)
+            )
+            cached = chart_cache.get(db, cache_keys[index])
+            if cached is not None:
+                results[index] = cached
+            else:
+                pending.append(index)
+        
+        tasks = plan_chart_queries(charts, self._build_aggregation_pipeline, get_raw_doc_size(db), indexes=pending) if pending else []
+        print(f"Planned {len(tasks)} queries for {len(pending)} of {len(charts)} charts")
+        executor = get_query_executor()
+        futures = [executor.submit(self._run_task, db, task, deadline) for task in tasks]
+        wait(futures, timeout=max(deadline - time.monotonic(), 0))
+        
+        for task, future in zip(tasks, futures):
+            if future.done() and future.exception() is None:
+                for index, rows in future.result().items():
+                    results[index] = rows
+                    if index in cache_keys and len(rows) <= CHART_CACHE_MAX_ROWS:
+                        chart_cache.set(db, cache_keys[index], rows)
+                continue
+            if future.done():
+                print(f"Error evaluating charts {task['charts']}: {str(future.exception())}")
+                status = 'error'
+            else:
+                future.cancel()
+                print(f"Charts {task['charts']} missed the {deadline_ms}ms deadline")
+                status = 'timeout'
+            for index in task['charts']:
+                results[index] = status
+        
+        samples = self._estimate_sampled_charts(db, charts, results)
+        
+        charts_data = {}
+        for index, chart in enumerate(charts):
+            data = results.get(index, 'error')
+            if isinstance(data, str):
+                charts_data[chart['title']] = {
+                    'type': chart['type'],
+                    'data': empty_chart_data(chart),
+                    'partial': True,
+                    'status': data
+                }
+            else:
+                bucket = get_time_bucket(chart)
+                if bucket:
+                    start, end = get_time_range(chart)
+                    aggregate = chart['config'].get('aggregate', 'none')
+                    fill = chart['config'].get('fill', 'zero' if aggregate in ('sum', 'count') else 'null')
+                    data = fill_time_gaps(data, bucket, start, end, fill)
+                if is_series_chart(chart):
+                    data = downsample_rows(chart, data)
+                charts_data[chart['title']] = {
+                    'type': chart['type'],
+                    'data': self._transform_data_for_chart(chart, data)
+                }
+                if index in samples:
+                    charts_data[chart['title']]['sample'] = samples[index]
+        return charts_data
+    
+    def _estimate_sampled_charts(self, db, charts, results):
+        """
+        Turns the grouped results of sampled charts into population estimates
+        in place and returns {chart index: sample description} with the
+        margin of error of each value, in label order.
+        """
+        sampled = {
+            index: get_sample_size(chart) for index, chart in enumerate(charts)
+            if get_sample_size(chart) and isinstance(results.get(index), list)
+            and 'group_by' in chart['config'] and 'measure' in chart['config']
+        }
+        populations = {}
+        samples = {}
+        for index, sample_size in sampled.items():
+            chart = charts[index]
+            # The sample is drawn from the rows of the chart's $match,
+            # including its time range, so that is the population
+            match = self._build_aggregation_pipeline(chart)[0]['$match']
+            key = dumps(match)
+            if key not in populations:
+                populations[key] = db.raw_data.count_documents(match)
+            population = populations[key]
+            aggregate = chart['config'].get('aggregate', 'none')
+            rows = apply_sample_estimates(results[index], aggregate, sample_size, population)
+            results[index] = rows
+            samples[index] = {
+                'size': min(sample_size, population),
+                'population': population,
+                'confidence': 0.95,
+                'margin_of_error': [row.get('margin') for row in rows]
+            }
+        return samples
+    
+    def _run_task(self, db, task, deadline):
+        """Runs one planned query and returns {chart index: rows}"""
+        if task['facet']:
+            try:
+                facets = self._aggregate(db, build_facet_pipeline(task), deadline)
+                facets = facets[0] if facets else {}
+                return {index: facets.get(str(index), []) for index in task['charts']}
+            except OperationFailure as e:
+                if not is_document_too_large(e):
+                    raise
+                print(f"Facet output too large, falling back to per-chart queries: {str(e)}")
+        return {
+            index: self._aggregate(db, task['pipelines'][index], deadline)
+            for index in task['charts']
+        }
+    
+    def _aggregate(self, db, pipeline, deadline):
+        """
+        Runs an aggregation within what is left of the deadline, and never
+        longer than the per-query budget. Large groups and sorts may spill
+        to disk rather than fail.
+        """
+        remaining_ms = int((deadline - time.monotonic()) * 1000)
+        if remaining_ms <= 0:
+            raise TimeoutError('Dashboard deadline exceeded')
+        max_time_ms = min(remaining_ms, CHART_QUERY_MAX_TIME_MS)
+        return list(db.raw_data.aggregate(pipeline, maxTimeMS=max_time_ms, allowDiskUse=True))
+    
     def _build_aggregation_pipeline(self, chart):
-        """Build MongoDB aggregation pipeline based on chart configuration"""
+        """
+        Build MongoDB aggregation pipeline based on chart configuration.
+        
+        Aggregates run over every row of the source; the $match on
+        data_source and the optional time range is served by the
+        (data_source, timestamp) index. Charts with config.time_bucket group
+        on the record timestamp instead of a data field. A chart may opt into
+        a random preview with config.sample, which adds a $sample stage and
+        the per-group statistics needed for error bars. Ties are broken on
+        _id so results never depend on document order.
+        """
         pipeline = []
         
         # Add initial match stage
         match_stage = {'$match': {'data_source': chart['data_source']}}
+        start, end = get_time_range(chart)
+        if start or end:
+            match_stage['$match']['timestamp'] = {}
+            if start:
+                match_stage['$match']['timestamp']['$gte'] = start
+            if end:
+                match_stage['$match']['timestamp']['$lt'] = end
         pipeline.append(match_stage)
         
-        # Apply early limit to reduce memory usage
-        pipeline.append({'$limit': 1000})  # Hard limit to prevent memory issues
-        
         if 'config' in chart:
             config = chart['config']
+            sample_size = get_sample_size(chart)
+            if sample_size:
+                pipeline.append({'$sample': {'size': sample_size}})
             
-            # Project only needed fields to reduce memory usage
+            agg_type = config.get('aggregate', 'none')
+            bucket = get_time_bucket(chart)
+            if bucket and (config.get('measure') or agg_type == 'count'):
+                # Time series: one point per bucket, in time order
+                project_stage = {'$project': {'timestamp': 1}}
+                if config.get('measure'):
+                    project_stage['$project'][f"data.{config['measure']}"] = 1
+                pipeline.append(project_stage)
+                if agg_type not in ('sum', 'avg', 'count', 'min', 'max'):
+                    pipeline.append({'$sort': {'_id': 1}})
+                pipeline.append({
+                    '$group': {
+                        '_id': {'$dateToString': {'format': TIME_BUCKETS[bucket][0], 'date': '$timestamp'}},
+                        'value': aggregate_expression(agg_type, f"$data.{config.get('measure')}")
+                    }
+                })
+                # Keep the most recent buckets, returned oldest first
+                pipeline.append({'$sort': {'_id': -1}})
+                pipeline.append({'$limit': CHART_MAX_BUCKETS})
+                pipeline.append({'$sort': {'_id': 1}})
+                print(f"Generated pipeline for chart {chart.get('title')}: {pipeline}")
+                return pipeline
+            
+            # Project only the fields the chart reads
+            fields_needed = [config[key] for key in ('group_by', 'measure') if config.get(key)]
             project_stage = {
-                '$project': {
-                    'data': 1
-                }
+                '$project': {f'data.{field}': 1 for field in fields_needed} or {'data': 1}
             }
             pipeline.append(project_stage)
             
             # Group by specified field and calculate aggregates
             if 'group_by' in config and 'measure' in config:
+                measure_field = f"$data.{config['measure']}"
+                if agg_type not in ('sum', 'avg', 'count', 'min', 'max'):
+                    # For no aggregation, use the earliest inserted value in each group
+                    pipeline.append({'$sort': {'_id': 1}})
                 group_stage = {
                     '$group': {
-                        '_id': f"$data.{config['group_by']}"
+                        '_id': f"$data.{config['group_by']}",
+                        'value': aggregate_expression(agg_type, measure_field)
                     }
                 }
                 
-                # Add aggregation based on specified type
-                agg_type = config.get('aggregate', 'none')
-                measure_field = f"$data.{config['measure']}"
-                
-                if agg_type == 'sum':
-                    group_stage['$group']['value'] = {'$sum': measure_field}
-                elif agg_type == 'avg':
-                    group_stage['$group']['value'] = {'$avg': measure_field}
-                elif agg_type == 'count':
-                    group_stage['$group']['value'] = {'$sum': 1}
-                elif agg_type == 'min':
-                    group_stage['$group']['value'] = {'$min': measure_field}
-                elif agg_type == 'max':
-                    group_stage['$group']['value'] = {'$max': measure_field}
-                else:  # 'none' or any other value
-                    # For no aggregation, just use the first value in each group
-                    group_stage['$group']['value'] = {'$first': measure_field}
+                if sample_size:
+                    group_stage['$group']['n'] = {'$sum': 1}
+                    group_stage['$group']['mean'] = {'$avg': measure_field}
+                    group_stage['$group']['stddev'] = {'$stdDevSamp': measure_field}
                 
                 pipeline.append(group_stage)
                 
-                # Add sort after group
-                sort_stage = {'$sort': {'value': -1}}  # Sort by value descending
-                pipeline.append(sort_stage)
-                
-                # Limit grouped results
-                pipeline.append({'$limit': 20})  # Show top 20 results
+                if is_series_chart(chart):
+                    # Line charts plot every group in key order; they are
+                    # downsampled after the query
+                    pipeline.append({'$sort': {'_id': 1}})
+                    pipeline.append({'$limit': CHART_MAX_SERIES_POINTS})
+                else:
+                    # Sort by value descending, then group key for equal values
+                    sort_stage = {'$sort': {'value': -1, '_id': 1}}
+                    pipeline.append(sort_stage)
+                    
+                    # Limit grouped results
+                    pipeline.append({'$limit': 20})  # Show top 20 results
             else:
-                # If no grouping specified, return raw data with limits
+                # If no grouping specified, return the first rows in insertion order
+                pipeline.append({'$sort': {'_id': 1}})
                 pipeline.append({'$limit': 100})
         
         print(f"Generated pipeline for chart {chart.get('title')}: {pipeline}")
@@ -330,25 +965,8 @@ class DashboardData(Resource):
                         }]
                     }
                 
-                # Group and aggregate the data
-                grouped_data = {}
-                for item in data:
-                    if not isinstance(item, dict):
-                        continue
-                    key = str(item.get(x_field, ''))
-                    try:
-                        value = float(item.get(y_field, 0))
-                    except (TypeError, ValueError):
-                        value = 0
-                    if key in grouped_data:
-                        grouped_data[key] += value
-                    else:
-                        grouped_data[key] = value
-                
-                # Sort by value and limit to top 20
-                sorted_data = sorted(grouped_data.items(), key=lambda x: x[1], reverse=True)[:20]
-                labels = [item[0] for item in sorted_data]
-                values = [item[1] for item in sorted_data]
+                # Group, sum and take the top 20 by value, ties by label
+                labels, values = top_group_totals(data, x_field, y_field, k=20)
             else:
                 # Handle pre-aggregated data
                 labels = []
@@ -357,6 +975,10 @@ class DashboardData(Resource):
                     if not isinstance(item, dict):
                         continue
                     labels.append(str(item.get('_id', '')))
+                    if item.get('value') is None and get_time_bucket(chart):
+                        # Empty time bucket: leave a gap in the line
+                        values.append(None)
+                        continue
                     try:
                         value = float(item.get('value', 0))
                     except (TypeError, ValueError):
@@ -391,7 +1013,11 @@ class DashboardData(Resource):
             }
     
     def _get_chart_colors(self, count):
-        """Generate chart colors based on the number of data points"""
+        """
+        Generate the chart palette for `count` data points. Chart.js wraps
+        indexable color options around, so each color is sent once rather
+        than once per point.
+        """
         base_colors = [
             {'r': 255, 'g': 99, 'b': 132},
             {'r': 54, 'g': 162, 'b': 235},
@@ -405,13 +1031,184 @@ class DashboardData(Resource):
             'border': []
         }
         
-        for i in range(count):
-            color = base_colors[i % len(base_colors)]
+        for color in base_colors[:count]:
             colors['background'].append(f"rgba({color['r']}, {color['g']}, {color['b']}, 0.5)")
             colors['border'].append(f"rgba({color['r']}, {color['g']}, {color['b']}, 1)")
         
         return colors 
 
+def format_event(event, data, event_id=None):
+    """One Server-Sent Events message with a JSON data line"""
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines.append(f'event: {event}')
+    lines.append('data: ' + dumps(data).decode('utf-8'))
+    return '\n'.join(lines) + '\n\n'
+
+def encode_versions(versions):
+    """Event id carrying the source versions a client has seen"""
+    return urlencode(sorted(versions.items()))
+
+def parse_versions(value):
+    try:
+        return {name: int(version) for name, version in parse_qsl(value or '')}
+    except ValueError:
+        return {}
+
+def parse_dashboard_ids(values):
+    """ObjectIds of a list of dashboard ids, or None if it isn't one"""
+    if not isinstance(values, list):
+        return None
+    try:
+        return [ObjectId(dashboard_id) for dashboard_id in dict.fromkeys(values)]
+    except (InvalidId, TypeError):
+        return None
+
+STREAM_TOKEN_AUDIENCE = 'dashboard-events'
+
+def stream_token_key():
+    """
+    Signing key of stream tokens. It differs from JWT_SECRET_KEY, so a
+    stream token is never accepted as a login token, or the other way round.
+    """
+    secret = current_app.config['JWT_SECRET_KEY'].encode('utf-8')
+    return hmac.new(secret, STREAM_TOKEN_AUDIENCE.encode('utf-8'), hashlib.sha256).hexdigest()
+
+def create_stream_token(user_id, dashboard_ids):
+    """Short-lived token for the live update stream of the given dashboards"""
+    now = datetime.now(timezone.utc)
+    claims = {
+        'sub': user_id,
+        'aud': STREAM_TOKEN_AUDIENCE,
+        'dashboards': [str(dashboard_id) for dashboard_id in dashboard_ids],
+        'iat': now,
+        'exp': now + timedelta(seconds=current_app.config.get('SSE_TOKEN_SECONDS', 60))
+    }
+    return jwt.encode(claims, stream_token_key(), algorithm='HS256')
+
+def read_stream_token(token):
+    """Returns (user id, dashboard ids) of a valid stream token, or None"""
+    try:
+        claims = jwt.decode(
+            token or '',
+            stream_token_key(),
+            algorithms=['HS256'],
+            audience=STREAM_TOKEN_AUDIENCE
+        )
+        return ObjectId(claims['sub']), [ObjectId(dashboard_id) for dashboard_id in claims['dashboards']]
+    except (jwt.InvalidTokenError, InvalidId, KeyError, TypeError):
+        return None
+
+def find_user_dashboards(db, user, dashboard_ids):
+    """The user's organization's dashboards with the given ids, or None unless all exist"""
+    dashboards = list(db.dashboards.find({
+        '_id': {'$in': dashboard_ids},
+        'organization': user['organization']
+    }))
+    return dashboards if len(dashboards) == len(dashboard_ids) else None
+
+@dashboard_ns.route('/events/token')
+class DashboardEventsToken(Resource):
+    @jwt_required()
+    def post(self):
+        """
+        Issues a stream token for the dashboards in {"dashboards": [id, ...]}.
+        EventSource can't set headers, so /dashboard/events takes this token
+        in its query string instead of the login token.
+        """
+        db = get_db()
+        user = db.users.find_one({'_id': ObjectId(get_jwt_identity())})
+        if not user:
+            return {'message': 'User not found'}, 404
+        dashboard_ids = parse_dashboard_ids((request.get_json(silent=True) or {}).get('dashboards'))
+        if not dashboard_ids:
+            return {'message': 'dashboards must list one or more dashboard ids'}, 400
+        if len(dashboard_ids) > current_app.config.get('SSE_MAX_DASHBOARDS', 50):
+            return {'message': 'Too many dashboards for one stream'}, 400
+        if find_user_dashboards(db, user, dashboard_ids) is None:
+            return {'message': 'Dashboard not found'}, 404
+        return {
+            'token': create_stream_token(str(user['_id']), dashboard_ids),
+            'expires_in': current_app.config.get('SSE_TOKEN_SECONDS', 60)
+        }
+
+@dashboard_ns.route('/events')
+class DashboardEvents(Resource):
+    def get(self):
+        """
+        Server-Sent Events stream of chart updates for the dashboards of the
+        stream token in ?token= (see /dashboard/events/token), so a page
+        holds one connection however many dashboards it shows. When
+        ingestion changes a data source, a `charts` event per affected
+        dashboard carries the data of only the charts on that source. The id
+        of the last event of a batch holds the source versions, so an
+        EventSource reconnecting with Last-Event-ID is sent what it missed.
+        """
+        scope = read_stream_token(request.args.get('token'))
+        if scope is None:
+            return {'message': 'Invalid or expired stream token'}, 401
+        user_id, dashboard_ids = scope
+        db = get_db()
+        user = db.users.find_one({'_id': user_id})
+        if not user:
+            return {'message': 'User not found'}, 404
+        dashboards = find_user_dashboards(db, user, dashboard_ids)
+        if dashboards is None:
+            return {'message': 'Dashboard not found'}, 404
+        
+        names = {
+            chart.get('data_source')
+            for dashboard in dashboards for chart in dashboard.get('charts', [])
+            if chart.get('data_source')
+        }
+        known = parse_versions(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+        subscription = live_updates.subscribe(db, names, known)
+        heartbeat = current_app.config.get('SSE_HEARTBEAT_SECONDS', 15)
+        retry_ms = current_app.config.get('SSE_RETRY_MS', 5000)
+        
+        def stream():
+            watched = list(dashboard_ids)
+            try:
+                yield f'retry: {retry_ms}\n\n'
+                while watched:
+                    changed = subscription.wait(heartbeat)
+                    if not changed:
+                        # Keeps proxies from closing idle streams
+                        yield ': keepalive\n\n'
+                        continue
+                    current = {dashboard['_id']: dashboard for dashboard in db.dashboards.find({'_id': {'$in': watched}})}
+                    events = []
+                    for dashboard_id in list(watched):
+                        if dashboard_id not in current:
+                            watched.remove(dashboard_id)
+                            events.append(('deleted', {'dashboard_id': str(dashboard_id)}))
+                            continue
+                        charts = [
+                            chart for chart in current[dashboard_id].get('charts', [])
+                            if chart.get('data_source') in changed
+                        ]
+                        if not charts:
+                            continue
+                        try:
+                            charts_data = DashboardData()._evaluate_charts(db, charts, dict(subscription.known))
+                        except Exception as e:
+                            print(f"Error evaluating live update for dashboard {dashboard_id}: {str(e)}")
+                            events.append(('error', {'dashboard_id': str(dashboard_id), 'message': 'Error fetching chart data'}))
+                            continue
+                        events.append(('charts', {'dashboard_id': str(dashboard_id), 'versions': changed, 'charts': charts_data}))
+                    # Only the last event moves Last-Event-ID, so a stream
+                    # dropped mid-batch resends the whole batch
+                    for index, (event, data) in enumerate(events):
+                        last = index == len(events) - 1
+                        yield format_event(event, data, encode_versions(subscription.known) if last else None)
+            finally:
+                subscription.close()
+        
+        return Response(
+            stream_with_context(stream()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+
 @dashboard_ns.route('/<dashboard_id>/chart/<chart_title>')
 class DashboardChart(Resource):
     @jwt_required()
@@ -469,6 +1266,7 @@ class DashboardChart(Resource):
                 )
                 if result.modified_count == 0:
                     return {'message': 'Chart not found'}, 404
+            prune_rollups(db, [chart for chart in dashboard.get('charts', []) if chart.get('title') == chart_title])
             
             response = make_response({'message': 'Chart deleted successfully'})
             response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
@@ -479,22 +1277,168 @@ class DashboardChart(Resource):
             print(f"Error deleting chart: {str(e)}")
             return {'message': f'Error deleting chart: {str(e)}'}, 500 
 
+@dashboard_ns.route('/<dashboard_id>/chart/<chart_title>/public')
+class DashboardChartPublic(Resource):
+    @jwt_required()
+    def put(self, dashboard_id, chart_title):
+        """Publishes a chart, so its embed id serves it to anyone"""
+        return self._set_public(dashboard_id, chart_title, True)
+
+    @jwt_required()
+    def delete(self, dashboard_id, chart_title):
+        """
+        Unpublishes a chart. Copies already cached by workers, browsers or a
+        CDN are served until they expire.
+        """
+        return self._set_public(dashboard_id, chart_title, False)
+
+    def _set_public(self, dashboard_id, chart_title, public):
+        db = get_db()
+        user = db.users.find_one({'_id': ObjectId(get_jwt_identity())})
+        if not user:
+            return {'message': 'User not found'}, 404
+        try:
+            dashboard_id = ObjectId(dashboard_id)
+        except InvalidId:
+            return {'message': 'Dashboard not found'}, 404
+        result = db.dashboards.update_one(
+            {
+                '_id': dashboard_id,
+                'organization': user['organization'],
+                'charts.title': chart_title
+            },
+            {
+                '$set': {
+                    'charts.$.config.public': public,
+                    'updated_at': datetime.utcnow()
+                }
+            }
+        )
+        if result.matched_count == 0:
+            return {'message': 'Chart not found'}, 404
+        return {'title': chart_title, 'public': public}
+
+# Browser and CDN lifetime of a public chart, and how much longer a stale
+# copy may be served while it is revalidated (or while the backend is down)
+PUBLIC_CHART_MAX_AGE = int(os.getenv('PUBLIC_CHART_MAX_AGE', '300'))
+PUBLIC_CHART_STALE_SECONDS = int(os.getenv('PUBLIC_CHART_STALE_SECONDS', '86400'))
+
+def parse_embed_id(chart_id):
+    """
+    Decodes an embed id from the embed dialog: base64 of JSON
+    {"d": dashboard id, "c": chart title}. URL-safe base64 is accepted too.
+    Returns (dashboard id, title) or None.
+    """
+    try:
+        info = json.loads(base64.b64decode(chart_id + '=' * (-len(chart_id) % 4), altchars=b'-_'))
+        return ObjectId(info['d']), info['c']
+    except (binascii.Error, ValueError, TypeError, KeyError, InvalidId):
+        return None
+
+def is_public_chart(chart):
+    """True for a chart published from the embed dialog"""
+    return bool((chart.get('config') or {}).get('public'))
+
+def build_public_snapshot(db, chart_id, previous=None):
+    """
+    Returns the snapshot of a public chart: {'version', 'source', 'chart'}
+    plus 'partial' if it could not be evaluated in time. Embed ids resolve
+    only to charts with config.public set. `previous` is
+    returned as is while its version matches; otherwise the snapshot
+    stored in chart_snapshots is reused, or the chart is evaluated and the
+    result stored for every worker.
+    """
+    doc = db.public_charts.find_one({'_id': chart_id})
+    if doc:
+        # Published documents are served as stored
+        version = make_etag('public-chart', doc)
+        if previous and previous['version'] == version:
+            return previous
+        return {'version': version, 'source': doc.get('data_source'), 'chart': doc}
+    
+    embed = parse_embed_id(chart_id)
+    if embed is None:
+        return None
+    dashboard = db.dashboards.find_one({'_id': embed[0]})
+    chart = next((chart for chart in (dashboard or {}).get('charts', []) if chart.get('title') == embed[1]), None)
+    if not chart or not is_public_chart(chart):
+        # Embed ids are guessable; only published charts are served
+        return None
+    
+    source = chart.get('data_source')
+    resource = DashboardData()
+    # The same inputs the dashboard data ETag is built from
+    version, _ = resource._get_validators(dashboard, [chart], get_source_states(db, [source]))
+    if previous and previous['version'] == version:
+        return previous
+    stored = db.chart_snapshots.find_one({'_id': chart_id})
+    if stored and stored['version'] == version:
+        return stored
+    
+    chart_data = resource._evaluate_charts(db, [chart])[chart['title']]
+    snapshot = {
+        '_id': chart_id,
+        'version': version,
+        'source': source,
+        'generated_at': datetime.utcnow(),
+        'chart': {
+            'id': chart_id,
+            'title': chart['title'],
+            'type': chart['type'],
+            'data': chart_data['data']
+        }
+    }
+    if chart_data.get('partial'):
+        if previous:
+            # Keep the last complete snapshot rather than publishing a gap
+            return previous
+        snapshot['partial'] = True
+        return snapshot
+    db.chart_snapshots.replace_one({'_id': chart_id}, snapshot, upsert=True)
+    return snapshot
+
+def public_chart_headers(snapshot):
+    headers = {
+        'Access-Control-Allow-Origin': '*',
+        'Cache-Control': 'no-store'
+    }
+    if not snapshot.get('partial'):
+        headers['ETag'] = quote_etag(snapshot['version'])
+        headers['Cache-Control'] = (
+            f'public, max-age={PUBLIC_CHART_MAX_AGE}, '
+            f'stale-while-revalidate={PUBLIC_CHART_STALE_SECONDS}, '
+            f'stale-if-error={PUBLIC_CHART_STALE_SECONDS}'
+        )
+    return headers
+
 @dashboard_ns.route('/public/chart/<chart_id>')
 class PublicChart(Resource):
     def get(self, chart_id):
-        """Get a public chart by ID"""
-        db = get_db()
-        chart = db.public_charts.find_one({'_id': chart_id})
+        """
+        Get a public chart by ID. Charts are served from versioned
+        snapshots, cached in-process with stale-while-revalidate, and
+        are cacheable by nginx or a CDN.
+        """
+        app = current_app._get_current_object()
         
-        if not chart:
-            return {'message': 'Chart not found'}, 404
-            
-        return chart
+        def load(previous):
+            # Background refreshes run outside the request
+            with app.app_context():
+                return build_public_snapshot(get_db(), chart_id, previous)
+        
+        snapshot = public_snapshots.get(chart_id, load)
+        if not snapshot:
+            return {'message': 'Chart not found'}, 404, {'Access-Control-Allow-Origin': '*'}
+        
+        headers = public_chart_headers(snapshot)
+        if 'ETag' in headers and is_not_modified(snapshot['version']):
+            return not_modified(headers)
+        return snapshot['chart'], 200, headers
 
     def options(self, chart_id):
         """Handle preflight request"""
         response = make_response()
         response.headers['Access-Control-Allow-Origin'] = '*'
         response.headers['Access-Control-Allow-Methods'] = 'GET, OPTIONS'
-        response.headers['Access-Control-Allow-Headers'] = 'DNT,User-Agent,X-Requested-With,If-Modified-Since,Cache-Control,Content-Type,Range'
+        response.headers['Access-Control-Allow-Headers'] = 'DNT,User-Agent,X-Requested-With,If-Modified-Since,If-None-Match,Cache-Control,Content-Type,Range'
         return response 
\ No newline at end of file
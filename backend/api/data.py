@@ -1,14 +1,30 @@
 from flask_restx import Namespace, Resource, fields
-from flask import request, current_app, make_response
+from flask import request, current_app, make_response, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.utils import secure_filename
-from kafka import KafkaProducer
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from concurrent.futures import wait
 import pandas as pd
 import json
 import os
 from datetime import datetime
 from models.db import get_db
+from services.auth_cache import lookup_api_key
+from services.write_behind import record_api_key_use
+from services.ingest import ingest_csv, discard_partial_ingest
+from services.jobs import job_runner, create_job, update_job, describe_job
+from services.source_versions import bump_source_versions, get_source_versions
+from services.http_cache import make_etag, cache_headers, is_not_modified, not_modified
+from services.serialization import dumps
+from services.stream_sink import INGEST_TOPIC, to_message
+from services.data_sources import get_or_create_data_sources
+from services.kafka_producer import kafka_publisher
+from services.ingest_log import ingest_log, LogFull
+from services.rollups import apply_rollups, rebuild_rollups
+from services.export import EXPORT_FORMATS, arrow_available, export_source
 from bson import ObjectId
+from bson.errors import InvalidId
 from functools import wraps
 
 data_ns = Namespace('data', description='Data ingestion operations')
@@ -28,37 +44,17 @@ def api_key_required(f):
             api_key = auth_header.split(' ')[1]
             db = get_db()
             
-            # Find active API key
-            key_data = db.api_keys.find_one({
-                'key': api_key,
-                'is_active': True
-            })
+            # Find active API key (served from the credential cache when hot)
+            key_data = lookup_api_key(db, api_key)
             
             if not key_data:
                 return {'message': 'Invalid or inactive API key'}, 401
-                
-            # Update last used timestamp
-            db.api_keys.update_one(
-                {'_id': key_data['_id']},
-                {'$set': {'last_used': datetime.utcnow()}}
-            )
             
-            # Get user information for audit log
-            user = db.users.find_one({'_id': key_data['user_id']})
-            if not user:
+            if not key_data['user_exists']:
                 return {'message': 'User not found'}, 404
-            
-            # Create audit log entry for API request
-            audit_entry = {
-                'action': f'api_request_{request.method.lower()}',
-                'action_type': 'api',
-                'performed_by': user['name'],
-                'user_id': key_data['user_id'],
-                'organization': user['organization'],
-                'timestamp': datetime.utcnow(),
-                'details': f"API request to {request.path} using API key '{key_data['name']}'"
-            }
-            db.audit_log.insert_one(audit_entry)
+                
+            # Queue last_used and the audit entry; written in batches off the hot path
+            record_api_key_use(db, key_data, request.method, request.path)
             
             # Set user_id for the request
             request.user_id = key_data['user_id']
@@ -101,38 +97,6 @@ SAMPLE_DATA = {
     }
 }
 
-# Kafka producer instance
-producer = None
-
-def get_kafka_producer():
-    global producer
-    if producer is None:
-        try:
-            producer = KafkaProducer(
-                bootstrap_servers=current_app.config['KAFKA_BOOTSTRAP_SERVERS'],
-                value_serializer=lambda v: json.dumps(v).encode('utf-8'),
-                api_version=(0, 10),
-                request_timeout_ms=5000,  # 5 second timeout
-                max_block_ms=5000,  # 5 second max block
-                acks='all',
-                retries=1,
-                retry_backoff_ms=500
-            )
-        except Exception as e:
-            print(f"Warning: Failed to create Kafka producer: {str(e)}")
-            producer = None
-    return producer
-
-def close_kafka_producer():
-    global producer
-    if producer is not None:
-        try:
-            producer.close(timeout=5)  # 5 second timeout
-            producer = None
-        except Exception as e:
-            print(f"Error closing Kafka producer: {str(e)}")
-            producer = None
-
 def get_upload_dir():
     """Get the configured upload directory, creating it if it doesn't exist."""
     upload_dir = current_app.config.get('UPLOAD_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads'))
@@ -150,6 +114,107 @@ stream_data_model = data_ns.model('StreamData', {
     'data': fields.Raw(required=True, description='JSON data to stream')
 })
 
+def upload_progress_reporter(db, data_source_id, job_id=None):
+    """Returns an ingest_csv progress callback that records progress on the
+    data source and, for background uploads, on the job"""
+    def report_progress(rows, bytes_read, bytes_total):
+        db.data_sources.update_one(
+            {'_id': data_source_id},
+            {'$set': {
+                'record_count': rows,
+                'progress': {
+                    'rows_processed': rows,
+                    'bytes_processed': bytes_read,
+                    'bytes_total': bytes_total
+                }
+            }}
+        )
+        if job_id is not None:
+            update_job(
+                db, job_id,
+                rows_processed=rows,
+                bytes_processed=bytes_read,
+                heartbeat_at=datetime.utcnow()
+            )
+    return report_progress
+
+def finish_csv_upload(db, data_source_id, user_id, filename, data_source_name, result):
+    """Marks an ingested data source ready and records the upload in the audit log"""
+    db.data_sources.update_one(
+        {'_id': data_source_id},
+        {'$set': {
+            'status': 'ready',
+            'record_count': result['records'],
+            'columns': result['columns'],
+            'numeric_columns': result['numeric_columns']
+        }}
+    )
+    bump_source_versions(db, [data_source_name])
+    
+    # Create audit log entry for data upload
+    user = db.users.find_one({'_id': user_id})
+    audit_entry = {
+        'action': 'data_uploaded',
+        'action_type': 'data',
+        'performed_by': user['name'],
+        'user_id': user_id,
+        'organization': user['organization'],
+        'timestamp': datetime.utcnow(),
+        'details': f"Uploaded file '{filename}' with {result['records']} records to data source '{data_source_name}'"
+    }
+    db.audit_log.insert_one(audit_entry)
+
+def run_upload_job(db, job_id, path, chunksize):
+    """Background ingestion of a saved CSV upload"""
+    job = db.jobs.find_one({'_id': job_id})
+    data_source_id = job['data_source_id']
+    now = datetime.utcnow()
+    update_job(db, job_id, status='running', started_at=now, heartbeat_at=now)
+    
+    error = None
+    try:
+        with open(path, 'rb') as fileobj:
+            result = ingest_csv(
+                db,
+                fileobj,
+                data_source_id,
+                job['data_source'],
+                job['user_id'],
+                chunksize=chunksize,
+                on_progress=upload_progress_reporter(db, data_source_id, job_id)
+            )
+        finish_csv_upload(db, data_source_id, job['user_id'], job['filename'], job['data_source'], result)
+    except pd.errors.EmptyDataError:
+        error = 'The uploaded file is empty'
+    except pd.errors.ParserError:
+        error = 'Error parsing file. Please ensure it is a valid CSV file'
+    except Exception as e:
+        print(f"Error processing upload job {job_id}: {str(e)}")
+        error = f'Error processing file: {str(e)}'
+    finally:
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"Error removing temporary file: {str(e)}")
+    
+    if error:
+        discard_partial_ingest(db, data_source_id)
+        update_job(db, job_id, status='failed', finished_at=datetime.utcnow(), errors=[error])
+        return
+    
+    update_job(
+        db, job_id,
+        status='completed',
+        finished_at=datetime.utcnow(),
+        rows_processed=result['records'],
+        bytes_processed=job.get('bytes_total'),
+        result={
+            'records_processed': result['records'],
+            'data_source_id': str(data_source_id),
+            'columns': result['columns']
+        }
+    )
+
 @data_ns.route('/upload')
 class FileUpload(Resource):
     def options(self):
@@ -164,8 +229,7 @@ class FileUpload(Resource):
     @jwt_required()
     @data_ns.expect(file_upload_model)
     def post(self):
-        """Upload and process a CSV file"""
-        temp_path = None
+        """Upload a CSV file. Runs as a background job unless ?async=false"""
         try:
             current_user_id = get_jwt_identity()
             db = get_db()
@@ -180,87 +244,166 @@ class FileUpload(Resource):
             if not file.filename.endswith('.csv'):
                 return {'message': 'Invalid file format. Only CSV files are allowed.'}, 400
             
-            # Save file temporarily
             filename = secure_filename(file.filename)
-            temp_path = os.path.join(get_upload_dir(), f"{datetime.utcnow().timestamp()}_{filename}")
-            file.save(temp_path)
+            
+            # Get metadata from request
+            metadata = request.form.to_dict()
+            if 'data_source' not in metadata:
+                return {'message': 'data_source is required'}, 400
+            
+            # Register the data source up front so progress can be tracked on it
+            data_source = {
+                'name': metadata['data_source'],
+                'description': metadata.get('description', ''),
+                'type': 'file',
+                'filename': filename,
+                'user_id': ObjectId(current_user_id),
+                'created_at': datetime.utcnow(),
+                'status': 'processing',
+                'record_count': 0,
+                'columns': [],
+                'numeric_columns': []
+            }
+            data_source_id = db.data_sources.insert_one(data_source).inserted_id
+            chunksize = current_app.config.get('UPLOAD_CHUNK_ROWS', 5000)
+            
+            if request.args.get('async', 'true').lower() != 'false':
+                return self._start_job(db, file, filename, metadata['data_source'],
+                                       data_source_id, ObjectId(current_user_id), chunksize)
             
             try:
-                # Read CSV file
-                df = pd.read_csv(temp_path)
-                
-                # Convert DataFrame to JSON
-                data = json.loads(df.to_json(orient='records'))
-                
-                # Get metadata from request
-                metadata = request.form.to_dict()
-                if 'data_source' not in metadata:
-                    return {'message': 'data_source is required'}, 400
-                
-                # Store data source information
-                data_source = {
-                    'name': metadata['data_source'],
-                    'description': metadata.get('description', ''),
-                    'type': 'file',
-                    'filename': filename,
-                    'user_id': ObjectId(current_user_id),
-                    'created_at': datetime.utcnow(),
-                    'record_count': len(data),
-                    'columns': list(df.columns),
-                    'numeric_columns': list(df.select_dtypes(include=['float64', 'int64']).columns)
-                }
-                
-                result = db.data_sources.insert_one(data_source)
-                
-                # Store data in MongoDB
-                if data:
-                    db.raw_data.insert_many([{
-                        'data_source_id': result.inserted_id,
-                        'data_source': metadata['data_source'],
-                        'timestamp': datetime.utcnow(),
-                        'data': record,
-                        'user_id': ObjectId(current_user_id)
-                    } for record in data])
-                
-                # Create audit log entry for data upload
-                user = db.users.find_one({'_id': ObjectId(current_user_id)})
-                audit_entry = {
-                    'action': 'data_uploaded',
-                    'action_type': 'data',
-                    'performed_by': user['name'],
-                    'user_id': ObjectId(current_user_id),
-                    'organization': user['organization'],
-                    'timestamp': datetime.utcnow(),
-                    'details': f"Uploaded file '{filename}' with {len(data)} records to data source '{metadata['data_source']}'"
-                }
-                db.audit_log.insert_one(audit_entry)
-                
-                return {
-                    'message': 'File processed successfully',
-                    'records_processed': len(data),
-                    'data_source_id': str(result.inserted_id),
-                    'columns': list(df.columns)
-                }, 201
-                
+                # The multipart parser has already spooled the upload to a
+                # temporary file, so parse it in place chunk by chunk
+                result = ingest_csv(
+                    db,
+                    file.stream,
+                    data_source_id,
+                    metadata['data_source'],
+                    ObjectId(current_user_id),
+                    chunksize=chunksize,
+                    on_progress=upload_progress_reporter(db, data_source_id)
+                )
             except pd.errors.EmptyDataError:
+                discard_partial_ingest(db, data_source_id)
                 return {'message': 'The uploaded file is empty'}, 400
             except pd.errors.ParserError:
+                discard_partial_ingest(db, data_source_id)
                 return {'message': 'Error parsing file. Please ensure it is a valid CSV file'}, 400
             except Exception as e:
+                discard_partial_ingest(db, data_source_id)
                 print(f"Error processing file: {str(e)}")
                 return {'message': f'Error processing file: {str(e)}'}, 500
+            
+            finish_csv_upload(db, data_source_id, ObjectId(current_user_id), filename, metadata['data_source'], result)
+            
+            return {
+                'message': 'File processed successfully',
+                'records_processed': result['records'],
+                'data_source_id': str(data_source_id),
+                'columns': result['columns']
+            }, 201
                 
         except Exception as e:
             print(f"Unexpected error in upload endpoint: {str(e)}")
             return {'message': f'Server error: {str(e)}'}, 500
-            
-        finally:
-            # Clean up temporary file
-            if temp_path and os.path.exists(temp_path):
-                try:
-                    os.remove(temp_path)
-                except Exception as e:
-                    print(f"Error removing temporary file: {str(e)}")
+
+    def _start_job(self, db, file, filename, data_source_name, data_source_id, user_id, chunksize):
+        """Saves the upload and queues it for background ingestion"""
+        temp_path = os.path.join(get_upload_dir(), f"{datetime.utcnow().timestamp()}_{filename}")
+        file.save(temp_path)
+        
+        job = create_job(
+            db, 'csv_upload', user_id,
+            data_source=data_source_name,
+            data_source_id=data_source_id,
+            filename=filename,
+            bytes_total=os.path.getsize(temp_path)
+        )
+        
+        if not job_runner.submit(run_upload_job, db, job['_id'], temp_path, chunksize):
+            db.jobs.delete_one({'_id': job['_id']})
+            discard_partial_ingest(db, data_source_id)
+            os.remove(temp_path)
+            return {'message': 'Too many uploads in progress, please retry shortly'}, 503, {'Retry-After': '30'}
+        
+        return {
+            'message': 'Upload accepted for processing',
+            'job_id': str(job['_id']),
+            'data_source_id': str(data_source_id),
+            'status_url': f"{request.script_root}/data/jobs/{job['_id']}"
+        }, 202
+
+@data_ns.route('/jobs/<job_id>')
+class Job(Resource):
+    @jwt_required()
+    def get(self, job_id):
+        """Get the progress of a background job"""
+        db = get_db()
+        try:
+            job_id = ObjectId(job_id)
+        except InvalidId:
+            return {'message': 'Job not found'}, 404
+        job = db.jobs.find_one({
+            '_id': job_id,
+            'user_id': ObjectId(get_jwt_identity())
+        })
+        
+        if not job:
+            return {'message': 'Job not found'}, 404
+        
+        return describe_job(job)
+
+def publish_records(records):
+    """
+    Best-effort fan-out of ingested records to Kafka. Sends are queued and
+    never wait on the broker; the data is already stored in MongoDB.
+    """
+    for record in records:
+        kafka_publisher.publish(INGEST_TOPIC, {
+            'data_source': record['data_source'],
+            'timestamp': record['timestamp'],
+            'data': record['data']
+        }, key=record['data_source'])
+
+def queued_ingest_enabled():
+    return current_app.config.get('INGEST_MODE', 'direct') in ('kafka', 'wal')
+
+def enqueue_documents(documents):
+    """
+    Queued ingest modes: returns ingest ids for raw_data documents once they
+    are durable outside MongoDB, or None if they could not be queued.
+
+    'kafka' appends them to the ingestion topic and waits until every one of
+    them is acknowledged by the broker or, while the broker is down, synced
+    to the local spool; the stream sink writes them to MongoDB. 'wal'
+    appends them to the local ingest log and waits for its group commit;
+    the log's flusher writes them to MongoDB. Neither waits on MongoDB:
+    the documents carry only their source name, which is resolved when
+    they are stored.
+    """
+    ingest_ids = [str(ObjectId()) for _ in documents]
+    messages = [to_message(doc, ingest_id) for doc, ingest_id in zip(documents, ingest_ids)]
+    if current_app.config.get('INGEST_MODE') == 'wal':
+        try:
+            ingest_log.append(get_db(), messages)
+        except (LogFull, TimeoutError, OSError) as e:
+            print(f"Error appending {len(messages)} records to the ingest log: {str(e)}")
+            return None
+        return ingest_ids
+
+    futures = [
+        kafka_publisher.publish(INGEST_TOPIC, message, key=doc['data_source'], durable=True)
+        for doc, message in zip(documents, messages)
+    ]
+    done, pending = wait(futures, timeout=current_app.config.get('INGEST_ACK_TIMEOUT_SECONDS', 10))
+    failed = [future.exception() for future in done if future.exception() is not None]
+    if pending or failed:
+        reason = str(failed[0]) if failed else 'timed out waiting for acks'
+        print(f"Error appending {len(pending) + len(failed)} records to {INGEST_TOPIC}: {reason}")
+        return None
+    return ingest_ids
+
+QUEUE_UNAVAILABLE = ({'message': 'Ingestion queue unavailable, please retry shortly'}, 503, {'Retry-After': '5'})
 
 @data_ns.route('/stream')
 class StreamData(Resource):
@@ -276,54 +419,43 @@ class StreamData(Resource):
             if not data or 'data_source' not in data or 'data' not in data:
                 return {'message': 'Missing required fields: data_source and data'}, 400
 
-            # Check if data source exists, create if it doesn't
-            data_source = db.data_sources.find_one({
-                'name': data['data_source'],
-                'user_id': ObjectId(current_user_id)
-            })
-            
-            if not data_source:
-                # Create new data source
-                data_source = {
-                    'name': data['data_source'],
-                    'description': 'Data source created via API',
-                    'type': 'api',
-                    'user_id': ObjectId(current_user_id),
-                    'created_at': datetime.utcnow(),
-                    'record_count': 0,
-                    'columns': list(data['data'].keys()) if isinstance(data['data'], dict) else []
-                }
-                result = db.data_sources.insert_one(data_source)
-                data_source['_id'] = result.inserted_id
-
-            # Store data in MongoDB
             raw_data = {
-                'data_source_id': data_source['_id'],
                 'data_source': data['data_source'],
                 'timestamp': datetime.utcnow(),
                 'data': data['data'],
                 'user_id': ObjectId(current_user_id)
             }
+            
+            if queued_ingest_enabled():
+                # Acknowledged once it is durably queued; the data source is
+                # resolved, and created if new, when it is stored
+                ingest_ids = enqueue_documents([raw_data])
+                if ingest_ids is None:
+                    return QUEUE_UNAVAILABLE
+                return {
+                    'message': 'Data accepted for ingestion',
+                    'ingest_id': ingest_ids[0]
+                }, 202
+            
+            # Check if data source exists, create if it doesn't
+            data_source = get_or_create_data_sources(
+                db, current_user_id, {data['data_source']: data['data']}
+            )[data['data_source']]
+            raw_data['data_source_id'] = data_source['_id']
+            
+            # Store data in MongoDB
             result = db.raw_data.insert_one(raw_data)
+            apply_rollups(db, [raw_data])
 
             # Update record count
             db.data_sources.update_one(
                 {'_id': data_source['_id']},
                 {'$inc': {'record_count': 1}}
             )
+            bump_source_versions(db, [data['data_source']])
 
             # Try to stream through Kafka if available
-            try:
-                producer = get_kafka_producer()
-                if producer:
-                    producer.send('data_ingestion', {
-                        'data_source': data['data_source'],
-                        'timestamp': datetime.utcnow().isoformat(),
-                        'data': data['data']
-                    })
-            except Exception as kafka_error:
-                print(f"Warning: Kafka streaming failed: {str(kafka_error)}")
-                # Continue since data is already stored in MongoDB
+            publish_records([raw_data])
             
             return {
                 'message': 'Data stored successfully',
@@ -335,6 +467,146 @@ class StreamData(Resource):
             print(f"Error in stream endpoint: {str(e)}")
             return {'message': f'Error processing data: {str(e)}'}, 500
 
+def parse_stream_batch(req, max_records):
+    """
+    Parses a batch body into a list of (index, record) pairs and a list of
+    per-record errors. Accepts a JSON array of {data_source, data} objects,
+    a JSON object {data_source, records: [...]} or NDJSON (one object per line).
+    Raises ValueError if the body is malformed or too large.
+    """
+    records = []
+    errors = []
+    content_type = req.headers.get('Content-Type', '')
+    
+    if 'ndjson' in content_type or 'jsonlines' in content_type:
+        index = 0
+        for line in req.stream:
+            line = line.strip()
+            if not line:
+                continue
+            if index >= max_records:
+                raise ValueError(f'Batch exceeds the limit of {max_records} records')
+            try:
+                records.append((index, json.loads(line)))
+            except ValueError as e:
+                errors.append({'index': index, 'message': f'Invalid JSON: {str(e)}'})
+            index += 1
+        return records, errors
+    
+    body = req.get_json(silent=True)
+    if isinstance(body, dict) and isinstance(body.get('records'), list):
+        # All records belong to one data source
+        body = [{'data_source': body.get('data_source'), 'data': item} for item in body['records']]
+    if not isinstance(body, list):
+        raise ValueError('Body must be a JSON array of records or NDJSON')
+    if len(body) > max_records:
+        raise ValueError(f'Batch exceeds the limit of {max_records} records')
+    return list(enumerate(body)), errors
+
+@data_ns.route('/stream/batch')
+class StreamDataBatch(Resource):
+    @api_key_required
+    def post(self):
+        """Ingest many records, across one or more data sources, in one request"""
+        current_user_id = request.user_id
+        db = get_db()
+        max_records = int(current_app.config.get('STREAM_BATCH_MAX_RECORDS', 10000))
+        
+        try:
+            try:
+                records, errors = parse_stream_batch(request, max_records)
+            except ValueError as e:
+                return {'message': str(e)}, 400
+            
+            # Validate records and collect a sample per source for new sources
+            valid = []
+            samples = {}
+            for index, record in records:
+                if not isinstance(record, dict) or 'data' not in record \
+                        or not isinstance(record.get('data_source'), str) or not record['data_source']:
+                    errors.append({'index': index, 'message': 'Missing required fields: data_source and data'})
+                    continue
+                valid.append((index, record))
+                samples.setdefault(record['data_source'], record['data'])
+            
+            if not valid:
+                return {
+                    'message': 'No valid records in batch',
+                    'records_processed': 0,
+                    'records_failed': len(errors),
+                    'errors': sorted(errors, key=lambda e: e['index'])
+                }, 400
+            
+            now = datetime.utcnow()
+            documents = [{
+                'data_source': record['data_source'],
+                'timestamp': now,
+                'data': record['data'],
+                'user_id': ObjectId(current_user_id)
+            } for _, record in valid]
+            
+            if queued_ingest_enabled():
+                # Sources are resolved, and created if new, when stored
+                if enqueue_documents(documents) is None:
+                    return QUEUE_UNAVAILABLE
+                counts = {}
+                for doc in documents:
+                    counts[doc['data_source']] = counts.get(doc['data_source'], 0) + 1
+                return {
+                    'message': 'Batch accepted for ingestion',
+                    'records_accepted': len(documents),
+                    'records_failed': len(errors),
+                    'data_sources': {name: {'records': count} for name, count in counts.items()},
+                    'errors': sorted(errors, key=lambda e: e['index'])
+                }, 202
+            
+            sources = get_or_create_data_sources(db, current_user_id, samples)
+            for doc in documents:
+                doc['data_source_id'] = sources[doc['data_source']]['_id']
+            
+            # One unordered insert for the whole batch
+            failed_positions = set()
+            try:
+                db.raw_data.insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                for write_error in e.details.get('writeErrors', []):
+                    failed_positions.add(write_error['index'])
+                    errors.append({
+                        'index': valid[write_error['index']][0],
+                        'message': write_error.get('errmsg', 'Write failed')
+                    })
+            
+            inserted = [doc for position, doc in enumerate(documents) if position not in failed_positions]
+            apply_rollups(db, inserted)
+            
+            # One $inc per data source
+            counts = {}
+            for doc in inserted:
+                counts[doc['data_source']] = counts.get(doc['data_source'], 0) + 1
+            if counts:
+                db.data_sources.bulk_write([
+                    UpdateOne({'_id': sources[name]['_id']}, {'$inc': {'record_count': count}})
+                    for name, count in counts.items()
+                ], ordered=False)
+                bump_source_versions(db, counts)
+            
+            publish_records(inserted)
+            
+            return {
+                'message': 'Batch processed',
+                'records_processed': len(inserted),
+                'records_failed': len(errors),
+                'data_sources': {
+                    name: {'data_source_id': str(sources[name]['_id']), 'records': count}
+                    for name, count in counts.items()
+                },
+                'errors': sorted(errors, key=lambda e: e['index'])
+            }, 201
+            
+        except Exception as e:
+            print(f"Error in stream batch endpoint: {str(e)}")
+            return {'message': f'Error processing batch: {str(e)}'}, 500
+
 @data_ns.route('/sources')
 class DataSources(Resource):
     @jwt_required()
@@ -343,15 +615,49 @@ class DataSources(Resource):
         db = get_db()
         sources = list(db.data_sources.find({'user_id': ObjectId(get_jwt_identity())}))
         
+        # Upload progress updates record_count before the version is bumped,
+        # so both are part of the tag. No Last-Modified: deleting a source
+        # would not move it forward.
+        versions = get_source_versions(db, [source['name'] for source in sources])
+        etag = make_etag('sources', [
+            (str(source['_id']), source['name'], source.get('description', ''),
+             source.get('record_count', 0), source.get('columns', []), versions.get(source['name'], 0))
+            for source in sources
+        ])
+        headers = cache_headers(etag)
+        if is_not_modified(etag):
+            return not_modified(headers)
+        
         return [{
-            'id': str(source['_id']),
+            'id': source['_id'],
             'name': source['name'],
             'description': source.get('description', ''),
             'type': source['type'],
-            'created_at': source['created_at'].isoformat(),
+            'created_at': source['created_at'],
             'record_count': source.get('record_count', 0),
             'columns': source.get('columns', [])
-        } for source in sources]
+        } for source in sources], 200, headers
+
+# Fields returned for each raw_data row; user_id stays on the server
+SOURCE_DATA_PROJECTION = {'data_source_id': 1, 'data_source': 1, 'timestamp': 1, 'data': 1}
+
+def serialize_source_record(record):
+    """ObjectIds and datetimes are left to the JSON encoder in services.serialization"""
+    return {
+        'id': record['_id'],
+        'data_source_id': record['data_source_id'],
+        'data_source': record['data_source'],
+        'timestamp': record['timestamp'],
+        'data': record['data']
+    }
+
+def stream_ndjson(cursor):
+    """Yields one JSON line per document as the cursor returns them"""
+    try:
+        for record in cursor:
+            yield dumps(serialize_source_record(record)) + b'\n'
+    finally:
+        cursor.close()
 
 @data_ns.route('/source/<source_id>/data')
 class SourceData(Resource):
@@ -371,25 +677,95 @@ class SourceData(Resource):
             if not source:
                 return {'message': 'Data source not found'}, 404
             
-            # Fetch the raw data
-            data = list(db.raw_data.find({
+            try:
+                after = ObjectId(request.args['after']) if request.args.get('after') else None
+            except InvalidId:
+                return {'message': 'Invalid cursor'}, 400
+            
+            response_format = request.args.get('format', 'json')
+            max_page_size = current_app.config.get('SOURCE_DATA_MAX_PAGE_SIZE', 10000)
+            if response_format == 'ndjson':
+                # Streams are unbounded unless a limit is given
+                limit = request.args.get('limit', type=int)
+            else:
+                limit = request.args.get('limit', current_app.config.get('SOURCE_DATA_PAGE_SIZE', 1000), type=int)
+                limit = max(1, min(limit, max_page_size))
+            
+            # Keyset on _id, served by the (data_source_id, user_id, _id) index
+            query = {
                 'data_source_id': ObjectId(source_id),
                 'user_id': ObjectId(current_user_id)
-            }))
+            }
+            if after:
+                query['_id'] = {'$gt': after}
             
-            # Transform the data for response
-            return [{
-                'id': str(record['_id']),
-                'data_source_id': str(record['data_source_id']),
-                'data_source': record['data_source'],
-                'timestamp': record['timestamp'].isoformat(),
-                'data': record['data']
-            } for record in data], 200
+            cursor = db.raw_data.find(query, SOURCE_DATA_PROJECTION).sort('_id', 1).batch_size(
+                current_app.config.get('SOURCE_DATA_BATCH_SIZE', 1000)
+            )
+            
+            if response_format == 'ndjson':
+                if limit:
+                    cursor = cursor.limit(limit)
+                return Response(
+                    stream_with_context(stream_ndjson(cursor)),
+                    mimetype='application/x-ndjson'
+                )
+            
+            # Fetch one extra row to know whether another page follows
+            records = [serialize_source_record(record) for record in cursor.limit(limit + 1)]
+            headers = {}
+            if len(records) > limit:
+                records = records[:limit]
+                next_cursor = str(records[-1]['id'])
+                headers['X-Next-Cursor'] = next_cursor
+                headers['Link'] = f'<{request.base_url}?limit={limit}&after={next_cursor}>; rel="next"'
+            
+            return records, 200, headers
             
         except Exception as e:
             print(f"Error fetching source data: {str(e)}")
             return {'message': f'Error fetching data: {str(e)}'}, 500
 
+@data_ns.route('/source/<source_id>/export')
+class SourceExport(Resource):
+    @api_key_required
+    def get(self, source_id):
+        """Export a data source as CSV, Arrow IPC or Parquet"""
+        try:
+            db = get_db()
+            current_user_id = request.user_id
+            
+            file_format = request.args.get('format', 'csv')
+            if file_format not in EXPORT_FORMATS:
+                return {'message': f"Unsupported format. Use one of: {', '.join(EXPORT_FORMATS)}"}, 400
+            mimetype, extension, needs_arrow = EXPORT_FORMATS[file_format]
+            if needs_arrow and not arrow_available():
+                return {'message': f'{file_format} export requires pyarrow, which is not installed'}, 501
+            
+            source = db.data_sources.find_one({
+                '_id': ObjectId(source_id),
+                'user_id': ObjectId(current_user_id)
+            })
+            if not source:
+                return {'message': 'Data source not found'}, 404
+            
+            batch_size = current_app.config.get('EXPORT_BATCH_ROWS', 5000)
+            cursor = db.raw_data.find({
+                'data_source_id': ObjectId(source_id),
+                'user_id': ObjectId(current_user_id)
+            }, {'data': 1}).sort('_id', 1).batch_size(batch_size)
+            
+            filename = secure_filename(f"{source['name']}.{extension}") or f'export.{extension}'
+            return Response(
+                stream_with_context(export_source(source, cursor, file_format, batch_size)),
+                mimetype=mimetype,
+                headers={'Content-Disposition': f'attachment; filename={filename}'}
+            )
+            
+        except Exception as e:
+            print(f"Error exporting source data: {str(e)}")
+            return {'message': f'Error exporting data: {str(e)}'}, 500
+
 @data_ns.route('/sample-data')
 class SampleData(Resource):
     @jwt_required()
@@ -447,44 +823,47 @@ class SampleData(Resource):
             
             # Insert sample data
             # Industry Revenue
-            db.raw_data.insert_many([{
+            documents = [{
                 'data_source_id': source_ids['Industry Revenue'],
                 'data_source': 'Industry Revenue',
                 'timestamp': datetime.utcnow(),
                 'data': {'industry': industry, 'revenue': revenue},
                 'user_id': ObjectId(current_user_id)
-            } for industry, revenue in SAMPLE_DATA['industry_revenue'].items()])
+            } for industry, revenue in SAMPLE_DATA['industry_revenue'].items()]
             
             # Monthly Trends
-            monthly_data = []
             for industry, months in SAMPLE_DATA['monthly_trends'].items():
                 for month, value in months.items():
-                    monthly_data.append({
+                    documents.append({
                         'data_source_id': source_ids['Monthly Trends'],
                         'data_source': 'Monthly Trends',
                         'timestamp': datetime.utcnow(),
                         'data': {'industry': industry, 'month': month, 'value': value},
                         'user_id': ObjectId(current_user_id)
                     })
-            db.raw_data.insert_many(monthly_data)
             
             # Size Distribution
-            db.raw_data.insert_many([{
+            documents += [{
                 'data_source_id': source_ids['Company Size Distribution'],
                 'data_source': 'Company Size Distribution',
                 'timestamp': datetime.utcnow(),
                 'data': {'size': size, 'count': count},
                 'user_id': ObjectId(current_user_id)
-            } for size, count in SAMPLE_DATA['size_distribution'].items()])
+            } for size, count in SAMPLE_DATA['size_distribution'].items()]
             
             # Employee Growth
-            db.raw_data.insert_many([{
+            documents += [{
                 'data_source_id': source_ids['Employee Growth'],
                 'data_source': 'Employee Growth',
                 'timestamp': datetime.utcnow(),
                 'data': {'year': year, 'employees': count},
                 'user_id': ObjectId(current_user_id)
-            } for year, count in SAMPLE_DATA['employee_growth'].items()])
+            } for year, count in SAMPLE_DATA['employee_growth'].items()]
+            
+            db.raw_data.insert_many(documents)
+            apply_rollups(db, documents)
+            
+            bump_source_versions(db, source_ids)
             
             return {
                 'message': 'Sample data initialized successfully',
@@ -524,6 +903,8 @@ class Source(Resource):
                 'data_source_id': ObjectId(source_id),
                 'user_id': ObjectId(current_user_id)
             })
+            bump_source_versions(db, [source['name']])
+            rebuild_rollups(db, [source['name']])
             
             return {'message': 'Data source deleted successfully'}, 200
             
@@ -18,6 +18,30 @@ def create_app():
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=1)
     app.config['MONGODB_URI'] = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/hospital_dashboard')
     app.config['KAFKA_BOOTSTRAP_SERVERS'] = os.getenv('KAFKA_BOOTSTRAP_SERVERS', 'localhost:9092')
+    app.config['STREAM_BATCH_MAX_RECORDS'] = int(os.getenv('STREAM_BATCH_MAX_RECORDS', '10000'))
+    # 'direct' writes stream records to MongoDB in the request; 'kafka' only
+    # appends them to the ingestion topic for stream_sink.py to write; 'wal'
+    # appends them to a local ingest log that a background flusher stores
+    app.config['INGEST_MODE'] = os.getenv('INGEST_MODE', 'direct')
+    app.config['INGEST_ACK_TIMEOUT_SECONDS'] = float(os.getenv('INGEST_ACK_TIMEOUT_SECONDS', '10'))
+    app.config['UPLOAD_CHUNK_ROWS'] = int(os.getenv('UPLOAD_CHUNK_ROWS', '5000'))
+    app.config['DASHBOARD_QUERY_WORKERS'] = int(os.getenv('DASHBOARD_QUERY_WORKERS', '8'))
+    app.config['DASHBOARD_DEADLINE_MS'] = int(os.getenv('DASHBOARD_DEADLINE_MS', '10000'))
+    app.config['SOURCE_DATA_PAGE_SIZE'] = int(os.getenv('SOURCE_DATA_PAGE_SIZE', '1000'))
+    app.config['SOURCE_DATA_MAX_PAGE_SIZE'] = int(os.getenv('SOURCE_DATA_MAX_PAGE_SIZE', '10000'))
+    app.config['SOURCE_DATA_BATCH_SIZE'] = int(os.getenv('SOURCE_DATA_BATCH_SIZE', '1000'))
+    app.config['EXPORT_BATCH_ROWS'] = int(os.getenv('EXPORT_BATCH_ROWS', '5000'))
+    app.config['HTTP_MICROCACHE_SECONDS'] = int(os.getenv('HTTP_MICROCACHE_SECONDS', '1'))
+    app.config['COMPRESS_MIN_BYTES'] = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+    # Live dashboard streams: comment lines keep idle connections open,
+    # EventSource reconnects after SSE_RETRY_MS when one drops, one stream
+    # serves at most SSE_MAX_DASHBOARDS dashboards, and the stream token that
+    # opens it is valid for SSE_TOKEN_SECONDS
+    app.config['SSE_HEARTBEAT_SECONDS'] = float(os.getenv('SSE_HEARTBEAT_SECONDS', '15'))
+    app.config['SSE_RETRY_MS'] = int(os.getenv('SSE_RETRY_MS', '5000'))
+    app.config['SSE_MAX_DASHBOARDS'] = int(os.getenv('SSE_MAX_DASHBOARDS', '50'))
+    app.config['SSE_TOKEN_SECONDS'] = int(os.getenv('SSE_TOKEN_SECONDS', '60'))
+    app.config['ENSURE_INDEXES_ON_STARTUP'] = os.getenv('ENSURE_INDEXES_ON_STARTUP', 'true').lower() == 'true'
     
     # Configure CORS
     CORS(app, resources={
@@ -25,7 +49,7 @@ def create_app():
             "origins": ["http://localhost:3000"],
             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
             "allow_headers": ["Content-Type", "Authorization"],
-            "expose_headers": ["Authorization"],
+            "expose_headers": ["Authorization", "X-Next-Cursor", "Link"],
             "supports_credentials": True,
             "max_age": 3600
         }
@@ -38,6 +62,12 @@ def create_app():
     api = Api(app, version='1.0', title='Hospital Dashboard API',
              description='A modern hospital dashboard API with real-time data processing')
     
+    # Compact JSON for every resource, compressed when the client accepts it
+    from services.serialization import init_json
+    from services.compression import init_compression
+    init_json(api)
+    init_compression(app)
+    
     # Register blueprints
     from api.auth import auth_ns
     from api.dashboard import dashboard_ns
@@ -47,10 +77,45 @@ def create_app():
     api.add_namespace(dashboard_ns, path='/dashboard')
     api.add_namespace(data_ns, path='/data')
     
+    # Ensure declared indexes without delaying worker startup
+    if app.config['ENSURE_INDEXES_ON_STARTUP']:
+        from models.db import get_database
+        from models.indexes import ensure_indexes_in_background
+        ensure_indexes_in_background(get_database())
+    
+    # Store records left in the ingest log by workers that exited
+    if app.config['INGEST_MODE'] == 'wal':
+        from models.db import get_database
+        from services.ingest_log import ingest_log
+        ingest_log.start(get_database())
+    
     @app.route('/health')
     def health_check():
         return {'status': 'healthy'}, 200
     
+    @app.route('/metrics')
+    def metrics():
+        from models.db import client_manager
+        from services.auth_cache import credential_cache
+        from services.write_behind import write_behind
+        from services.jobs import job_runner
+        from services.chart_cache import chart_cache
+        from services.chart_snapshots import public_snapshots
+        from services.kafka_producer import kafka_publisher
+        from services.ingest_log import ingest_log
+        from services.live_updates import live_updates
+        return {
+            'mongo_pool': client_manager.pool_stats(),
+            'auth_cache': credential_cache.stats(),
+            'write_behind': write_behind.stats(),
+            'jobs': job_runner.stats(),
+            'chart_cache': chart_cache.stats(),
+            'public_charts': public_snapshots.stats(),
+            'kafka_producer': kafka_publisher.stats(),
+            'ingest_log': ingest_log.stats(),
+            'live_updates': live_updates.stats()
+        }, 200
+    
     return app
 
 if __name__ == '__main__':
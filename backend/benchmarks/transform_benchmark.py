@@ -0,0 +1,64 @@
+"""
+Throughput of the raw-record chart transform, top_group_totals in
+services/transform.py (a per-record loop), against the columnar
+alternative: flat key and value columns built from the records, grouped
+with pandas factorize and NumPy bincount, top k picked with argpartition.
+
+The loop is kept while this shows no speedup; records are decoded dicts
+either way, and building the columns costs about as much as the loop.
+
+Run from backend/:
+
+    python -m benchmarks.transform_benchmark              # 10^5 and 10^6 rows
+    python -m benchmarks.transform_benchmark 100000 10000000
+
+10^7 rows of dicts needs several GB of memory for the input alone.
+"""
+import sys
+import time
+import numpy as np
+import pandas as pd
+from services.transform import top_group_totals
+
+def columnar_transform(data, x_field, y_field, k=20):
+    """The best columnar candidate measured; assumes numeric values"""
+    keys = [item.get(x_field, '') for item in data]
+    values = np.array([item.get(y_field, 0) for item in data], dtype=float)
+    codes, uniques = pd.factorize(np.array(keys, dtype=object), sort=False, use_na_sentinel=False)
+    totals = np.bincount(codes, weights=values, minlength=len(uniques))
+    labels = uniques.astype(str)
+    if len(totals) > k:
+        threshold = totals[np.argpartition(-totals, k - 1)[:k]].min()
+        candidates = np.flatnonzero(totals >= threshold)
+    else:
+        candidates = np.arange(len(totals))
+    chosen = candidates[np.lexsort((labels[candidates], -totals[candidates]))[:k]]
+    return labels[chosen].tolist(), totals[chosen].tolist()
+
+def make_records(rows, groups=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    wards = rng.integers(0, groups, size=rows)
+    patients = rng.integers(0, 500, size=rows)
+    return [{'ward': f'W{ward}', 'patients': int(count)} for ward, count in zip(wards, patients)]
+
+def best_of(fn, repeats):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main(sizes):
+    print(f"{'rows':>12} {'loop rows/s':>14} {'columnar rows/s':>16} {'columnar/loop':>14}")
+    for rows in sizes:
+        records = make_records(rows)
+        repeats = 3 if rows <= 1000000 else 1
+        loop_time, expected = best_of(lambda: top_group_totals(records, 'ward', 'patients'), repeats)
+        columnar_time, actual = best_of(lambda: columnar_transform(records, 'ward', 'patients'), repeats)
+        assert actual[0] == expected[0] and np.allclose(actual[1], expected[1]), 'results differ'
+        print(f"{rows:>12,} {rows / loop_time:>14,.0f} {rows / columnar_time:>16,.0f} {loop_time / columnar_time:>13.2f}x")
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [100000, 1000000])
@@ -0,0 +1,15 @@
+from models.db import get_database
+from models.indexes import report_indexes
+
+db = get_database()
+
+for collection, result in report_indexes(db).items():
+    if not any(result.values()):
+        continue
+    print(f"{collection}:")
+    if result['missing']:
+        print("  missing:", ", ".join(result['missing']))
+    if result['undeclared']:
+        print("  not in registry:", ", ".join(result['undeclared']))
+    if result['unused']:
+        print("  unused since server start:", ", ".join(result['unused']))
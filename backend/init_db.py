@@ -1,6 +1,7 @@
 from pymongo import MongoClient
 from werkzeug.security import generate_password_hash
 from datetime import datetime
+from models.indexes import ensure_indexes
 import time
 import os
 
@@ -53,7 +54,7 @@ def init_db():
                 print("Admin password has been reset")
             
             # Create necessary indexes
-            db.users.create_index('email', unique=True)
+            ensure_indexes(db)
             
             print("Database initialization completed successfully")
             return
@@ -1,78 +1,211 @@
-from pymongo import MongoClient
-from flask import current_app, g
+from pymongo import MongoClient, monitoring
+from flask import current_app, g, has_app_context
 import os
+import threading
 import mongomock
 
 # Store the mock client at module level for testing
 _mock_client = None
 
+DATABASE_NAME = 'hospital_dashboard'
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """
+    Connection pool listener that keeps simple counters for the shared client.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.pools_created = 0
+            self.pools_cleared = 0
+            self.connections_created = 0
+            self.connections_closed = 0
+            self.checkouts = 0
+            self.checkins = 0
+            self.checkout_failures = 0
+
+    def _incr(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def pool_created(self, event):
+        self._incr('pools_created')
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._incr('pools_cleared')
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._incr('connections_created')
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._incr('connections_closed')
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._incr('checkout_failures')
+
+    def connection_checked_out(self, event):
+        self._incr('checkouts')
+
+    def connection_checked_in(self, event):
+        self._incr('checkins')
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'pools_created': self.pools_created,
+                'pools_cleared': self.pools_cleared,
+                'connections_created': self.connections_created,
+                'connections_closed': self.connections_closed,
+                'connections_open': self.connections_created - self.connections_closed,
+                'connections_in_use': self.checkouts - self.checkins,
+                'checkouts': self.checkouts,
+                'checkout_failures': self.checkout_failures
+            }
+
+class MongoClientManager:
+    """
+    Holds one pooled MongoClient per process.
+
+    The client is created lazily on first use and re-created whenever the
+    process id changes, so a client inherited from a gunicorn master across
+    fork() is never reused by a worker.
+    """
+    def __init__(self):
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.stats = PoolStats()
+
+    def client_options(self):
+        """Pool options read from the environment"""
+        options = {
+            'maxPoolSize': int(os.getenv('MONGODB_MAX_POOL_SIZE', '100')),
+            'minPoolSize': int(os.getenv('MONGODB_MIN_POOL_SIZE', '0')),
+        }
+        wait_queue_timeout = os.getenv('MONGODB_WAIT_QUEUE_TIMEOUT_MS')
+        if wait_queue_timeout:
+            options['waitQueueTimeoutMS'] = int(wait_queue_timeout)
+        return options
+
+    def get_client(self):
+        pid = os.getpid()
+        if self._client is None or self._pid != pid:
+            with self._lock:
+                if self._client is None or self._pid != pid:
+                    if self._pid != pid:
+                        # Counters belong to the parent's pool
+                        self.stats.reset()
+                    self._client = MongoClient(
+                        os.getenv('MONGODB_URI', 'mongodb://mongodb:27017/'),
+                        event_listeners=[self.stats],
+                        **self.client_options()
+                    )
+                    self._pid = pid
+        return self._client
+
+    def close(self):
+        """Closes the client owned by this process, if any."""
+        with self._lock:
+            if self._client is not None and self._pid == os.getpid():
+                self._client.close()
+            self._client = None
+            self._pid = None
+
+    def pool_stats(self):
+        stats = self.stats.snapshot()
+        stats['pid'] = self._pid
+        stats['options'] = self.client_options()
+        return stats
+
+client_manager = MongoClientManager()
+
+def _is_testing():
+    if has_app_context():
+        return bool(current_app.config.get('TESTING'))
+    return bool(os.getenv('TESTING'))
+
 def get_client():
     """
-    Returns a MongoDB client instance.
+    Returns the MongoDB client shared by this process.
     Can be overridden in tests.
     """
     global _mock_client
-    
-    if not hasattr(g, 'mongo_client'):
-        if current_app and current_app.config.get('TESTING'):
-            if _mock_client is None:
-                _mock_client = mongomock.MongoClient()
-            g.mongo_client = _mock_client
-        else:
-            g.mongo_client = MongoClient(os.getenv('MONGODB_URI', 'mongodb://mongodb:27017/'))
-    return g.mongo_client
+
+    if _is_testing():
+        if _mock_client is None:
+            _mock_client = mongomock.MongoClient()
+        return _mock_client
+    return client_manager.get_client()
+
+def get_database():
+    """
+    Returns the application database without requiring an app context.
+    Intended for background threads that outlive a request.
+    """
+    return get_client()[DATABASE_NAME]
 
 # Initialize a default client and database for module-level access
 if os.getenv('TESTING'):
     _default_client = mongomock.MongoClient()
 else:
-    _default_client = MongoClient(os.getenv('MONGODB_URI', 'mongodb://mongodb:27017/'))
-db = _default_client['hospital_dashboard']
+    _default_client = MongoClient(os.getenv('MONGODB_URI', 'mongodb://mongodb:27017/'), connect=False)
+db = _default_client[DATABASE_NAME]
 
 def get_db():
     """
-    Returns a MongoDB database connection.
-    Creates a new connection if one doesn't exist for the current application context.
+    Returns a MongoDB database handle for the current application context.
+    The underlying client is pooled and shared across requests.
     """
     if 'db' not in g:
-        client = get_client()
-        g.db = client['hospital_dashboard']
+        g.db = get_client()[DATABASE_NAME]
     return g.db
 
 def close_db(e=None):
     """
-    Closes the MongoDB connection if it exists.
+    Releases the database handle for the current application context.
+    The pooled client stays open for the next request.
     """
-    db = g.pop('db', None)
-    if db is not None and not current_app.config.get('TESTING'):
-        db.client.close()
-    g.pop('mongo_client', None)
+    g.pop('db', None)
 
 def init_db(app=None):
     """
     Initializes the database with the application context.
     Creates indexes and initial collections if needed.
     """
+    from models.indexes import ensure_indexes
     db = get_db()
-    
-    # Create indexes
-    db.users.create_index('email', unique=True)
-    db.organizations.create_index('name', unique=True)
-    db.dashboards.create_index([('organization', 1), ('name', 1)], unique=True)
-    
+
+    # Create indexes declared in models/indexes.py
+    ensure_indexes(db)
+
     # Create initial collections if they don't exist
     if 'users' not in db.list_collection_names():
         db.create_collection('users')
-    
+
     if 'organizations' not in db.list_collection_names():
         db.create_collection('organizations')
-    
+
     if 'dashboards' not in db.list_collection_names():
         db.create_collection('dashboards')
-    
+
     if 'data_sources' not in db.list_collection_names():
         db.create_collection('data_sources')
-    
+
     if 'events' not in db.list_collection_names():
         db.create_collection('events')
 
@@ -81,4 +214,4 @@ def register_db(app):
     Registers database functions with the Flask application.
     """
     app.teardown_appcontext(close_db)
-    init_db(app) 
\ No newline at end of file
+    init_db(app)
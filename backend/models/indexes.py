@@ -0,0 +1,162 @@
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+import os
+import threading
+
+# Store raw_data as a MongoDB time-series collection (timeField timestamp,
+# metaField data_source). Only applies when raw_data does not exist yet;
+# deleting a source's rows filters on data_source_id, which time-series
+# collections only allow from MongoDB 7.0.
+RAW_DATA_TIMESERIES = os.getenv('RAW_DATA_TIMESERIES', 'false').lower() == 'true'
+RAW_DATA_TIMESERIES_GRANULARITY = os.getenv('RAW_DATA_TIMESERIES_GRANULARITY', 'seconds')
+
+# Declarative index registry: every query shape the API runs, by collection.
+# Names are left to the server default (e.g. 'email_1') so indexes created
+# earlier by init scripts are recognised as the same index.
+INDEXES = {
+    'users': [
+        # Login, registration and bulk upload lookups
+        IndexModel([('email', ASCENDING)], unique=True),
+        # Team member listing
+        IndexModel([('organization', ASCENDING)]),
+    ],
+    'organizations': [
+        IndexModel([('name', ASCENDING)], unique=True),
+    ],
+    'dashboards': [
+        # Dashboard listing by organization, unique names per organization
+        IndexModel([('organization', ASCENDING), ('name', ASCENDING)], unique=True),
+    ],
+    'data_sources': [
+        # Source listing per user and stream source lookup by name
+        IndexModel([('user_id', ASCENDING), ('name', ASCENDING)]),
+    ],
+    'raw_data': [
+        # Chart aggregations match on data_source, time filters on timestamp
+        IndexModel([('data_source', ASCENDING), ('timestamp', ASCENDING)]),
+        # Source data pages (keyset on _id) and source deletes
+        IndexModel([('data_source_id', ASCENDING), ('user_id', ASCENDING), ('_id', ASCENDING)]),
+        # Stream sink redeliveries of rows already written are rejected.
+        # Time-series collections can't have it; redeliveries are then stored again.
+        IndexModel([('ingest_id', ASCENDING)], unique=True, sparse=True),
+    ],
+    'audit_log': [
+        # Audit log listing, newest first, optionally filtered by type
+        IndexModel([('organization', ASCENDING), ('timestamp', DESCENDING)]),
+        IndexModel([('organization', ASCENDING), ('action_type', ASCENDING), ('timestamp', DESCENDING)]),
+    ],
+    'api_keys': [
+        # API key authentication
+        IndexModel([('key', ASCENDING)], unique=True),
+        # Key listing per user
+        IndexModel([('user_id', ASCENDING)]),
+    ],
+    'api_endpoints': [
+        IndexModel([('user_id', ASCENDING)]),
+    ],
+    'retention_settings': [
+        IndexModel([('user_id', ASCENDING)]),
+    ],
+    'notification_settings': [
+        IndexModel([('user_id', ASCENDING)]),
+    ],
+    'jobs': [
+        IndexModel([('user_id', ASCENDING), ('created_at', DESCENDING)]),
+    ],
+    'rollup_specs': [
+        # Specs applied by ingestion, looked up by source
+        IndexModel([('data_source', ASCENDING)]),
+    ],
+    'rollups': [
+        # Rollup upserts and reads per spec generation
+        IndexModel([('spec_id', ASCENDING), ('generation', ASCENDING), ('group', ASCENDING)], unique=True),
+    ],
+    'chart_cache': [
+        # Expire shared chart cache entries
+        IndexModel([('expires_at', ASCENDING)], expireAfterSeconds=0),
+    ],
+}
+
+def index_name(model):
+    return model.document['name']
+
+def ensure_raw_data_collection(db):
+    """Creates raw_data as a time-series collection when configured to and not yet present"""
+    if not RAW_DATA_TIMESERIES or 'raw_data' in db.list_collection_names():
+        return False
+    db.create_collection('raw_data', timeseries={
+        'timeField': 'timestamp',
+        'metaField': 'data_source',
+        'granularity': RAW_DATA_TIMESERIES_GRANULARITY
+    })
+    print("Created raw_data as a time-series collection")
+    return True
+
+def ensure_indexes(db, registry=None):
+    """
+    Creates every declared index that is missing. Safe to run repeatedly:
+    existing indexes are left alone, and an index that conflicts with an
+    existing definition is reported and skipped rather than aborting.
+    Returns {collection: [names of indexes created or confirmed]}.
+    """
+    registry = registry or INDEXES
+    # Must run before any index build implicitly creates raw_data
+    try:
+        ensure_raw_data_collection(db)
+    except OperationFailure as e:
+        print(f"Could not create raw_data as a time-series collection: {str(e)}")
+    ensured = {}
+    for collection, models in registry.items():
+        ensured[collection] = []
+        for model in models:
+            try:
+                db[collection].create_indexes([model])
+                ensured[collection].append(index_name(model))
+            except OperationFailure as e:
+                print(f"Could not create index {index_name(model)} on {collection}: {str(e)}")
+    return ensured
+
+def ensure_indexes_in_background(db, registry=None):
+    """Runs ensure_indexes on a daemon thread so startup is not blocked"""
+    def run():
+        try:
+            ensured = ensure_indexes(db, registry)
+            print(f"Ensured indexes on {len(ensured)} collections")
+        except Exception as e:
+            print(f"Error ensuring indexes: {str(e)}")
+
+    thread = threading.Thread(target=run, name='ensure-indexes', daemon=True)
+    thread.start()
+    return thread
+
+def report_indexes(db, registry=None):
+    """
+    Compares the declared indexes with what exists in the database.
+
+    Returns, per collection, the declared indexes that are missing, the
+    indexes that exist but are not declared, and the indexes that
+    $indexStats shows have not been used since the server started.
+    """
+    registry = registry or INDEXES
+    report = {}
+    collections = set(registry) | set(db.list_collection_names())
+    for collection in sorted(collections):
+        declared = {index_name(model) for model in registry.get(collection, [])}
+        existing = set(db[collection].index_information()) if collection in db.list_collection_names() else set()
+
+        unused = None
+        try:
+            stats = db[collection].aggregate([{'$indexStats': {}}])
+            unused = sorted(
+                stat['name'] for stat in stats
+                if stat['name'] != '_id_' and stat.get('accesses', {}).get('ops', 0) == 0
+            )
+        except Exception as e:
+            print(f"$indexStats unavailable for {collection}: {str(e)}")
+
+        report[collection] = {
+            'missing': sorted(declared - existing),
+            'undeclared': sorted(existing - declared - {'_id_'}),
+            'unused': unused
+        }
+    return report
@@ -0,0 +1,122 @@
+from collections import OrderedDict
+import os
+import threading
+import time
+
+class CredentialCache:
+    """
+    In-process TTL/LRU cache of API key credentials.
+
+    Maps an API key to the fields the auth decorators need (key id, user id,
+    key name, user name, organization) so a hot client does not hit MongoDB
+    to authenticate every request.
+    """
+    def __init__(self, max_size=10000, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, api_key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._entries.get(api_key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires_at, entry = item
+            if expires_at <= now:
+                del self._entries[api_key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(api_key)
+            self.hits += 1
+            return entry
+
+    def set(self, api_key, entry):
+        with self._lock:
+            self._entries[api_key] = (time.monotonic() + self.ttl, entry)
+            self._entries.move_to_end(api_key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _invalidate_where(self, predicate):
+        with self._lock:
+            stale = [k for k, (_, entry) in self._entries.items() if predicate(entry)]
+            for k in stale:
+                del self._entries[k]
+            self.invalidations += len(stale)
+            return len(stale)
+
+    def invalidate(self, api_key):
+        with self._lock:
+            if self._entries.pop(api_key, None) is not None:
+                self.invalidations += 1
+
+    def invalidate_key_id(self, key_id):
+        return self._invalidate_where(lambda entry: str(entry['key_id']) == str(key_id))
+
+    def invalidate_user(self, user_id):
+        return self._invalidate_where(lambda entry: str(entry['user_id']) == str(user_id))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+credential_cache = CredentialCache(
+    max_size=int(os.getenv('AUTH_CACHE_SIZE', '10000')),
+    ttl=float(os.getenv('AUTH_CACHE_TTL', '60'))
+)
+
+def looks_like_jwt(token):
+    """API keys are alphanumeric, JWTs always contain dots."""
+    return '.' in token
+
+def lookup_api_key(db, api_key):
+    """
+    Returns the credentials for an active API key, or None if the key is
+    unknown or inactive. Only successful lookups are cached.
+    """
+    entry = credential_cache.get(api_key)
+    if entry is not None:
+        return entry
+
+    key_data = db.api_keys.find_one(
+        {'key': api_key, 'is_active': True},
+        {'user_id': 1, 'name': 1}
+    )
+    if not key_data:
+        return None
+
+    user = db.users.find_one({'_id': key_data['user_id']}, {'name': 1, 'organization': 1})
+    entry = {
+        'key_id': key_data['_id'],
+        'user_id': key_data['user_id'],
+        'name': key_data['name'],
+        'user_name': user['name'] if user else None,
+        'organization': user['organization'] if user else None,
+        'user_exists': user is not None,
+        'is_active': True
+    }
+    if user:
+        credential_cache.set(api_key, entry)
+    return entry
@@ -0,0 +1,147 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import hashlib
+import json
+import os
+import threading
+import time
+
+class LocalLRUBackend:
+    """In-process LRU with per-entry expiry. Not shared between workers."""
+    def __init__(self, max_size=1000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, db, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, db, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self, db=None):
+        with self._lock:
+            self._entries.clear()
+
+    def size(self):
+        return len(self._entries)
+
+class MongoCacheBackend:
+    """
+    Shared backend storing results in the chart_cache collection, so every
+    worker sees the same entries. A TTL index on expires_at removes old
+    entries; expiry is also checked on read. Tests run it against mongomock.
+    """
+    def get(self, db, key):
+        doc = db.chart_cache.find_one({'_id': key})
+        if doc is None or doc['expires_at'] <= datetime.utcnow():
+            return None
+        return doc['value']
+
+    def set(self, db, key, value, ttl):
+        db.chart_cache.replace_one(
+            {'_id': key},
+            {'_id': key, 'value': value, 'expires_at': datetime.utcnow() + timedelta(seconds=ttl)},
+            upsert=True
+        )
+
+    def clear(self, db=None):
+        if db is not None:
+            db.chart_cache.delete_many({})
+
+    def size(self):
+        return None
+
+class ChartResultCache:
+    """
+    Caches chart aggregation results keyed by (data source, normalized
+    pipeline, source version). Ingestion bumps the source version, so
+    entries for changed data are simply never looked up again.
+    """
+    def __init__(self, backend, ttl=300, enabled=True):
+        self.backend = backend
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(data_source, pipeline, version):
+        normalized = json.dumps(
+            {'data_source': data_source, 'pipeline': pipeline, 'version': version},
+            sort_keys=True, default=str
+        )
+        return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+    def get(self, db, key):
+        if not self.enabled:
+            return None
+        try:
+            value = self.backend.get(db, key)
+        except Exception as e:
+            print(f"Chart cache read failed: {str(e)}")
+            value = None
+            with self._lock:
+                self.errors += 1
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, db, key, value):
+        if not self.enabled:
+            return
+        try:
+            self.backend.set(db, key, value, self.ttl)
+        except Exception as e:
+            print(f"Chart cache write failed: {str(e)}")
+            with self._lock:
+                self.errors += 1
+
+    def clear(self, db=None):
+        self.backend.clear(db)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': type(self.backend).__name__,
+                'enabled': self.enabled,
+                'size': self.backend.size(),
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'errors': self.errors
+            }
+
+def create_backend(name, max_size=1000):
+    if name == 'mongo':
+        return MongoCacheBackend()
+    return LocalLRUBackend(max_size=max_size)
+
+chart_cache = ChartResultCache(
+    create_backend(
+        os.getenv('CHART_CACHE_BACKEND', 'local'),
+        max_size=int(os.getenv('CHART_CACHE_SIZE', '1000'))
+    ),
+    ttl=int(os.getenv('CHART_CACHE_TTL', '300')),
+    enabled=os.getenv('CHART_CACHE_ENABLED', 'true').lower() == 'true'
+)
@@ -0,0 +1,137 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from services.source_versions import add_listener
+import os
+import threading
+import time
+
+class SnapshotCache:
+    """
+    In-process cache of public chart snapshots with stale-while-revalidate.
+
+    An entry is served as is for `fresh_seconds`. After that it is still
+    served for up to `stale_seconds` while a single background refresh per
+    key calls load(previous) again; loaders return `previous` when its
+    version still matches, so a refresh of unchanged data is one cheap
+    version check. Older entries are loaded before responding. A failed
+    refresh keeps serving the stale entry until it runs out.
+
+    Snapshots marked partial are served but due for refresh immediately.
+    """
+    def __init__(self, fresh_seconds=30, stale_seconds=600, max_size=1000, refresh_workers=2):
+        self.fresh_seconds = fresh_seconds
+        self.stale_seconds = stale_seconds
+        self.max_size = max_size
+        self.refresh_workers = refresh_workers
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.errors = 0
+
+    def _get_executor(self):
+        pid = os.getpid()
+        if self._executor is None or self._pid != pid:
+            self._executor = ThreadPoolExecutor(max_workers=self.refresh_workers, thread_name_prefix='snapshot-refresh')
+            self._refreshing = set()
+            self._pid = pid
+        return self._executor
+
+    def get(self, key, load):
+        """Returns the snapshot for key, or None if load finds nothing"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None and now < entry['fresh_until']:
+            with self._lock:
+                self.hits += 1
+            return entry['value']
+        if entry is not None and now < entry['stale_until']:
+            with self._lock:
+                self.stale_hits += 1
+            self._refresh_in_background(key, load, entry['value'])
+            return entry['value']
+        with self._lock:
+            self.misses += 1
+        value = load(entry['value'] if entry is not None else None)
+        self._store(key, value)
+        return value
+
+    def _store(self, key, value):
+        with self._lock:
+            if value is None:
+                self._entries.pop(key, None)
+                return
+            now = time.monotonic()
+            fresh_until = now if value.get('partial') else now + self.fresh_seconds
+            self._entries[key] = {
+                'value': value,
+                'fresh_until': fresh_until,
+                'stale_until': fresh_until + self.stale_seconds
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _refresh_in_background(self, key, load, previous):
+        with self._lock:
+            executor = self._get_executor()
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            self.refreshes += 1
+        executor.submit(self._refresh, key, load, previous)
+
+    def _refresh(self, key, load, previous):
+        try:
+            self._store(key, load(previous))
+        except Exception as e:
+            print(f"Error refreshing chart snapshot {key}: {str(e)}")
+            with self._lock:
+                self.errors += 1
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def mark_stale(self, sources):
+        """Makes snapshots of the given data sources due for refresh on their next read"""
+        sources = set(sources)
+        now = time.monotonic()
+        with self._lock:
+            for entry in self._entries.values():
+                if entry['value'].get('source') in sources:
+                    entry['fresh_until'] = min(entry['fresh_until'], now)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'fresh_seconds': self.fresh_seconds,
+                'stale_seconds': self.stale_seconds,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'refreshes': self.refreshes,
+                'errors': self.errors
+            }
+
+public_snapshots = SnapshotCache(
+    fresh_seconds=float(os.getenv('PUBLIC_CHART_FRESH_SECONDS', '30')),
+    stale_seconds=float(os.getenv('PUBLIC_CHART_STALE_SECONDS', '600')),
+    max_size=int(os.getenv('PUBLIC_CHART_CACHE_SIZE', '1000'))
+)
+
+# Ingestion in this process refreshes embeds of the changed sources on their
+# next view; other processes notice the new version within fresh_seconds
+add_listener(public_snapshots.mark_stale)
@@ -0,0 +1,64 @@
+from flask import request
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/x-ndjson',
+    'text/csv',
+    'text/html',
+    'text/plain',
+}
+
+def available_encodings():
+    """Content codings this process can produce, most preferred first"""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+def compress(data, encoding, gzip_level=6, brotli_quality=4):
+    if encoding == 'br':
+        return brotli.compress(data, quality=brotli_quality)
+    return gzip.compress(data, compresslevel=gzip_level, mtime=0)
+
+def should_compress(response, min_bytes):
+    if request.method == 'HEAD' or not 200 <= response.status_code < 300 or response.status_code == 204:
+        return False
+    # Streams and files are sent as produced
+    if response.direct_passthrough or response.is_streamed:
+        return False
+    if 'Content-Encoding' in response.headers or 'no-transform' in response.headers.get('Cache-Control', ''):
+        return False
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return False
+    return (response.content_length or 0) >= min_bytes
+
+def init_compression(app):
+    """
+    Compresses buffered responses with brotli or gzip, whichever the client
+    prefers (brotli on ties, when installed). Responses vary on
+    Accept-Encoding, and strong ETags become weak since the bytes differ
+    from the identity encoding.
+    """
+    min_bytes = app.config.get('COMPRESS_MIN_BYTES', 1024)
+    gzip_level = app.config.get('COMPRESS_GZIP_LEVEL', 6)
+    brotli_quality = app.config.get('COMPRESS_BROTLI_QUALITY', 4)
+
+    @app.after_request
+    def compress_response(response):
+        response.vary.add('Accept-Encoding')
+        if not should_compress(response, min_bytes):
+            return response
+        encoding = request.accept_encodings.best_match(available_encodings())
+        if encoding is None:
+            return response
+        response.set_data(compress(response.get_data(), encoding, gzip_level, brotli_quality))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    return compress_response
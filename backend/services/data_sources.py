@@ -0,0 +1,48 @@
+from bson import ObjectId
+from datetime import datetime
+
+def get_or_create_data_sources(db, user_id, samples):
+    """
+    Returns {name: data_source} for the given source names, creating any
+    that don't exist yet. `samples` maps each name to an example record
+    used to seed the column list of a new source.
+    """
+    existing = {
+        source['name']: source
+        for source in db.data_sources.find({
+            'name': {'$in': list(samples)},
+            'user_id': ObjectId(user_id)
+        })
+    }
+    
+    missing = [name for name in samples if name not in existing]
+    if missing:
+        new_sources = [{
+            'name': name,
+            'description': 'Data source created via API',
+            'type': 'api',
+            'user_id': ObjectId(user_id),
+            'created_at': datetime.utcnow(),
+            'record_count': 0,
+            'columns': list(samples[name].keys()) if isinstance(samples[name], dict) else []
+        } for name in missing]
+        db.data_sources.insert_many(new_sources)
+        for source in new_sources:
+            existing[source['name']] = source
+    
+    return existing
+
+def resolve_data_sources(db, documents):
+    """
+    Fills in the data_source_id of raw_data documents queued without one,
+    creating the sources that don't exist yet, with one lookup per user.
+    """
+    samples = {}
+    for doc in documents:
+        if doc.get('data_source_id') is None:
+            samples.setdefault(doc['user_id'], {}).setdefault(doc['data_source'], doc['data'])
+    for user_id, user_samples in samples.items():
+        sources = get_or_create_data_sources(db, user_id, user_samples)
+        for doc in documents:
+            if doc.get('data_source_id') is None and doc['user_id'] == user_id:
+                doc['data_source_id'] = sources[doc['data_source']]['_id']
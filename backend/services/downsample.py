@@ -0,0 +1,93 @@
+import numbers
+import numpy as np
+
+DOWNSAMPLE_METHODS = ('lttb', 'minmax')
+
+def is_number(value):
+    return isinstance(value, numbers.Number) and not isinstance(value, bool)
+
+def series_x(keys):
+    """
+    X coordinates for a series: the keys themselves when all are numbers,
+    otherwise their positions (labels, or evenly spaced time buckets).
+    """
+    if keys and all(is_number(key) for key in keys):
+        return np.asarray(keys, dtype=float)
+    return np.arange(len(keys), dtype=float)
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: returns the indices of `threshold`
+    points that keep the visual shape of the series. The first and last
+    points are always kept; every bucket in between contributes the point
+    forming the largest triangle with the previously kept point and the
+    average of the next bucket. NaN values are only kept if a bucket has
+    nothing else.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    y = np.asarray(y, dtype=float)
+    # Bucket i covers edges[i]:edges[i + 1]; the first and last points stand alone
+    every = (n - 2) / (threshold - 2)
+    edges = (np.arange(threshold - 1) * every).astype(np.int64) + 1
+    edges[-1] = n - 1
+
+    # Average point of every bucket, computed in one pass
+    sizes = np.diff(edges)
+    finite = ~np.isnan(y)
+    x_means = np.add.reduceat(x[:n - 1], edges[:-1]) / sizes
+    y_sums = np.add.reduceat(np.where(finite, y, 0.0)[:n - 1], edges[:-1])
+    y_counts = np.add.reduceat(finite[:n - 1].astype(float), edges[:-1])
+    y_means = np.divide(y_sums, y_counts, out=np.full_like(y_sums, np.nan), where=y_counts > 0)
+    next_x = np.append(x_means[1:], x[n - 1])
+    next_y = np.append(y_means[1:], y[n - 1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        bx = x[start:end]
+        by = y[start:end]
+        area = np.abs((x[a] - next_x[i]) * (by - y[a]) - (x[a] - bx) * (next_y[i] - y[a]))
+        area = np.where(np.isnan(area), -1.0, area)
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+def min_max(x, y, threshold):
+    """
+    Keeps the minimum and maximum of each of threshold // 2 buckets, plus
+    the first and last points, so peaks and troughs always survive.
+    Returns the indices in series order.
+    """
+    n = len(x)
+    buckets = threshold // 2
+    if threshold >= n or buckets < 1:
+        return np.arange(n)
+
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    bucket_ids = np.repeat(np.arange(buckets), np.diff(edges))
+    starts = edges[:-1]
+    ends = edges[1:] - 1
+
+    # Sorting by (bucket, value) puts each bucket's min first and max last
+    by_min = np.lexsort((np.where(np.isnan(y), np.inf, y), bucket_ids))
+    by_max = np.lexsort((np.where(np.isnan(y), -np.inf, y), bucket_ids))
+    selected = np.concatenate(([0, n - 1], by_min[starts], by_max[ends]))
+    return np.unique(selected)
+
+def downsample(keys, values, target, method='lttb'):
+    """
+    Returns the indices of the points to keep from a series of (key, value)
+    pairs so that at most about `target` points remain.
+    """
+    x = series_x(keys)
+    y = np.array([value if is_number(value) else np.nan for value in values], dtype=float)
+    if method == 'minmax':
+        return min_max(x, y, target)
+    return lttb(x, y, target)
@@ -0,0 +1,165 @@
+import csv
+import io
+import numbers
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# format -> (mimetype, file extension, needs pyarrow)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv', False),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrow', True),
+    'parquet': ('application/vnd.apache.parquet', 'parquet', True),
+}
+
+def arrow_available():
+    return pa is not None
+
+def iter_row_batches(cursor, batch_size):
+    """Groups the `data` documents of a raw_data cursor into lists of batch_size"""
+    batch = []
+    try:
+        for record in cursor:
+            batch.append(record.get('data') or {})
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    finally:
+        cursor.close()
+
+def is_number(value):
+    return isinstance(value, numbers.Number) and not isinstance(value, bool)
+
+def resolve_columns(source, first_batch):
+    """
+    Returns (columns, numeric_columns) for an export. Uses the metadata stored
+    on the data source when present; otherwise infers both from the first
+    batch, treating a column as numeric when all of its values are numbers.
+    """
+    columns = list(source.get('columns') or [])
+    if not columns:
+        for row in first_batch:
+            for column in row:
+                if column not in columns:
+                    columns.append(column)
+
+    numeric_columns = source.get('numeric_columns')
+    if numeric_columns is None:
+        numeric_columns = [
+            column for column in columns
+            if all(is_number(row[column]) for row in first_batch if row.get(column) is not None)
+            and any(row.get(column) is not None for row in first_batch)
+        ]
+    return columns, set(numeric_columns)
+
+def to_float(value):
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def build_columns(rows, columns, numeric_columns):
+    """Turns one batch of row dicts into {column: list of values}"""
+    built = {}
+    for column in columns:
+        values = [row.get(column) for row in rows]
+        if column in numeric_columns:
+            built[column] = [to_float(value) for value in values]
+        else:
+            built[column] = [None if value is None else str(value) for value in values]
+    return built
+
+def export_csv(batches, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in batches:
+        for row in rows:
+            writer.writerow(['' if row.get(column) is None else row.get(column) for column in columns])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only when the source is empty
+    if buffer.tell():
+        yield buffer.getvalue()
+
+class ChunkSink(io.RawIOBase):
+    """Write-only file object that hands back whatever was written since the last take()"""
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def arrow_schema(columns, numeric_columns):
+    return pa.schema([
+        (column, pa.float64() if column in numeric_columns else pa.string())
+        for column in columns
+    ])
+
+def export_arrow(batches, columns, numeric_columns, file_format):
+    """
+    Writes each batch as one Arrow record batch (IPC stream) or one Parquet
+    row group, yielding the encoded bytes as they are produced.
+    """
+    schema = arrow_schema(columns, numeric_columns)
+    sink = ChunkSink()
+    if file_format == 'parquet':
+        writer = pq.ParquetWriter(sink, schema, compression='snappy')
+        write = lambda batch: writer.write_table(pa.Table.from_batches([batch], schema=schema))
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+        write = writer.write_batch
+
+    try:
+        for rows in batches:
+            write(pa.RecordBatch.from_pydict(build_columns(rows, columns, numeric_columns), schema=schema))
+            chunk = sink.take()
+            if chunk:
+                yield chunk
+    finally:
+        writer.close()
+    chunk = sink.take()
+    if chunk:
+        yield chunk
+
+def export_source(source, cursor, file_format, batch_size=5000):
+    """
+    Streams a data source in the requested format, building columns batch by
+    batch from the raw_data cursor so the whole source is never in memory.
+    """
+    batches = iter_row_batches(cursor, batch_size)
+    first_batch = next(batches, [])
+    columns, numeric_columns = resolve_columns(source, first_batch)
+
+    def all_batches():
+        if first_batch:
+            yield first_batch
+        yield from batches
+
+    if file_format == 'csv':
+        return export_csv(all_batches(), columns)
+    return export_arrow(all_batches(), columns, numeric_columns, file_format)
@@ -0,0 +1,59 @@
+from flask import request, current_app, make_response
+from werkzeug.http import http_date, quote_etag
+from datetime import timezone
+import hashlib
+import json
+
+def make_etag(*parts):
+    """
+    Strong validator for a response built from `parts` (ids, updated_at
+    stamps, source versions...). Equal inputs always give the same tag.
+    """
+    normalized = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+def to_utc(value):
+    """Naive UTC datetimes (as stored in Mongo) at the one-second precision of HTTP dates"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).replace(microsecond=0)
+
+def cache_headers(etag, last_modified=None):
+    """
+    Validators plus Cache-Control for an authenticated response. Browsers
+    keep it but revalidate on every use; nginx may microcache it for
+    HTTP_MICROCACHE_SECONDS (X-Accel-Expires overrides `private` there, and
+    nginx keys its cache on the Authorization header).
+    """
+    headers = {
+        'ETag': quote_etag(etag),
+        'Cache-Control': 'private, no-cache',
+        'Vary': 'Authorization'
+    }
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(to_utc(last_modified))
+    microcache = current_app.config.get('HTTP_MICROCACHE_SECONDS', 0)
+    if microcache:
+        headers['X-Accel-Expires'] = str(microcache)
+    return headers
+
+def no_store_headers():
+    """For responses that must not be revalidated later, like partial or sampled results"""
+    return {'Cache-Control': 'no-store', 'Vary': 'Authorization'}
+
+def is_not_modified(etag, last_modified=None):
+    """
+    True if the request's validators still match. If-None-Match wins over
+    If-Modified-Since when both are sent, and uses the weak comparison, so
+    tags weakened by gzip in nginx still match.
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since:
+        return to_utc(last_modified) <= request.if_modified_since
+    return False
+
+def not_modified(headers):
+    response = make_response('', 304)
+    response.headers.update(headers)
+    return response
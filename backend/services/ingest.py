@@ -0,0 +1,84 @@
+from datetime import datetime
+import os
+import pandas as pd
+from services.source_versions import bump_source_versions
+from services.rollups import apply_rollups, rebuild_rollups
+
+def dataframe_to_records(df):
+    """
+    Converts a DataFrame to a list of plain dicts with native Python values,
+    mapping NaN to None, without a JSON round trip.
+    """
+    if df.empty:
+        return []
+    return df.astype(object).where(df.notna(), None).to_dict(orient='records')
+
+def stream_size(fileobj):
+    """Returns the total size of a seekable stream, or None"""
+    try:
+        position = fileobj.tell()
+        fileobj.seek(0, os.SEEK_END)
+        size = fileobj.tell()
+        fileobj.seek(position)
+        return size
+    except (AttributeError, OSError, ValueError):
+        return None
+
+def ingest_csv(db, fileobj, data_source_id, data_source_name, user_id, chunksize=5000, on_progress=None):
+    """
+    Streams a CSV file into raw_data in bounded chunks.
+
+    Each chunk of `chunksize` rows is parsed, converted to records and
+    written with one insert_many, so memory use depends on the chunk size
+    and not on the file size. `on_progress(rows, bytes_read, bytes_total)`
+    is called after every chunk. Returns the row count and column metadata.
+    """
+    bytes_total = stream_size(fileobj)
+    columns = None
+    numeric_columns = None
+    rows = 0
+
+    for chunk in pd.read_csv(fileobj, chunksize=chunksize):
+        if columns is None:
+            columns = [str(column) for column in chunk.columns]
+
+        # A column is numeric only if it is numeric in every chunk
+        chunk_numeric = {str(column) for column in chunk.select_dtypes(include=['float64', 'int64']).columns}
+        numeric_columns = chunk_numeric if numeric_columns is None else numeric_columns & chunk_numeric
+
+        records = dataframe_to_records(chunk)
+        if records:
+            now = datetime.utcnow()
+            documents = [{
+                'data_source_id': data_source_id,
+                'data_source': data_source_name,
+                'timestamp': now,
+                'data': record,
+                'user_id': user_id
+            } for record in records]
+            db.raw_data.insert_many(documents, ordered=False)
+            apply_rollups(db, documents)
+            rows += len(records)
+
+        if on_progress:
+            try:
+                bytes_read = fileobj.tell()
+            except (AttributeError, OSError, ValueError):
+                bytes_read = None
+            on_progress(rows, bytes_read, bytes_total)
+
+    columns = columns or []
+    return {
+        'records': rows,
+        'columns': columns,
+        'numeric_columns': [column for column in columns if column in (numeric_columns or set())]
+    }
+
+def discard_partial_ingest(db, data_source_id):
+    """Removes a data source and whatever rows were written before a failure"""
+    source = db.data_sources.find_one({'_id': data_source_id}, {'name': 1})
+    db.raw_data.delete_many({'data_source_id': data_source_id})
+    db.data_sources.delete_one({'_id': data_source_id})
+    if source:
+        bump_source_versions(db, [source['name']])
+        rebuild_rollups(db, [source['name']])
@@ -0,0 +1,311 @@
+from services.serialization import dumps
+from services.spool import fsync_directory, lock_segment, new_owner
+from services.stream_sink import store_messages
+import atexit
+import fcntl
+import json
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+import zlib
+
+SEGMENT_PATTERN = re.compile(r'^wal-([0-9a-f]+)-(\d+)\.(log|sealed)$')
+
+# Frame header: payload length and CRC32. A zero length marks the end of
+# the written part of a preallocated segment.
+FRAME_HEADER = struct.Struct('<II')
+
+class LogFull(Exception):
+    pass
+
+def encode_frame(message):
+    payload = dumps(message)
+    return FRAME_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+def read_frames(data):
+    """Yields the messages of a segment, stopping at its end or at a torn frame"""
+    position = 0
+    while position + FRAME_HEADER.size <= len(data):
+        length, checksum = FRAME_HEADER.unpack_from(data, position)
+        start = position + FRAME_HEADER.size
+        payload = bytes(data[start:start + length])
+        if length == 0 or len(payload) < length or zlib.crc32(payload) != checksum:
+            return
+        yield json.loads(payload)
+        position = start + length
+
+class IngestLog:
+    """
+    Local write-ahead log for stream ingestion.
+
+    append() writes length-prefixed, checksummed frames into a memory-mapped,
+    preallocated segment and waits for the next group commit: a committer
+    thread msyncs the segment once for every append that arrived since the
+    previous sync, so concurrent requests share one fsync. Records are then
+    acknowledged before MongoDB has them.
+
+    Every `flush_interval` seconds a flusher thread seals the active
+    segment and writes the sealed segments to raw_data with
+    store_messages, deleting each segment once its insert succeeded.
+    The writer holds an flock on its active segment, and a flusher claims a
+    segment by taking its lock, which it keeps until the segment is gone.
+    The kernel drops the locks of a process that died, so its segments,
+    active one included, are stored by the next flush in any process and
+    records logged before a crash are stored after the restart. A segment
+    replayed after a partial insert only adds duplicates, which the unique
+    ingest_id index rejects.
+
+    Segments and threads belong to one process, as with the write-behind
+    buffer; segment names carry a random owner token, since pids repeat
+    across restarts. Appends raise LogFull once the directory holds about
+    `max_bytes`.
+    """
+    def __init__(self, directory, segment_bytes=16 * 1024 * 1024, max_bytes=1024 * 1024 * 1024,
+                 fsync=True, commit_timeout=5.0, flush_interval=1.0, batch_size=5000):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self.commit_timeout = commit_timeout
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._cond = threading.Condition()
+        self._sync_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = None
+        self._pid = None
+        self._owner = None
+        self._db = None
+        self._file = None
+        self._map = None
+        self._path = None
+        self._seq = 0
+        self._offset = 0
+        self._stored_bytes = 0
+        self._written = 0
+        self._committed = 0
+        self.appended = 0
+        self.commits = 0
+        self.flushed = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.errors = 0
+        self.refused = 0
+
+    def _scan(self):
+        """Returns the paths of the segment files in the directory"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.directory, name) for name in names if SEGMENT_PATTERN.match(name)]
+
+    def _refresh_size(self):
+        stored = 0
+        for path in self._scan():
+            if path == self._path:
+                continue
+            try:
+                stored += os.path.getsize(path)
+            except OSError:
+                pass
+        self._stored_bytes = stored
+
+    def _ensure_worker(self):
+        """Starts this process's committer and flusher. Call with the condition held."""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        # Segments and threads of a parent process are not ours to touch
+        self._file = self._map = self._path = None
+        self._offset = self._written = self._committed = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self._owner = new_owner()
+        self._seq = 0
+        self._refresh_size()
+        self._stop = threading.Event()
+        threading.Thread(target=self._commit_loop, args=(self._stop,), name='ingest-log-commit', daemon=True).start()
+        threading.Thread(target=self._flush_loop, args=(self._stop,), name='ingest-log-flush', daemon=True).start()
+        self._pid = pid
+
+    def start(self, db):
+        """Starts the background threads, replaying segments left by earlier processes"""
+        with self._cond:
+            self._db = db
+            self._ensure_worker()
+
+    def _open_segment(self):
+        self._seq += 1
+        self._path = os.path.join(self.directory, f'wal-{self._owner}-{self._seq:012d}.log')
+        self._file = open(self._path, 'w+b')
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        os.ftruncate(self._file.fileno(), self.segment_bytes)
+        self._map = mmap.mmap(self._file.fileno(), self.segment_bytes)
+        self._offset = 0
+        if self.fsync:
+            fsync_directory(self.directory)
+
+    def _seal(self):
+        """Syncs, trims and seals the active segment. Call with the condition held."""
+        if self._map is None:
+            return
+        with self._sync_lock:
+            self._map.flush()
+            self._map.close()
+        os.ftruncate(self._file.fileno(), self._offset)
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        os.rename(self._path, self._path[:-len('.log')] + '.sealed')
+        if self.fsync:
+            fsync_directory(self.directory)
+        # Closing releases the lock, making the segment claimable
+        self._file.close()
+        self._stored_bytes += self._offset
+        self._file = self._map = self._path = None
+        self._offset = 0
+
+    def append(self, db, messages):
+        """
+        Logs ingestion messages and waits for their group commit. Raises
+        LogFull when the log is at capacity and TimeoutError if the commit
+        did not happen within `commit_timeout`.
+        """
+        frames = [encode_frame(message) for message in messages]
+        size = sum(len(frame) for frame in frames)
+        if any(len(frame) > self.segment_bytes for frame in frames):
+            raise ValueError('Record is larger than an ingest log segment')
+        with self._cond:
+            self._ensure_worker()
+            self._db = db
+            if self._stored_bytes + self._offset + size > self.max_bytes:
+                self.refused += len(frames)
+                raise LogFull(f'Ingest log is full ({self.max_bytes} bytes)')
+            for frame in frames:
+                if self._map is not None and self._offset + len(frame) > self.segment_bytes:
+                    self._seal()
+                if self._map is None:
+                    self._open_segment()
+                self._map[self._offset:self._offset + len(frame)] = frame
+                self._offset += len(frame)
+            self._written += 1
+            self.appended += len(frames)
+            target = self._written
+            self._cond.notify_all()
+            if not self._cond.wait_for(lambda: self._committed >= target, self.commit_timeout):
+                raise TimeoutError('Timed out waiting for the ingest log to commit')
+
+    def _commit_loop(self, stop):
+        while not stop.is_set():
+            with self._cond:
+                self._cond.wait_for(lambda: self._written > self._committed or stop.is_set())
+                target = self._written
+                segment = self._map
+            if self.fsync and segment is not None:
+                with self._sync_lock:
+                    # A segment sealed meanwhile was synced by _seal
+                    if not segment.closed:
+                        segment.flush()
+            with self._cond:
+                self._committed = max(self._committed, target)
+                self.commits += 1
+                self._cond.notify_all()
+
+    def _flush_loop(self, stop):
+        while not stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing ingest log: {str(e)}")
+
+    def _claim_segments(self):
+        """Locks the segments no writer holds; returns [(path, file)], oldest first"""
+        claimed = []
+        for path in self._scan():
+            segment = lock_segment(path)
+            if segment is not None:
+                claimed.append((os.fstat(segment.fileno()).st_mtime, path, segment))
+        return [(path, segment) for _, path, segment in sorted(claimed, key=lambda item: item[:2])]
+
+    def flush(self):
+        """
+        Seals the active segment and stores every claimable segment in
+        raw_data. Returns the number of records stored.
+        """
+        with self._flush_lock:
+            with self._cond:
+                db = self._db
+                if db is None or self._pid != os.getpid():
+                    return 0
+                if self._offset:
+                    self._seal()
+                segments = self._claim_segments()
+            stored = 0
+            try:
+                for path, segment in segments:
+                    messages = list(read_frames(segment.read()))
+                    for start in range(0, len(messages), self.batch_size):
+                        counts = store_messages(db, messages[start:start + self.batch_size])
+                        with self._cond:
+                            self.flushed += counts['inserted']
+                            self.duplicates += counts['duplicates']
+                            self.failed += counts['failed']
+                        stored += counts['inserted']
+                    os.remove(path)
+            except Exception as e:
+                # Unlocked segments are stored by a later flush
+                print(f"Error storing ingest log segment {path}: {str(e)}")
+                with self._cond:
+                    self.errors += 1
+            finally:
+                for _, segment in segments:
+                    segment.close()
+            with self._cond:
+                self._refresh_size()
+            return stored
+
+    def close(self):
+        """Stops this process's threads and stores what is left in the log"""
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            self._stop.set()
+            self._cond.notify_all()
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Error flushing ingest log: {str(e)}")
+        with self._cond:
+            self._seal()
+            self._pid = None
+
+    def stats(self):
+        with self._cond:
+            return {
+                'directory': self.directory,
+                'bytes': self._stored_bytes + self._offset,
+                'max_bytes': self.max_bytes,
+                'appended': self.appended,
+                'commits': self.commits,
+                'pending_commit': self._written - self._committed,
+                'flushed': self.flushed,
+                'duplicates': self.duplicates,
+                'failed': self.failed,
+                'errors': self.errors,
+                'refused': self.refused
+            }
+
+ingest_log = IngestLog(
+    os.getenv('INGEST_LOG_DIR', os.path.join(tempfile.gettempdir(), 'ingest-log')),
+    segment_bytes=int(os.getenv('INGEST_LOG_SEGMENT_BYTES', str(16 * 1024 * 1024))),
+    max_bytes=int(os.getenv('INGEST_LOG_MAX_BYTES', str(1024 * 1024 * 1024))),
+    fsync=os.getenv('INGEST_LOG_FSYNC', 'true').lower() == 'true',
+    commit_timeout=float(os.getenv('INGEST_LOG_COMMIT_TIMEOUT_SECONDS', '5')),
+    flush_interval=float(os.getenv('INGEST_LOG_FLUSH_INTERVAL', '1.0')),
+    batch_size=int(os.getenv('INGEST_LOG_BATCH_SIZE', '5000'))
+)
+
+# Store what is still logged when a worker exits
+atexit.register(ingest_log.close)
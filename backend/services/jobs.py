@@ -0,0 +1,147 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+import os
+import threading
+
+class JobRunner:
+    """
+    Bounded per-process pool for background jobs.
+
+    At most `max_workers` jobs run at once and at most `max_pending` are
+    accepted (running plus queued); `submit` returns False beyond that so
+    the caller can push back instead of queueing without limit. The pool is
+    created lazily in each process, so it is never inherited across fork().
+    """
+    def __init__(self, max_workers=2, max_pending=8):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._pid = None
+        self._futures = set()
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _get_executor(self):
+        pid = os.getpid()
+        if self._executor is None or self._pid != pid:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='job')
+            self._futures = set()
+            self._pid = pid
+        return self._executor
+
+    def _done(self, future):
+        with self._lock:
+            self._futures.discard(future)
+            if future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            executor = self._get_executor()
+            if len(self._futures) >= self.max_pending:
+                self.rejected += 1
+                return False
+            future = executor.submit(fn, *args, **kwargs)
+            self._futures.add(future)
+            self.submitted += 1
+        future.add_done_callback(self._done)
+        return True
+
+    def drain(self, timeout=None):
+        """Waits for the jobs accepted so far to finish"""
+        with self._lock:
+            futures = list(self._futures)
+        wait(futures, timeout=timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'in_flight': len(self._futures),
+                'submitted': self.submitted,
+                'rejected': self.rejected,
+                'completed': self.completed,
+                'failed': self.failed
+            }
+
+job_runner = JobRunner(
+    max_workers=int(os.getenv('UPLOAD_JOB_WORKERS', '2')),
+    max_pending=int(os.getenv('UPLOAD_JOB_MAX_PENDING', '8'))
+)
+
+# A running job that has not reported progress for this long is shown as stalled
+JOB_STALL_SECONDS = int(os.getenv('JOB_STALL_SECONDS', '300'))
+
+def create_job(db, job_type, user_id, **fields):
+    """Inserts a queued job document and returns it"""
+    now = datetime.utcnow()
+    job = {
+        'type': job_type,
+        'status': 'queued',
+        'user_id': user_id,
+        'created_at': now,
+        'updated_at': now,
+        'started_at': None,
+        'finished_at': None,
+        'heartbeat_at': None,
+        'rows_processed': 0,
+        'bytes_processed': 0,
+        'bytes_total': None,
+        'errors': []
+    }
+    job.update(fields)
+    job['_id'] = db.jobs.insert_one(job).inserted_id
+    return job
+
+def update_job(db, job_id, **fields):
+    fields['updated_at'] = datetime.utcnow()
+    db.jobs.update_one({'_id': job_id}, {'$set': fields})
+
+def describe_job(job, now=None):
+    """Formats a job document with throughput and ETA for the API"""
+    now = now or datetime.utcnow()
+    status = job['status']
+    started_at = job.get('started_at')
+    finished_at = job.get('finished_at')
+    rows = job.get('rows_processed', 0)
+    bytes_processed = job.get('bytes_processed') or 0
+    bytes_total = job.get('bytes_total')
+
+    elapsed = None
+    rows_per_second = None
+    eta_seconds = None
+    if started_at:
+        elapsed = max(((finished_at or now) - started_at).total_seconds(), 0.0)
+        if elapsed > 0:
+            rows_per_second = round(rows / elapsed, 1)
+            if status == 'running' and bytes_total and bytes_processed:
+                bytes_per_second = bytes_processed / elapsed
+                eta_seconds = round(max(bytes_total - bytes_processed, 0) / bytes_per_second, 1)
+
+    heartbeat_at = job.get('heartbeat_at')
+    if status == 'running' and heartbeat_at and (now - heartbeat_at).total_seconds() > JOB_STALL_SECONDS:
+        status = 'stalled'
+
+    return {
+        'id': str(job['_id']),
+        'type': job['type'],
+        'status': status,
+        'created_at': job['created_at'].isoformat(),
+        'started_at': started_at.isoformat() if started_at else None,
+        'finished_at': finished_at.isoformat() if finished_at else None,
+        'rows_processed': rows,
+        'bytes_processed': bytes_processed,
+        'bytes_total': bytes_total,
+        'percent_complete': round(100.0 * bytes_processed / bytes_total, 1) if bytes_total else None,
+        'elapsed_seconds': round(elapsed, 1) if elapsed is not None else None,
+        'rows_per_second': rows_per_second,
+        'eta_seconds': eta_seconds,
+        'errors': job.get('errors', []),
+        'result': job.get('result')
+    }
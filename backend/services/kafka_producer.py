@@ -0,0 +1,304 @@
+from concurrent.futures import Future
+from kafka import KafkaProducer
+from services.circuit_breaker import CircuitBreaker
+from services.serialization import dumps
+from services.spool import DiskSpool, SpoolFull
+import atexit
+import os
+import queue
+import tempfile
+import threading
+import time
+
+# Result of a publish Future whose message went to the disk spool
+SPOOLED = 'spooled'
+
+def encode_key(key):
+    return key.encode('utf-8') if isinstance(key, str) else key
+
+def producer_options():
+    """Producer settings read from the environment"""
+    acks = os.getenv('KAFKA_ACKS', 'all')
+    compression = os.getenv('KAFKA_COMPRESSION_TYPE', 'gzip')
+    return {
+        'bootstrap_servers': os.getenv('KAFKA_BOOTSTRAP_SERVERS', 'localhost:9092'),
+        'api_version': (0, 10),
+        'acks': acks if acks == 'all' else int(acks),
+        # Records sent within linger_ms share one compressed batch per partition
+        'linger_ms': int(os.getenv('KAFKA_LINGER_MS', '20')),
+        'batch_size': int(os.getenv('KAFKA_BATCH_SIZE', '262144')),
+        'compression_type': None if compression == 'none' else compression,
+        'buffer_memory': int(os.getenv('KAFKA_BUFFER_MEMORY', '33554432')),
+        'max_block_ms': int(os.getenv('KAFKA_MAX_BLOCK_MS', '1000')),
+        'request_timeout_ms': int(os.getenv('KAFKA_REQUEST_TIMEOUT_MS', '10000')),
+        'retries': int(os.getenv('KAFKA_RETRIES', '5')),
+        'retry_backoff_ms': 200
+    }
+
+def create_kafka_producer():
+    return KafkaProducer(value_serializer=dumps, key_serializer=encode_key, **producer_options())
+
+class KafkaPublisher:
+    """
+    Asynchronous Kafka producer, one per process.
+
+    publish() puts the message on a bounded in-process queue and returns a
+    Future. A sender thread hands queued messages to the producer, whose I/O
+    thread batches and compresses them per partition. Delivery callbacks
+    resolve the Future and update the counters, so request threads never
+    wait on the broker, even while metadata is unavailable. When the queue
+    is full the message is dropped and its Future fails.
+
+    The producer and sender thread are created lazily and again whenever the
+    process id changes, so gunicorn workers never use a producer inherited
+    from the master across fork(). If the producer can't be created, sends
+    fail fast and creation is retried after `reconnect_seconds`.
+
+    Sends go through a circuit breaker. Once it trips, the sender stops
+    waiting on the broker: with a `spool`, messages are appended to it and
+    their Future resolves with SPOOLED, otherwise they fail straight away.
+    Messages published as `durable` are synced to the spool before their
+    Future resolves, so an acknowledgement built on SPOOLED survives a host
+    crash. A replay thread sends the spooled segments every
+    `replay_seconds` once the breaker lets calls through again. Replay is at-least-once; the
+    stream sink drops duplicates by ingest_id.
+    """
+    def __init__(self, factory=None, queue_size=10000, reconnect_seconds=30, breaker=None, spool=None, replay_seconds=5):
+        self.factory = factory or create_kafka_producer
+        self.queue_size = queue_size
+        self.reconnect_seconds = reconnect_seconds
+        self.breaker = breaker or CircuitBreaker()
+        self.spool = spool
+        self.replay_seconds = replay_seconds
+        self._lock = threading.Lock()
+        self._producer_lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self._replayer = None
+        self._stop = None
+        self._producer = None
+        self._retry_at = 0
+        self._reset_counters()
+
+    def _reset_counters(self):
+        self.queued = 0
+        self.delivered = 0
+        self.failed = 0
+        self.spooled = 0
+        self.dropped = 0
+
+    def _ensure_sender(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return self._queue
+        with self._lock:
+            if self._pid != pid:
+                # Nothing inherited from the parent is usable here
+                self._queue = queue.Queue(maxsize=self.queue_size)
+                self._producer = None
+                self._retry_at = 0
+                self._reset_counters()
+                self._thread = threading.Thread(target=self._run, args=(self._queue,), name='kafka-sender', daemon=True)
+                self._thread.start()
+                self._stop = threading.Event()
+                self._replayer = None
+                if self.spool is not None:
+                    self._replayer = threading.Thread(target=self._replay_loop, args=(self._stop,), name='kafka-replay', daemon=True)
+                    self._replayer.start()
+                self._pid = pid
+        return self._queue
+
+    def publish(self, topic, value, key=None, durable=False):
+        """Queues a message; returns a Future resolved with its RecordMetadata or SPOOLED"""
+        future = Future()
+        try:
+            self._ensure_sender().put_nowait((topic, key, value, durable, future))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            future.set_exception(BufferError('Kafka publish queue is full'))
+            return future
+        with self._lock:
+            self.queued += 1
+        return future
+
+    def _get_producer(self):
+        with self._producer_lock:
+            if self._producer is None and time.monotonic() >= self._retry_at:
+                try:
+                    self._producer = self.factory()
+                except Exception as e:
+                    print(f"Warning: Failed to create Kafka producer: {str(e)}")
+                if self._producer is None:
+                    self._retry_at = time.monotonic() + self.reconnect_seconds
+            return self._producer
+
+    def _run(self, messages):
+        while True:
+            item = messages.get()
+            try:
+                if item is None:
+                    return
+                topic, key, value, durable, future = item
+                message = (topic, key, value, durable)
+                if not self.breaker.allow():
+                    self._spool_or_fail(future, message, ConnectionError('Kafka circuit breaker is open'))
+                    continue
+                producer = self._get_producer()
+                if producer is None:
+                    self._on_error(future, message, ConnectionError('Kafka is unavailable'))
+                    continue
+                try:
+                    sent = producer.send(topic, value=value, key=key)
+                except Exception as e:
+                    self._on_error(future, message, e)
+                    continue
+                sent.add_callback(self._on_delivered, future)
+                sent.add_errback(self._on_error, future, message)
+            finally:
+                messages.task_done()
+
+    def _on_delivered(self, future, metadata):
+        self.breaker.record_success()
+        with self._lock:
+            self.delivered += 1
+        future.set_result(metadata)
+
+    def _on_error(self, future, message, error):
+        self.breaker.record_failure()
+        self._spool_or_fail(future, message, error)
+
+    def _spool_or_fail(self, future, message, error):
+        if self.spool is not None:
+            topic, key, value, durable = message
+            try:
+                self.spool.append(topic, key, value, sync=durable)
+            except SpoolFull as e:
+                with self._lock:
+                    self.dropped += 1
+                future.set_exception(BufferError(str(e)))
+                return
+            except OSError as e:
+                print(f"Error spooling Kafka message: {str(e)}")
+            else:
+                with self._lock:
+                    self.spooled += 1
+                future.set_result(SPOOLED)
+                return
+        with self._lock:
+            self.failed += 1
+        future.set_exception(error)
+
+    def _replay_loop(self, stop):
+        while not stop.wait(self.replay_seconds):
+            try:
+                self.replay()
+            except Exception as e:
+                print(f"Error replaying Kafka spool: {str(e)}")
+
+    def replay(self, timeout=10):
+        """
+        Sends the spooled segments, oldest first, while the breaker allows
+        it. A segment is deleted once all of its messages are acknowledged
+        and returned to the spool otherwise. Returns the number of messages
+        replayed.
+        """
+        if self.spool is None or self.breaker.state == CircuitBreaker.OPEN:
+            return 0
+        replayed = 0
+        segments = self.spool.claim_segments()
+        for position, path in enumerate(segments):
+            producer = None
+            if self.breaker.allow():
+                producer = self._get_producer()
+                if producer is None:
+                    self.breaker.record_failure()
+            if producer is None:
+                for remaining in segments[position:]:
+                    self.spool.release(remaining, False)
+                break
+            try:
+                sent = [producer.send(topic, value=value, key=key) for topic, key, value in self.spool.read(path)]
+                producer.flush(timeout=timeout)
+                for message in sent:
+                    message.get(timeout=timeout)
+            except Exception as e:
+                print(f"Error replaying Kafka spool segment {path}: {str(e)}")
+                self.breaker.record_failure()
+                for remaining in segments[position:]:
+                    self.spool.release(remaining, False)
+                break
+            self.breaker.record_success()
+            self.spool.release(path, True, len(sent))
+            replayed += len(sent)
+        return replayed
+
+    def flush(self, timeout=None):
+        """Waits until queued messages are handed to the producer and sent"""
+        if self._pid != os.getpid():
+            return
+        self._queue.join()
+        if self._producer is not None:
+            self._producer.flush(timeout=timeout)
+
+    def close(self, timeout=5):
+        """Flushes and stops this process's producer; a new one is created on next use"""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = None
+                return
+            messages, thread, producer = self._queue, self._thread, self._producer
+            self._pid = None
+        self._stop.set()
+        messages.put(None)
+        thread.join(timeout)
+        if self._replayer is not None:
+            self._replayer.join(timeout)
+        if producer is not None:
+            try:
+                producer.close(timeout=timeout)
+            except Exception as e:
+                print(f"Error closing Kafka producer: {str(e)}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pid': self._pid,
+                'connected': self._producer is not None,
+                'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+                'queued': self.queued,
+                'delivered': self.delivered,
+                'failed': self.failed,
+                'spooled': self.spooled,
+                'dropped': self.dropped,
+                'in_flight': self.queued - self.delivered - self.failed - self.spooled,
+                'breaker': self.breaker.stats(),
+                'spool': self.spool.stats() if self.spool is not None else None
+            }
+
+def create_spool():
+    """Disk spool from the environment; an empty KAFKA_SPOOL_DIR disables it"""
+    directory = os.getenv('KAFKA_SPOOL_DIR', os.path.join(tempfile.gettempdir(), 'kafka-spool'))
+    if not directory:
+        return None
+    return DiskSpool(
+        directory,
+        segment_bytes=int(os.getenv('KAFKA_SPOOL_SEGMENT_BYTES', str(16 * 1024 * 1024))),
+        max_bytes=int(os.getenv('KAFKA_SPOOL_MAX_BYTES', str(512 * 1024 * 1024))),
+        fsync=os.getenv('KAFKA_SPOOL_FSYNC', 'false').lower() == 'true'
+    )
+
+kafka_publisher = KafkaPublisher(
+    queue_size=int(os.getenv('KAFKA_PUBLISH_QUEUE_SIZE', '10000')),
+    reconnect_seconds=float(os.getenv('KAFKA_RECONNECT_SECONDS', '30')),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.getenv('KAFKA_BREAKER_FAILURES', '5')),
+        reset_timeout=float(os.getenv('KAFKA_BREAKER_RESET_SECONDS', '30'))
+    ),
+    spool=create_spool(),
+    replay_seconds=float(os.getenv('KAFKA_SPOOL_REPLAY_SECONDS', '5'))
+)
+
+# Deliver what is still queued when a worker exits
+atexit.register(kafka_publisher.close)
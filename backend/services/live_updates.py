@@ -0,0 +1,149 @@
+from services.source_versions import add_listener, get_source_versions
+import os
+import threading
+import time
+
+class Subscription:
+    """One live stream's view of a set of data sources"""
+    def __init__(self, hub, names, known, pending=None):
+        self.hub = hub
+        self.names = frozenset(names)
+        self.known = dict(known)
+        self._lock = threading.Lock()
+        self._changed = dict(pending or {})
+        self._ready = threading.Event()
+        if self._changed:
+            self._ready.set()
+
+    def _push(self, versions):
+        """Merges {name: version} changes; later versions of a source replace earlier ones"""
+        with self._lock:
+            self._changed.update(versions)
+            self._ready.set()
+
+    def wait(self, timeout=None):
+        """Returns {name: version} of the sources changed since the last call; {} on timeout"""
+        self._ready.wait(timeout)
+        with self._lock:
+            changed, self._changed = self._changed, {}
+            self._ready.clear()
+        return changed
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+class LiveUpdateHub:
+    """
+    Fans data source version changes out to live dashboard streams.
+
+    One watcher thread per process reads the versions of every source with
+    a subscriber every `poll_interval` seconds, so ingestion by other
+    workers, the stream sink or the ingest log flusher is picked up too.
+    bump_source_versions in this process wakes it early. After a wake-up it
+    waits `debounce_seconds` before reading, so a burst of writes costs one
+    read. Each subscription gets one coalesced {name: version} per changed
+    source, however many times the source changed in between.
+    """
+    def __init__(self, poll_interval=2.0, debounce_seconds=0.5):
+        self.poll_interval = poll_interval
+        self.debounce_seconds = debounce_seconds
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._subscriptions = set()
+        self._db = None
+        self._thread = None
+        self._pid = None
+        self.polls = 0
+        self.updates = 0
+        self.errors = 0
+
+    def _ensure_watcher(self):
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid:
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == pid:
+                return
+            if self._pid != pid:
+                # Streams of a parent process are not served here
+                self._subscriptions = set()
+            self._pid = pid
+            self._thread = threading.Thread(target=self._run, name='live-updates', daemon=True)
+            self._thread.start()
+
+    def subscribe(self, db, names, known=None):
+        """
+        Watches the named sources. `known` holds the versions the client
+        already has; sources that moved past them are reported on the first
+        wait().
+        """
+        current = get_source_versions(db, names)
+        known = {name: (known or {}).get(name, version) for name, version in current.items()}
+        pending = {name: version for name, version in current.items() if known[name] != version}
+        subscription = Subscription(self, current, dict(known, **pending), pending)
+        self._ensure_watcher()
+        with self._lock:
+            self._db = db
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def notify(self, names):
+        """Source version listener: wakes the watcher"""
+        if self._subscriptions:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            if self._wake.wait(self.poll_interval):
+                self._wake.clear()
+                time.sleep(self.debounce_seconds)
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error polling source versions: {str(e)}")
+                with self._lock:
+                    self.errors += 1
+
+    def poll(self):
+        """Reads the watched versions and pushes changes to subscriptions"""
+        with self._lock:
+            db = self._db
+            subscriptions = list(self._subscriptions)
+        if db is None or not subscriptions:
+            return
+        versions = get_source_versions(db, set().union(*(s.names for s in subscriptions)))
+        updates = 0
+        for subscription in subscriptions:
+            changed = {
+                name: versions[name] for name in subscription.names
+                if versions[name] != subscription.known.get(name)
+            }
+            if changed:
+                subscription.known.update(changed)
+                subscription._push(changed)
+                updates += 1
+        with self._lock:
+            self.polls += 1
+            self.updates += updates
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': len(self._subscriptions),
+                'sources': len(set().union(*(s.names for s in self._subscriptions))),
+                'polls': self.polls,
+                'updates': self.updates,
+                'errors': self.errors
+            }
+
+live_updates = LiveUpdateHub(
+    poll_interval=float(os.getenv('LIVE_UPDATE_POLL_SECONDS', '2')),
+    debounce_seconds=float(os.getenv('LIVE_UPDATE_DEBOUNCE_SECONDS', '0.5'))
+)
+
+# Ingestion in this process is pushed without waiting for the next poll
+add_listener(live_updates.notify)
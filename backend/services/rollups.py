@@ -0,0 +1,335 @@
+from bson import ObjectId
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from services.jobs import job_runner
+import numbers
+import os
+import threading
+import time
+
+# Chart aggregates that can be answered from sum/count/min/max rollups
+ROLLUP_AGGREGATES = ('sum', 'avg', 'count', 'min', 'max')
+
+# How long each process may use its cached list of rollup specs. A new spec
+# only counts rows from this far in the future, so every process has seen
+# it before the first row it must count is written.
+ROLLUP_SPEC_CACHE_SECONDS = float(os.getenv('ROLLUP_SPEC_CACHE_SECONDS', '5'))
+
+_spec_cache = {}
+_spec_cache_lock = threading.Lock()
+
+def spec_id(data_source, group_by, measure):
+    return f'{data_source}:{group_by}:{measure}'
+
+def wants_rollup(chart):
+    config = chart.get('config') or {}
+    return bool(
+        config.get('rollup')
+        and chart.get('data_source')
+        and config.get('group_by')
+        and config.get('measure')
+        and config.get('aggregate') in ROLLUP_AGGREGATES
+        # Rollups cover all time, so time-filtered charts read raw data, and
+        # sampled previews need the per-group spread only raw rows give
+        and not any(config.get(key) for key in ('time_bucket', 'range', 'from', 'to', 'sample'))
+    )
+
+def chart_spec_id(chart):
+    config = chart['config']
+    return spec_id(chart['data_source'], config['group_by'], config['measure'])
+
+def get_path(data, path):
+    """Reads a dotted field path from a row, like $data.<path> in a pipeline"""
+    value = data
+    for part in path.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+def is_number(value):
+    return isinstance(value, numbers.Number) and not isinstance(value, bool)
+
+def accumulate(totals, group, value):
+    """
+    Folds one row into totals[group]. `count` counts rows (like $sum: 1);
+    sum/min/max and `value_count` only see numeric values, matching how
+    $sum/$avg/$min/$max ignore non-numeric fields.
+    """
+    entry = totals.setdefault(group, {'count': 0, 'value_count': 0, 'sum': 0, 'min': None, 'max': None})
+    entry['count'] += 1
+    if is_number(value):
+        entry['value_count'] += 1
+        entry['sum'] += value
+        entry['min'] = value if entry['min'] is None else min(entry['min'], value)
+        entry['max'] = value if entry['max'] is None else max(entry['max'], value)
+
+def merge_totals(db, spec, totals):
+    """Adds totals into the spec's current rollup documents with one bulk upsert"""
+    if not totals:
+        return
+    operations = []
+    for group, entry in totals.items():
+        update = {'$inc': {'count': entry['count'], 'value_count': entry['value_count'], 'sum': entry['sum']}}
+        if entry['min'] is not None:
+            update['$min'] = {'min': entry['min']}
+            update['$max'] = {'max': entry['max']}
+        operations.append(UpdateOne(
+            {'spec_id': spec['_id'], 'generation': spec['generation'], 'group': group},
+            update,
+            upsert=True
+        ))
+    db.rollups.bulk_write(operations, ordered=False)
+
+def get_specs_for_sources(db, names):
+    """Returns {data_source: [specs]}, cached per process for ROLLUP_SPEC_CACHE_SECONDS"""
+    now = time.monotonic()
+    specs = {}
+    missing = []
+    with _spec_cache_lock:
+        for name in names:
+            cached = _spec_cache.get(name)
+            if cached and cached[0] > now:
+                specs[name] = cached[1]
+            else:
+                missing.append(name)
+    if missing:
+        found = {name: [] for name in missing}
+        for spec in db.rollup_specs.find({'data_source': {'$in': missing}}):
+            found[spec['data_source']].append(spec)
+        with _spec_cache_lock:
+            for name, name_specs in found.items():
+                _spec_cache[name] = (now + ROLLUP_SPEC_CACHE_SECONDS, name_specs)
+        specs.update(found)
+    return specs
+
+def clear_spec_cache():
+    with _spec_cache_lock:
+        _spec_cache.clear()
+
+def apply_rollups(db, documents):
+    """
+    Updates the rollups of every spec on the sources of freshly inserted
+    raw_data documents. Rows older than a spec's watermark are left to its
+    backfill, so each row is counted exactly once.
+    """
+    if not documents:
+        return
+    specs = get_specs_for_sources(db, {doc['data_source'] for doc in documents})
+    for name, name_specs in specs.items():
+        for spec in name_specs:
+            totals = {}
+            for doc in documents:
+                if doc['data_source'] != name or '_id' not in doc or doc['_id'] < spec['watermark']:
+                    continue
+                data = doc.get('data') or {}
+                accumulate(totals, get_path(data, spec['group_by']), get_path(data, spec['measure']))
+            try:
+                merge_totals(db, spec, totals)
+            except Exception as e:
+                print(f"Error updating rollup {spec['_id']}: {str(e)}")
+
+def new_generation():
+    # Unique per registration, so rows that writers still holding a removed
+    # spec add later are never read as those of a spec registered again
+    return int(time.time() * 1000)
+
+def new_watermark():
+    # ObjectId timestamps have whole-second resolution, hence the extra second
+    return ObjectId.from_datetime(datetime.utcnow() + timedelta(seconds=ROLLUP_SPEC_CACHE_SECONDS + 1))
+
+def backfill_rollup(db, rollup_id, generation):
+    """
+    Folds every row below the watermark into the rollup, then marks it
+    ready. Superseded generations are removed once this one is ready.
+    """
+    # Claim the spec so a backfill scheduled twice only runs once
+    spec = db.rollup_specs.find_one_and_update(
+        {'_id': rollup_id, 'generation': generation, 'status': 'pending'},
+        {'$set': {'status': 'building'}}
+    )
+    if not spec:
+        return
+    # Wait until rows past the watermark can no longer be missed by ingest
+    delay = (spec['watermark'].generation_time.replace(tzinfo=None) - datetime.utcnow()).total_seconds()
+    if delay > 0:
+        time.sleep(delay)
+
+    try:
+        totals = {}
+        cursor = db.raw_data.find(
+            {'data_source': spec['data_source'], '_id': {'$lt': spec['watermark']}},
+            {'data': 1}
+        ).batch_size(5000)
+        for doc in cursor:
+            data = doc.get('data') or {}
+            accumulate(totals, get_path(data, spec['group_by']), get_path(data, spec['measure']))
+        merge_totals(db, spec, totals)
+
+        result = db.rollup_specs.update_one(
+            {'_id': rollup_id, 'generation': generation},
+            {'$set': {'status': 'ready', 'ready_at': datetime.utcnow()}}
+        )
+        if result.matched_count == 0:
+            # Removed or rebuilt while this generation was being built
+            db.rollups.delete_many({'spec_id': rollup_id, 'generation': generation})
+            return
+        db.rollups.delete_many({'spec_id': rollup_id, 'generation': {'$lt': generation}})
+        print(f"Rollup {rollup_id} ready with {len(totals)} groups")
+    except Exception as e:
+        print(f"Error building rollup {rollup_id}: {str(e)}")
+        db.rollup_specs.update_one(
+            {'_id': rollup_id, 'generation': generation},
+            {'$set': {'status': 'failed', 'error': str(e)}}
+        )
+        raise
+
+def schedule_backfill(db, spec):
+    # When the runner is full the spec stays pending and is scheduled
+    # again the next time a dashboard using it is saved
+    if not job_runner.submit(backfill_rollup, db, spec['_id'], spec['generation']):
+        print(f"Job runner full, rollup {spec['_id']} left pending")
+
+def register_rollups(db, charts):
+    """
+    Creates a rollup spec for every chart that opts in with config.rollup,
+    and schedules a backfill for new specs and ones whose backfill never ran.
+    """
+    specs = {}
+    for chart in charts:
+        if wants_rollup(chart):
+            specs[chart_spec_id(chart)] = chart
+    failed = []
+    for rollup_id, chart in specs.items():
+        config = chart['config']
+        spec = {
+            '_id': rollup_id,
+            'data_source': chart['data_source'],
+            'group_by': config['group_by'],
+            'measure': config['measure'],
+            'generation': new_generation(),
+            'watermark': new_watermark(),
+            'status': 'pending',
+            'created_at': datetime.utcnow()
+        }
+        try:
+            db.rollup_specs.insert_one(spec)
+        except DuplicateKeyError:
+            spec = db.rollup_specs.find_one({'_id': rollup_id})
+            if spec['status'] == 'failed':
+                failed.append(spec)
+            if spec['status'] != 'pending':
+                continue
+        clear_spec_cache()
+        schedule_backfill(db, spec)
+    if failed:
+        # A failed backfill may have merged part of its totals; start over
+        rebuild_rollups(db, specs=failed)
+
+def prune_rollups(db, charts):
+    """
+    Schedules the removal of the specs of `charts`, the charts a save or
+    delete removed or changed, that no saved chart uses anymore.
+    """
+    spec_ids = {chart_spec_id(chart) for chart in charts if wants_rollup(chart)}
+    if spec_ids and not job_runner.submit(remove_unused_rollups, db, spec_ids, datetime.utcnow()):
+        # Left in place; the next save or delete of a chart using them retries
+        print(f"Job runner full, unused rollups {sorted(spec_ids)} left in place")
+
+def remove_unused_rollups(db, spec_ids, requested_at):
+    """
+    Deletes the given specs unless a saved chart still uses them, then
+    their rollups. Specs created after the prune was requested are kept,
+    since the save that registered them may not have been read here.
+    """
+    specs = list(db.rollup_specs.find({'_id': {'$in': list(spec_ids)}}))
+    sources = list({spec['data_source'] for spec in specs})
+    used = {
+        chart_spec_id(chart)
+        for dashboard in db.dashboards.find(
+            {'charts': {'$elemMatch': {'data_source': {'$in': sources}, 'config.rollup': True}}},
+            {'charts': 1}
+        )
+        for chart in dashboard.get('charts', []) if wants_rollup(chart)
+    }
+    removed = [
+        spec for spec in specs
+        if spec['_id'] not in used and spec['created_at'] < requested_at
+        and db.rollup_specs.delete_one({'_id': spec['_id'], 'generation': spec['generation']}).deleted_count
+    ]
+    if not removed:
+        return
+    clear_spec_cache()
+    # Other processes add rows until their cached specs expire
+    time.sleep(ROLLUP_SPEC_CACHE_SECONDS + 1)
+    for spec in removed:
+        db.rollups.delete_many({'spec_id': spec['_id'], 'generation': {'$lte': spec['generation']}})
+    print(f"Removed unused rollups {[spec['_id'] for spec in removed]}")
+
+def rebuild_rollups(db, names=None, specs=None):
+    """
+    Starts a new generation for the rollups of sources whose rows were
+    deleted, since deletes cannot be subtracted from min/max. Charts fall
+    back to raw queries until the rebuild is ready.
+    """
+    if specs is None:
+        specs = list(db.rollup_specs.find({'data_source': {'$in': list(names)}}))
+    for spec in specs:
+        generation = spec['generation'] + 1
+        watermark = new_watermark()
+        db.rollup_specs.update_one(
+            {'_id': spec['_id']},
+            {'$set': {'generation': generation, 'watermark': watermark, 'status': 'pending'}}
+        )
+        spec.update({'generation': generation, 'watermark': watermark})
+        schedule_backfill(db, spec)
+    clear_spec_cache()
+
+def rollup_value(rollup, aggregate):
+    if aggregate == 'count':
+        return rollup['count']
+    if aggregate == 'sum':
+        return rollup['sum']
+    if aggregate == 'avg':
+        return rollup['sum'] / rollup['value_count'] if rollup['value_count'] else None
+    return rollup.get(aggregate)
+
+def read_rollups(db, charts):
+    """
+    Returns {chart index: rows} for charts whose rollup is ready, in the
+    shape the aggregation pipeline produces (top 20 groups by value, or
+    every group in key order for line charts).
+    """
+    wanted = {index: chart_spec_id(chart) for index, chart in enumerate(charts) if wants_rollup(chart)}
+    if not wanted:
+        return {}
+    ready = {
+        spec['_id']: spec['generation']
+        for spec in db.rollup_specs.find({'_id': {'$in': list(set(wanted.values()))}, 'status': 'ready'})
+    }
+    if not ready:
+        return {}
+
+    by_spec = {rollup_id: [] for rollup_id in ready}
+    for rollup in db.rollups.find({'spec_id': {'$in': list(ready)}}):
+        if rollup['generation'] == ready[rollup['spec_id']]:
+            by_spec[rollup['spec_id']].append(rollup)
+
+    results = {}
+    for index, rollup_id in wanted.items():
+        if rollup_id not in ready:
+            continue
+        aggregate = charts[index]['config']['aggregate']
+        rows = [{'_id': rollup['group'], 'value': rollup_value(rollup, aggregate)} for rollup in by_spec[rollup_id]]
+        if charts[index].get('type') == 'line':
+            # Line charts plot every group in key order
+            try:
+                rows.sort(key=lambda row: (row['_id'] is None, row['_id']))
+            except TypeError:
+                rows.sort(key=lambda row: str(row['_id']))
+            results[index] = rows
+        else:
+            rows.sort(key=lambda row: (row['value'] is None, -(row['value'] or 0), str(row['_id'])))
+            results[index] = rows[:20]
+    return results
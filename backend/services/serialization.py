@@ -0,0 +1,49 @@
+from flask import make_response
+from bson import ObjectId
+from datetime import date, datetime
+import json
+import numbers
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def default(value):
+    """
+    Encodes what the JSON encoder has no native support for. ObjectIds
+    become their hex string; datetimes (native to orjson) become ISO 8601
+    strings, exactly like .isoformat().
+    """
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if hasattr(value, 'item') and callable(value.item):
+        # NumPy scalars
+        return value.item()
+    if isinstance(value, numbers.Number):
+        return float(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(data):
+        """Serializes data to compact UTF-8 JSON bytes"""
+        return orjson.dumps(data, default=default, option=ORJSON_OPTIONS)
+else:
+    def dumps(data):
+        """Serializes data to compact UTF-8 JSON bytes"""
+        return json.dumps(data, default=default, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+def output_json(data, code, headers=None):
+    """flask-restx representation for application/json using dumps"""
+    response = make_response(dumps(data), code)
+    response.headers.extend(headers or {})
+    response.mimetype = 'application/json'
+    return response
+
+def init_json(api):
+    """Makes a flask-restx Api serialize responses with output_json"""
+    api.representations['application/json'] = output_json
@@ -0,0 +1,49 @@
+from pymongo import UpdateOne
+from datetime import datetime
+
+# Callbacks run in-process after a source version is bumped
+_listeners = []
+
+def add_listener(callback):
+    """Registers callback(names) to run after data source versions change"""
+    _listeners.append(callback)
+
+def bump_source_versions(db, names):
+    """
+    Increments the version counter of each data source name. Called by every
+    path that changes the rows behind a source, so anything derived from a
+    (source, version) pair can be treated as immutable.
+    """
+    names = sorted({name for name in names if name})
+    if not names:
+        return
+    now = datetime.utcnow()
+    db.source_versions.bulk_write([
+        UpdateOne(
+            {'_id': name},
+            {'$inc': {'version': 1}, '$set': {'updated_at': now}},
+            upsert=True
+        )
+        for name in names
+    ], ordered=False)
+    for callback in list(_listeners):
+        try:
+            callback(names)
+        except Exception as e:
+            print(f"Error in source version listener: {str(e)}")
+
+def get_source_states(db, names):
+    """
+    Returns {name: {'version': n, 'updated_at': datetime or None}} for the
+    given data source names; sources never bumped are at version 0.
+    """
+    names = list({name for name in names if name})
+    states = {name: {'version': 0, 'updated_at': None} for name in names}
+    if names:
+        for doc in db.source_versions.find({'_id': {'$in': names}}, {'version': 1, 'updated_at': 1}):
+            states[doc['_id']] = {'version': doc.get('version', 0), 'updated_at': doc.get('updated_at')}
+    return states
+
+def get_source_versions(db, names):
+    """Returns {name: version} for the given data source names"""
+    return {name: state['version'] for name, state in get_source_states(db, names).items()}
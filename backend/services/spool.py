@@ -0,0 +1,207 @@
+from services.serialization import dumps
+import fcntl
+import json
+import os
+import re
+import secrets
+import threading
+
+SEGMENT_PATTERN = re.compile(r'^spool-([0-9a-f]+)-(\d+)\.(open|ndjson)$')
+
+class SpoolFull(Exception):
+    pass
+
+def new_owner():
+    """Segment name prefix unique to one process, unlike pids reused after a restart"""
+    return secrets.token_hex(8)
+
+def lock_segment(path):
+    """
+    Opens a segment and takes its exclusive flock without waiting. Returns
+    the open file, or None if another process holds the lock or the segment
+    is gone. The kernel releases a lock when its holder exits, however it
+    exits, so an unlocked segment never belongs to a live writer.
+    """
+    try:
+        segment = open(path, 'r+b')
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(segment.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # The previous holder may have deleted it before releasing the lock
+        if os.fstat(segment.fileno()).st_ino != os.stat(path).st_ino:
+            raise FileNotFoundError(path)
+    except (BlockingIOError, FileNotFoundError):
+        segment.close()
+        return None
+    return segment
+
+def fsync_directory(directory):
+    """Makes created, renamed and deleted segment names durable"""
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class DiskSpool:
+    """
+    Bounded, segment-rotated local spool for Kafka messages that could not
+    be sent.
+
+    Each process appends NDJSON lines ({topic, key, value}) to its own open
+    segment, spool-<owner>-<seq>.open, and holds an flock on it while it
+    writes. A segment is sealed (renamed to .ndjson) once it reaches
+    `segment_bytes`, and before a replay. Replay claims every segment whose
+    lock it can take: sealed ones, and open ones whose writer has exited.
+    It keeps the lock until the segment is deleted or released, so every
+    segment is replayed by one process only. Appends are refused with
+    SpoolFull once the directory holds about `max_bytes`. Appends made with
+    `sync`, or every append with `fsync`, are synced to disk before
+    append() returns; others survive a process crash but not a host crash.
+    """
+    def __init__(self, directory, segment_bytes=16 * 1024 * 1024, max_bytes=512 * 1024 * 1024, fsync=False):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._pid = None
+        self._owner = None
+        self._file = None
+        self._path = None
+        self._seq = 0
+        self._claimed = {}
+        self._open_bytes = 0
+        self._sealed_bytes = 0
+        self._segments = 0
+        self.appended = 0
+        self.replayed = 0
+        self.refused = 0
+
+    def _scan(self):
+        """Returns the paths of the segment files in the directory"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.directory, name) for name in names if SEGMENT_PATTERN.match(name)]
+
+    def _refresh_size(self):
+        sealed_bytes = 0
+        segments = 0
+        for path in self._scan():
+            if path == self._path:
+                continue
+            try:
+                sealed_bytes += os.path.getsize(path)
+                segments += 1
+            except OSError:
+                pass
+        self._sealed_bytes = sealed_bytes
+        self._segments = segments
+
+    def _reset_for_process(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            # Never write through a handle or lock inherited across fork()
+            self._file = None
+            self._path = None
+            self._claimed = {}
+            self._open_bytes = 0
+            self._seq = 0
+            self._owner = new_owner()
+            os.makedirs(self.directory, exist_ok=True)
+            self._pid = pid
+            self._refresh_size()
+
+    def _seal(self):
+        if self._file is None:
+            return
+        os.rename(self._path, self._path[:-len('.open')] + '.ndjson')
+        if self.fsync:
+            fsync_directory(self.directory)
+        # Closing releases the lock, making the segment claimable
+        self._file.close()
+        self._file = None
+        self._path = None
+        self._sealed_bytes += self._open_bytes
+        self._segments += 1
+        self._open_bytes = 0
+
+    def append(self, topic, key, value, sync=False):
+        line = dumps({'topic': topic, 'key': key, 'value': value}) + b'\n'
+        with self._lock:
+            self._reset_for_process()
+            if self._sealed_bytes + self._open_bytes + len(line) > self.max_bytes:
+                self.refused += 1
+                raise SpoolFull(f'Kafka spool is full ({self.max_bytes} bytes)')
+            if self._file is None:
+                self._seq += 1
+                self._path = os.path.join(self.directory, f'spool-{self._owner}-{self._seq:012d}.open')
+                self._file = open(self._path, 'ab')
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+                fsync_directory(self.directory)
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync or sync:
+                os.fsync(self._file.fileno())
+            self._open_bytes += len(line)
+            self.appended += 1
+            if self._open_bytes >= self.segment_bytes:
+                self._seal()
+
+    def claim_segments(self):
+        """
+        Seals this process's open segment and claims every segment ready for
+        replay. Returns the claimed paths, oldest first.
+        """
+        with self._lock:
+            self._reset_for_process()
+            self._seal()
+            claimed = []
+            for path in self._scan():
+                if path in self._claimed:
+                    continue
+                segment = lock_segment(path)
+                if segment is None:
+                    continue
+                self._claimed[path] = segment
+                claimed.append((os.fstat(segment.fileno()).st_mtime, path))
+            return [path for _, path in sorted(claimed)]
+
+    def read(self, path):
+        """Yields the (topic, key, value) messages of a claimed segment"""
+        with open(path, 'rb') as segment:
+            for line in segment:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    # A torn write from a crash mid-append
+                    continue
+                yield message['topic'], message.get('key'), message['value']
+
+    def release(self, path, replayed, count=0):
+        """Deletes a replayed segment, or unlocks it for a later replay"""
+        with self._lock:
+            segment = self._claimed.pop(path)
+            if replayed:
+                os.remove(path)
+                self.replayed += count
+            segment.close()
+            self._refresh_size()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'directory': self.directory,
+                'segments': self._segments + (1 if self._file is not None else 0),
+                'bytes': self._sealed_bytes + self._open_bytes,
+                'max_bytes': self.max_bytes,
+                'appended': self.appended,
+                'replayed': self.replayed,
+                'refused': self.refused
+            }
@@ -0,0 +1,216 @@
+from bson import ObjectId
+from bson.errors import InvalidId
+from datetime import datetime
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+from services.source_versions import bump_source_versions
+from services.rollups import apply_rollups
+from services.data_sources import resolve_data_sources
+import threading
+import time
+
+# Topic the API appends stream records to in kafka ingest mode
+INGEST_TOPIC = 'data_ingestion'
+
+DUPLICATE_KEY = 11000
+
+def to_message(document, ingest_id):
+    """
+    Wire form of a raw_data document on the ingestion topic. Documents
+    queued by the API carry only the source name; the sink resolves it.
+    """
+    message = {
+        'ingest_id': ingest_id,
+        'data_source': document['data_source'],
+        'user_id': str(document['user_id']),
+        'timestamp': document['timestamp'].isoformat(),
+        'data': document['data']
+    }
+    if document.get('data_source_id') is not None:
+        message['data_source_id'] = str(document['data_source_id'])
+    return message
+
+def to_document(message):
+    """
+    raw_data document for an ingestion message. Raises ValueError for
+    messages the sink can't write, and returns None for the older fan-out
+    messages without an ingest_id, which are already stored.
+    """
+    if not isinstance(message, dict) or 'ingest_id' not in message:
+        return None
+    try:
+        return {
+            'data_source_id': ObjectId(message['data_source_id']) if message.get('data_source_id') else None,
+            'data_source': message['data_source'],
+            'timestamp': datetime.fromisoformat(message['timestamp']),
+            'data': message['data'],
+            'user_id': ObjectId(message['user_id']),
+            'ingest_id': message['ingest_id']
+        }
+    except (KeyError, TypeError, ValueError, InvalidId) as e:
+        raise ValueError(f'Invalid ingestion message: {str(e)}')
+
+# Set on rows whose rollup, record count and version updates haven't run yet
+EFFECTS_PENDING = 'effects_pending'
+
+def store_messages(db, messages):
+    """
+    Writes ingestion messages to raw_data with one unordered insert_many,
+    folds them into rollups and source record counts, and bumps the source
+    versions. Messages already stored are rejected by the unique ingest_id
+    index and counted as duplicates, so a batch can safely be written again.
+
+    Rows are inserted flagged EFFECTS_PENDING and the flag is cleared once
+    their updates have run. A batch that failed in between (say, during an
+    election) has its pending rows applied when it is delivered again, so
+    they are still counted once. Messages queued without a data_source_id
+    have their source looked up, or created, here rather than on the
+    request path.
+    """
+    documents = []
+    skipped = failed = 0
+    for message in messages:
+        try:
+            document = to_document(message)
+        except ValueError as e:
+            print(str(e))
+            failed += 1
+            continue
+        if document is None:
+            skipped += 1
+        else:
+            document[EFFECTS_PENDING] = True
+            documents.append(document)
+
+    rejected = set()
+    duplicate_ids = []
+    if documents:
+        resolve_data_sources(db, documents)
+        try:
+            db.raw_data.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            for write_error in e.details.get('writeErrors', []):
+                rejected.add(write_error['index'])
+                if write_error.get('code') == DUPLICATE_KEY:
+                    duplicate_ids.append(documents[write_error['index']]['ingest_id'])
+                else:
+                    print(f"Error storing ingestion message: {write_error.get('errmsg')}")
+                    failed += 1
+
+    inserted = [doc for position, doc in enumerate(documents) if position not in rejected]
+    # Redelivered rows an earlier attempt stored but never applied
+    recovered = list(db.raw_data.find({'ingest_id': {'$in': duplicate_ids}, EFFECTS_PENDING: True})) if duplicate_ids else []
+    applied = inserted + recovered
+    if applied:
+        apply_rollups(db, applied)
+        counts = {}
+        for doc in applied:
+            counts[doc['data_source_id']] = counts.get(doc['data_source_id'], 0) + 1
+        db.data_sources.bulk_write([
+            UpdateOne({'_id': source_id}, {'$inc': {'record_count': count}})
+            for source_id, count in counts.items()
+        ], ordered=False)
+        bump_source_versions(db, {doc['data_source'] for doc in applied})
+        try:
+            db.raw_data.update_many(
+                {'_id': {'$in': [doc['_id'] for doc in applied]}},
+                {'$unset': {EFFECTS_PENDING: ''}}
+            )
+        except OperationFailure as e:
+            # Time-series raw_data has no ingest_id index, so nothing is
+            # ever recovered there and the flag can stay
+            print(f"Could not clear {EFFECTS_PENDING}: {str(e)}")
+
+    return {
+        'inserted': len(inserted),
+        'duplicates': len(duplicate_ids),
+        'recovered': len(recovered),
+        'skipped': skipped,
+        'failed': failed
+    }
+
+class StreamSink:
+    """
+    Consumer-group worker draining the ingestion topic into raw_data.
+
+    Messages are gathered into batches of up to `batch_size` (or whatever
+    arrived within `max_wait_ms`). Each batch is written by store_messages;
+    only then are the consumer offsets committed. After a crash the
+    uncommitted tail is delivered again, and rows already written are
+    counted as duplicates instead of being stored twice; their updates are
+    applied then if the crash came before them.
+    """
+    def __init__(self, db, consumer, batch_size=5000, max_wait_ms=1000):
+        self.db = db
+        self.consumer = consumer
+        self.batch_size = batch_size
+        self.max_wait_ms = max_wait_ms
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.recovered = 0
+        self.skipped = 0
+        self.failed = 0
+        self.last_commit_at = None
+
+    def poll_batch(self):
+        """Collects up to batch_size messages, waiting at most max_wait_ms"""
+        messages = []
+        deadline = time.monotonic() + self.max_wait_ms / 1000.0
+        while len(messages) < self.batch_size:
+            remaining_ms = int((deadline - time.monotonic()) * 1000)
+            if remaining_ms <= 0:
+                break
+            polled = self.consumer.poll(timeout_ms=remaining_ms, max_records=self.batch_size - len(messages))
+            if not polled:
+                if messages:
+                    break
+                continue
+            for records in polled.values():
+                messages.extend(record.value for record in records)
+        return messages
+
+    def run_once(self):
+        """Writes and commits one batch; returns the number of messages consumed"""
+        messages = self.poll_batch()
+        if not messages:
+            return 0
+        self.write_batch(messages)
+        self.consumer.commit()
+        with self._lock:
+            self.last_commit_at = datetime.utcnow()
+        return len(messages)
+
+    def run(self, stop_event=None):
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                # Offsets are not committed, so the batch is consumed again
+                print(f"Error writing ingestion batch: {str(e)}")
+                stop_event.wait(1)
+
+    def write_batch(self, messages):
+        counts = store_messages(self.db, messages)
+        with self._lock:
+            self.batches += 1
+            self.inserted += counts['inserted']
+            self.duplicates += counts['duplicates']
+            self.recovered += counts['recovered']
+            self.skipped += counts['skipped']
+            self.failed += counts['failed']
+        return counts['inserted']
+
+    def stats(self):
+        with self._lock:
+            return {
+                'batches': self.batches,
+                'inserted': self.inserted,
+                'duplicates': self.duplicates,
+                'recovered': self.recovered,
+                'skipped': self.skipped,
+                'failed': self.failed,
+                'last_commit_at': self.last_commit_at.isoformat() if self.last_commit_at else None
+            }
@@ -0,0 +1,24 @@
+import heapq
+
+def top_group_totals(records, x_field, y_field, k=20):
+    """
+    Returns (labels, values) of the k groups with the largest sums, ties
+    broken by label. Keys are stringified and values coerced with float(),
+    anything non-numeric counting as 0.
+
+    A per-record loop: records arrive as decoded dicts, and pulling them
+    into NumPy/pandas columns costs more than summing them in place (see
+    benchmarks/transform_benchmark.py). Only the top k are ordered.
+    """
+    totals = {}
+    for record in records:
+        if not isinstance(record, dict):
+            continue
+        key = str(record.get(x_field, ''))
+        try:
+            value = float(record.get(y_field, 0))
+        except (TypeError, ValueError):
+            value = 0.0
+        totals[key] = totals.get(key, 0.0) + value
+    top = heapq.nsmallest(k, totals.items(), key=lambda item: (-item[1], item[0]))
+    return [label for label, _ in top], [value for _, value in top]
@@ -0,0 +1,215 @@
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from datetime import datetime
+import atexit
+import os
+import threading
+
+class WriteBehindBuffer:
+    """
+    Buffers API key `last_used` updates and audit log entries and writes them
+    to MongoDB in batches from a background thread.
+
+    `last_used` updates are coalesced per key, so a key used thousands of
+    times between flushes costs a single update. Audit entries are flushed
+    with one unordered insert_many. Both buffers are bounded; when full the
+    overflow policy decides whether new items are dropped ('drop') or the
+    caller flushes inline before enqueueing ('block').
+    """
+    def __init__(self, flush_interval=1.0, max_audit_entries=10000, max_keys=10000,
+                 overflow_policy='drop', enabled=True):
+        self.flush_interval = flush_interval
+        self.max_audit_entries = max_audit_entries
+        self.max_keys = max_keys
+        self.overflow_policy = overflow_policy
+        self.enabled = enabled
+        self._db = None
+        self._key_touches = {}
+        self._audit_entries = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self._pid = None
+        self.flushes = 0
+        self.keys_written = 0
+        self.audit_written = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def _ensure_worker(self):
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid:
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == pid:
+                return
+            if self._pid != pid:
+                # Items buffered in a parent process are flushed by the parent
+                self._key_touches = {}
+                self._audit_entries = []
+            self._stopped = False
+            self._pid = pid
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def _is_full(self, key_id=None):
+        if key_id is not None:
+            return key_id not in self._key_touches and len(self._key_touches) >= self.max_keys
+        return len(self._audit_entries) >= self.max_audit_entries
+
+    def _admit(self, key_id=None):
+        """Applies the overflow policy. Must be called with the lock held."""
+        if not self._is_full(key_id):
+            return True
+        if self.overflow_policy == 'block':
+            self._lock.release()
+            try:
+                self.flush()
+            finally:
+                self._lock.acquire()
+            if not self._is_full(key_id):
+                return True
+        self.dropped += 1
+        return False
+
+    def touch_key(self, db, key_id, when=None):
+        """Records that an API key was used."""
+        when = when or datetime.utcnow()
+        if not self.enabled:
+            db.api_keys.update_one({'_id': key_id}, {'$max': {'last_used': when}})
+            return
+        self._ensure_worker()
+        with self._lock:
+            self._db = db
+            if not self._admit(key_id):
+                return
+            previous = self._key_touches.get(key_id)
+            if previous is None or when > previous:
+                self._key_touches[key_id] = when
+
+    def record_audit(self, db, entry):
+        """Queues an audit log entry."""
+        if not self.enabled:
+            db.audit_log.insert_one(entry)
+            return
+        self._ensure_worker()
+        with self._lock:
+            self._db = db
+            if not self._admit():
+                return
+            self._audit_entries.append(entry)
+
+    def flush(self):
+        """Writes everything buffered so far. Safe to call from any thread."""
+        with self._flush_lock:
+            with self._lock:
+                db = self._db
+                key_touches, self._key_touches = self._key_touches, {}
+                audit_entries, self._audit_entries = self._audit_entries, []
+            if db is None or (not key_touches and not audit_entries):
+                return
+
+            if key_touches:
+                try:
+                    db.api_keys.bulk_write([
+                        UpdateOne({'_id': key_id}, {'$max': {'last_used': when}})
+                        for key_id, when in key_touches.items()
+                    ], ordered=False)
+                    self.keys_written += len(key_touches)
+                except Exception as e:
+                    print(f"Error flushing API key usage: {str(e)}")
+                    self.errors += 1
+                    self._requeue_keys(key_touches)
+
+            if audit_entries:
+                try:
+                    db.audit_log.insert_many(audit_entries, ordered=False)
+                    self.audit_written += len(audit_entries)
+                except BulkWriteError as e:
+                    # Duplicate keys mean an earlier attempt already wrote the entry
+                    failed = [error['index'] for error in e.details.get('writeErrors', [])
+                              if error.get('code') != 11000]
+                    self.audit_written += len(audit_entries) - len(failed)
+                    if failed:
+                        print(f"Error flushing audit log entries: {len(failed)} rejected")
+                        self.errors += 1
+                        self._requeue_audit([audit_entries[i] for i in failed])
+                except Exception as e:
+                    print(f"Error flushing audit log entries: {str(e)}")
+                    self.errors += 1
+                    self._requeue_audit(audit_entries)
+
+            self.flushes += 1
+
+    def _requeue_keys(self, key_touches):
+        with self._lock:
+            for key_id, when in key_touches.items():
+                previous = self._key_touches.get(key_id)
+                if previous is not None:
+                    self._key_touches[key_id] = max(previous, when)
+                elif len(self._key_touches) < self.max_keys:
+                    self._key_touches[key_id] = when
+                else:
+                    self.dropped += 1
+
+    def _requeue_audit(self, audit_entries):
+        with self._lock:
+            # insert_many assigns _ids up front, so a retry of entries that
+            # did reach the server fails as a duplicate instead of doubling up
+            room = self.max_audit_entries - len(self._audit_entries)
+            self._audit_entries = audit_entries[:room] + self._audit_entries
+            self.dropped += max(0, len(audit_entries) - room)
+
+    def close(self):
+        """Stops the background thread and flushes what is left."""
+        self._stopped = True
+        self._wakeup.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=self.flush_interval + 5)
+        self._thread = None
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'pending_keys': len(self._key_touches),
+                'pending_audit_entries': len(self._audit_entries),
+                'flushes': self.flushes,
+                'keys_written': self.keys_written,
+                'audit_entries_written': self.audit_written,
+                'dropped': self.dropped,
+                'errors': self.errors,
+                'overflow_policy': self.overflow_policy
+            }
+
+write_behind = WriteBehindBuffer(
+    flush_interval=float(os.getenv('WRITE_BEHIND_FLUSH_INTERVAL', '1.0')),
+    max_audit_entries=int(os.getenv('WRITE_BEHIND_MAX_AUDIT_ENTRIES', '10000')),
+    max_keys=int(os.getenv('WRITE_BEHIND_MAX_KEYS', '10000')),
+    overflow_policy=os.getenv('WRITE_BEHIND_OVERFLOW_POLICY', 'drop'),
+    enabled=os.getenv('WRITE_BEHIND_ENABLED', 'true').lower() == 'true'
+)
+atexit.register(write_behind.close)
+
+def record_api_key_use(db, key_data, method, path):
+    """Records last_used and the api_request_* audit entry for an API key."""
+    now = datetime.utcnow()
+    write_behind.touch_key(db, key_data['key_id'], now)
+    write_behind.record_audit(db, {
+        'action': f'api_request_{method.lower()}',
+        'action_type': 'api',
+        'performed_by': key_data['user_name'],
+        'user_id': key_data['user_id'],
+        'organization': key_data['organization'],
+        'timestamp': now,
+        'details': f"API request to {path} using API key '{key_data['name']}'"
+    })
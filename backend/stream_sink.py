@@ -0,0 +1,46 @@
+"""
+Stream sink worker: drains the data_ingestion topic into MongoDB when the
+API runs with INGEST_MODE=kafka. Workers sharing STREAM_SINK_GROUP split the
+topic's partitions, so sinks scale independently of the API.
+
+    python stream_sink.py
+"""
+from kafka import KafkaConsumer
+from models.db import get_database
+from services.stream_sink import StreamSink, INGEST_TOPIC
+import json
+import os
+import signal
+import threading
+
+def main():
+    batch_size = int(os.getenv('STREAM_SINK_BATCH_SIZE', '5000'))
+    consumer = KafkaConsumer(
+        INGEST_TOPIC,
+        bootstrap_servers=os.getenv('KAFKA_BOOTSTRAP_SERVERS', 'localhost:9092'),
+        group_id=os.getenv('STREAM_SINK_GROUP', 'raw-data-sink'),
+        enable_auto_commit=False,
+        auto_offset_reset='earliest',
+        max_poll_records=batch_size,
+        value_deserializer=lambda value: json.loads(value.decode('utf-8'))
+    )
+    sink = StreamSink(
+        get_database(),
+        consumer,
+        batch_size=batch_size,
+        max_wait_ms=int(os.getenv('STREAM_SINK_MAX_WAIT_MS', '1000'))
+    )
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    signal.signal(signal.SIGINT, lambda *args: stop.set())
+
+    print(f"Stream sink consuming {INGEST_TOPIC} in batches of up to {batch_size}")
+    try:
+        sink.run(stop)
+    finally:
+        consumer.close()
+        print(f"Stream sink stopped: {sink.stats()}")
+
+if __name__ == '__main__':
+    main()
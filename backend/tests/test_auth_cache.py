@@ -0,0 +1,118 @@
+import pytest
+import time
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token
+from flask_restx import Api
+from datetime import datetime
+from api.auth import auth_ns
+from api.data import data_ns
+from models.db import get_db
+from services.serialization import init_json
+from services.auth_cache import CredentialCache, credential_cache
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['TESTING'] = True
+    app.config['JWT_SECRET_KEY'] = 'test-secret-key'
+    JWTManager(app)
+
+    api = Api(app)
+    init_json(api)
+    api.add_namespace(auth_ns, path='/auth')
+    api.add_namespace(data_ns, path='/data')
+
+    with app.app_context():
+        db = get_db()
+        for name in ('users', 'api_keys', 'audit_log', 'data_sources', 'raw_data'):
+            db[name].delete_many({})
+    credential_cache.clear()
+    return app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def api_key(app):
+    with app.app_context():
+        db = get_db()
+        user_id = db.users.insert_one({
+            'email': 'stream@example.com',
+            'name': 'Stream User',
+            'organization': 'Test Org',
+            'role': 'user'
+        }).inserted_id
+        key_id = db.api_keys.insert_one({
+            'user_id': user_id,
+            'name': 'gateway',
+            'key': 'abc123',
+            'created_at': datetime.utcnow(),
+            'is_active': True
+        }).inserted_id
+        source_id = db.data_sources.insert_one({
+            'name': 'vitals',
+            'type': 'api',
+            'user_id': user_id,
+            'created_at': datetime.utcnow()
+        }).inserted_id
+        token = create_access_token(identity=str(user_id))
+    return {'key': 'abc123', 'key_id': key_id, 'source_id': source_id, 'jwt': token}
+
+def test_cache_expires_entries():
+    cache = CredentialCache(max_size=10, ttl=0.01)
+    cache.set('k', {'key_id': 1, 'user_id': 2})
+    assert cache.get('k') is not None
+    time.sleep(0.02)
+    assert cache.get('k') is None
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+def test_cache_evicts_least_recently_used():
+    cache = CredentialCache(max_size=2, ttl=60)
+    cache.set('a', {'key_id': 1, 'user_id': 1})
+    cache.set('b', {'key_id': 2, 'user_id': 1})
+    cache.get('a')
+    cache.set('c', {'key_id': 3, 'user_id': 2})
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.stats()['evictions'] == 1
+
+def test_cache_invalidate_by_user():
+    cache = CredentialCache()
+    cache.set('a', {'key_id': 1, 'user_id': 'u1'})
+    cache.set('b', {'key_id': 2, 'user_id': 'u1'})
+    cache.set('c', {'key_id': 3, 'user_id': 'u2'})
+    assert cache.invalidate_user('u1') == 2
+    assert cache.stats()['size'] == 1
+
+def test_api_key_lookup_served_from_cache(client, api_key):
+    headers = {'Authorization': f"Bearer {api_key['key']}"}
+    url = f"/data/source/{api_key['source_id']}/data"
+
+    assert client.get(url, headers=headers).status_code == 200
+    misses = credential_cache.stats()['misses']
+    assert client.get(url, headers=headers).status_code == 200
+    assert client.get(url, headers=headers).status_code == 200
+
+    stats = credential_cache.stats()
+    assert stats['misses'] == misses
+    assert stats['hits'] >= 2
+
+def test_deactivated_key_is_rejected(client, api_key):
+    headers = {'Authorization': f"Bearer {api_key['key']}"}
+    url = f"/data/source/{api_key['source_id']}/data"
+    assert client.get(url, headers=headers).status_code == 200
+
+    response = client.delete(
+        f"/auth/api-keys/{api_key['key_id']}",
+        headers={'Authorization': f"Bearer {api_key['jwt']}"}
+    )
+    assert response.status_code == 200
+    assert client.get(url, headers=headers).status_code == 401
+
+def test_jwt_skips_api_key_lookup(client, api_key):
+    misses = credential_cache.stats()['misses']
+    response = client.get('/auth/profile', headers={'Authorization': f"Bearer {api_key['jwt']}"})
+    assert response.status_code == 200
+    assert credential_cache.stats()['misses'] == misses
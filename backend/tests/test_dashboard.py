@@ -0,0 +1,604 @@
+import pytest
+import base64
+import json
+import time
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token
+from flask_restx import Api
+from datetime import datetime, timedelta
+from api import dashboard as dashboard_api
+from api.dashboard import dashboard_ns, DashboardData, plan_chart_queries, apply_sample_estimates, fill_time_gaps
+from pymongo.errors import OperationFailure
+from bson import ObjectId
+from models.db import get_db
+from services.serialization import init_json
+from services.chart_cache import chart_cache, ChartResultCache, MongoCacheBackend
+from services.source_versions import bump_source_versions
+from services.chart_snapshots import SnapshotCache, public_snapshots
+from services.live_updates import LiveUpdateHub, live_updates
+import mongomock
+
+CHARTS = [
+    {
+        'type': 'bar',
+        'title': 'Patients by ward',
+        'data_source': 'census',
+        'config': {'group_by': 'ward', 'measure': 'patients', 'aggregate': 'sum'}
+    },
+    {
+        'type': 'pie',
+        'title': 'Admissions by ward',
+        'data_source': 'census',
+        'config': {'group_by': 'ward', 'measure': 'patients', 'aggregate': 'count'}
+    },
+    {
+        'type': 'bar',
+        'title': 'Glucose by lab',
+        'data_source': 'labs',
+        'config': {'group_by': 'lab', 'measure': 'glucose', 'aggregate': 'avg'}
+    }
+]
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['TESTING'] = True
+    app.config['JWT_SECRET_KEY'] = 'test-secret-key'
+    JWTManager(app)
+
+    api = Api(app)
+    init_json(api)
+    api.add_namespace(dashboard_ns, path='/dashboard')
+
+    with app.app_context():
+        db = get_db()
+        for name in db.list_collection_names():
+            db[name].delete_many({})
+    chart_cache.clear()
+    public_snapshots.clear()
+    return app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def dashboard(app):
+    with app.app_context():
+        db = get_db()
+        user_id = db.users.insert_one({
+            'email': 'viewer@example.com',
+            'name': 'Viewer',
+            'organization': 'Test Org',
+            'role': 'user'
+        }).inserted_id
+        now = datetime.utcnow()
+        db.raw_data.insert_many(
+            [{'data_source': 'census', 'timestamp': now, 'data': {'ward': f'W{i % 3}', 'patients': i}}
+             for i in range(30)] +
+            [{'data_source': 'labs', 'timestamp': now, 'data': {'lab': 'A', 'glucose': 90 + i}}
+             for i in range(3)]
+        )
+        dashboard_id = db.dashboards.insert_one({
+            'name': 'Operations',
+            'organization': 'Test Org',
+            'created_at': now,
+            'updated_at': now,
+            'charts': CHARTS
+        }).inserted_id
+        token = create_access_token(identity=str(user_id))
+    return {'id': str(dashboard_id), 'headers': {'Authorization': f'Bearer {token}'}}
+
+def test_dashboard_data_evaluates_all_charts(client, dashboard):
+    response = client.get(f"/dashboard/{dashboard['id']}/data", headers=dashboard['headers'])
+    assert response.status_code == 200
+    assert response.headers['X-Partial-Content'] == 'false'
+    body = response.get_json()
+    assert set(body) == {chart['title'] for chart in CHARTS}
+
+    by_ward = dict(zip(body['Patients by ward']['data']['labels'],
+                       body['Patients by ward']['data']['datasets'][0]['data']))
+    assert by_ward == {
+        'W0': float(sum(range(0, 30, 3))),
+        'W1': float(sum(range(1, 30, 3))),
+        'W2': float(sum(range(2, 30, 3)))
+    }
+    assert body['Glucose by lab']['data']['datasets'][0]['data'] == [91.0]
+
+def test_dashboard_data_single_chart(client, dashboard):
+    response = client.get(
+        f"/dashboard/{dashboard['id']}/data?charts=Glucose by lab",
+        headers=dashboard['headers']
+    )
+    assert response.status_code == 200
+    assert list(response.get_json()) == ['Glucose by lab']
+
+def test_dashboard_data_marks_slow_charts_partial(client, app, dashboard, monkeypatch):
+    app.config['DASHBOARD_DEADLINE_MS'] = 100
+    original = DashboardData._aggregate
+
+    def slow_for_labs(self, db, pipeline, deadline):
+        if pipeline[0]['$match']['data_source'] == 'labs':
+            time.sleep(0.5)
+        return original(self, db, pipeline, deadline)
+
+    monkeypatch.setattr(DashboardData, '_aggregate', slow_for_labs)
+
+    response = client.get(f"/dashboard/{dashboard['id']}/data", headers=dashboard['headers'])
+    assert response.status_code == 200
+    assert response.headers['X-Partial-Content'] == 'true'
+    body = response.get_json()
+    assert body['Glucose by lab']['partial'] is True
+    assert body['Glucose by lab']['status'] == 'timeout'
+    assert 'partial' not in body['Patients by ward']
+
+def test_planner_groups_charts_by_source():
+    tasks = plan_chart_queries(CHARTS, DashboardData()._build_aggregation_pipeline, 4096)
+    facet_tasks = [task for task in tasks if task['facet']]
+    assert len(tasks) == 2
+    assert len(facet_tasks) == 1
+    assert facet_tasks[0]['charts'] == [0, 1]
+    assert facet_tasks[0]['data_source'] == 'census'
+
+def test_planner_keeps_oversized_charts_separate():
+    tasks = plan_chart_queries(CHARTS, DashboardData()._build_aggregation_pipeline, 4096, max_facet_bytes=1000)
+    assert all(not task['facet'] for task in tasks)
+    assert len(tasks) == 3
+
+def test_facet_scans_each_source_once(client, dashboard, monkeypatch):
+    pipelines = []
+    original = DashboardData._aggregate
+
+    def recording(self, db, pipeline, deadline):
+        pipelines.append(pipeline)
+        return original(self, db, pipeline, deadline)
+
+    monkeypatch.setattr(DashboardData, '_aggregate', recording)
+    response = client.get(f"/dashboard/{dashboard['id']}/data", headers=dashboard['headers'])
+    assert response.status_code == 200
+    sources = sorted(pipeline[0]['$match']['data_source'] for pipeline in pipelines)
+    assert sources == ['census', 'labs']
+    assert response.get_json()['Admissions by ward']['data']['datasets'][0]['data'] == [10.0, 10.0, 10.0]
+
+def test_facet_falls_back_when_output_too_large(client, dashboard, monkeypatch):
+    original = DashboardData._aggregate
+
+    def facet_too_large(self, db, pipeline, deadline):
+        if any('$facet' in stage for stage in pipeline):
+            raise OperationFailure('BSONObj size is too large', code=10334)
+        return original(self, db, pipeline, deadline)
+
+    monkeypatch.setattr(DashboardData, '_aggregate', facet_too_large)
+    response = client.get(f"/dashboard/{dashboard['id']}/data", headers=dashboard['headers'])
+    body = response.get_json()
+    assert response.headers['X-Partial-Content'] == 'false'
+    assert len(body['Patients by ward']['data']['labels']) == 3
+
+def test_repeat_loads_served_from_cache(client, app, dashboard, monkeypatch):
+    url = f"/dashboard/{dashboard['id']}/data"
+    first = client.get(url, headers=dashboard['headers']).get_json()
+
+    calls = []
+    original = DashboardData._aggregate
+
+    def counting(self, db, pipeline, deadline):
+        calls.append(pipeline)
+        return original(self, db, pipeline, deadline)
+
+    monkeypatch.setattr(DashboardData, '_aggregate', counting)
+    assert client.get(url, headers=dashboard['headers']).get_json() == first
+    assert calls == []
+
+    # New rows bump the source version, so only that source is recomputed
+    with app.app_context():
+        db = get_db()
+        db.raw_data.insert_one({'data_source': 'labs', 'timestamp': datetime.utcnow(),
+                                'data': {'lab': 'B', 'glucose': 120}})
+        bump_source_versions(db, ['labs'])
+
+    body = client.get(url, headers=dashboard['headers']).get_json()
+    assert [pipeline[0]['$match']['data_source'] for pipeline in calls] == ['labs']
+    assert len(body['Glucose by lab']['data']['labels']) == 2
+
+def test_mongo_cache_backend_is_shared_and_expires():
+    db = mongomock.MongoClient()['hospital_dashboard']
+    writer = ChartResultCache(MongoCacheBackend(), ttl=60)
+    reader = ChartResultCache(MongoCacheBackend(), ttl=60)
+    key = ChartResultCache.make_key('census', [{'$match': {'data_source': 'census'}}], 3)
+
+    writer.set(db, key, [{'_id': 'W0', 'value': 1}])
+    assert reader.get(db, key) == [{'_id': 'W0', 'value': 1}]
+
+    expired = ChartResultCache(MongoCacheBackend(), ttl=-1)
+    expired.set(db, key, [{'_id': 'W0', 'value': 2}])
+    assert reader.get(db, key) is None
+    assert reader.stats()['hits'] == 1
+
+def test_rollup_charts_skip_raw_queries(client, app, dashboard, monkeypatch):
+    from services import rollups
+    from services.jobs import job_runner
+    monkeypatch.setattr(rollups, 'ROLLUP_SPEC_CACHE_SECONDS', 0)
+    charts = [dict(CHARTS[0], config=dict(CHARTS[0]['config'], rollup=True))]
+    with app.app_context():
+        rollups.register_rollups(get_db(), charts)
+        job_runner.drain(timeout=10)
+        get_db().dashboards.update_one({}, {'$set': {'charts': charts}})
+
+    calls = []
+    monkeypatch.setattr(DashboardData, '_aggregate', lambda self, db, pipeline, deadline: calls.append(pipeline))
+    body = client.get(f"/dashboard/{dashboard['id']}/data", headers=dashboard['headers']).get_json()
+    assert calls == []
+    by_ward = dict(zip(body['Patients by ward']['data']['labels'],
+                       body['Patients by ward']['data']['datasets'][0]['data']))
+    assert by_ward == {'W0': 135.0, 'W1': 145.0, 'W2': 155.0}
+
+def test_sampled_preview_of_rollup_chart_reads_raw_rows(client, app, dashboard, monkeypatch):
+    from services import rollups
+    from services.jobs import job_runner
+    monkeypatch.setattr(rollups, 'ROLLUP_SPEC_CACHE_SECONDS', 0)
+    charts = [dict(CHARTS[1], config=dict(CHARTS[1]['config'], rollup=True))]
+    with app.app_context():
+        rollups.register_rollups(get_db(), charts)
+        job_runner.drain(timeout=10)
+        assert get_db().rollup_specs.find_one()['status'] == 'ready'
+        get_db().dashboards.update_one({}, {'$set': {'charts': charts}})
+
+    pipelines = []
+
+    def sampled(self, db, pipeline, deadline):
+        pipelines.append(pipeline)
+        return [{'_id': 'W0', 'value': 4, 'n': 4, 'mean': 1.0, 'stddev': 0.0}]
+
+    monkeypatch.setattr(DashboardData, '_aggregate', sampled)
+    body = client.get(f"/dashboard/{dashboard['id']}/data?sample=4", headers=dashboard['headers']).get_json()
+    chart = body['Admissions by ward']
+    assert pipelines[0][1] == {'$sample': {'size': 4}}
+    assert chart['sample']['population'] == 30
+
+def test_aggregates_cover_every_row(client, app, dashboard):
+    with app.app_context():
+        get_db().raw_data.insert_many([
+            {'data_source': 'labs', 'timestamp': datetime.utcnow(), 'data': {'lab': 'B', 'glucose': 1}}
+            for _ in range(1500)
+        ])
+    response = client.get(f"/dashboard/{dashboard['id']}/data?charts=Glucose by lab", headers=dashboard['headers'])
+    body = response.get_json()['Glucose by lab']['data']
+    assert dict(zip(body['labels'], body['datasets'][0]['data'])) == {'A': 91.0, 'B': 1.0}
+
+def test_pipeline_is_order_independent():
+    builder = DashboardData()._build_aggregation_pipeline
+    grouped = builder(CHARTS[0])
+    assert {'$limit': 1000} not in grouped
+    assert {'$sort': {'value': -1, '_id': 1}} in grouped
+
+    first = builder(dict(CHARTS[0], config=dict(CHARTS[0]['config'], aggregate='none')))
+    assert first.index({'$sort': {'_id': 1}}) < [i for i, stage in enumerate(first) if '$group' in stage][0]
+
+def test_sample_estimates():
+    rows = [{'_id': 'A', 'value': 30, 'n': 10, 'mean': 3.0, 'stddev': 1.0},
+            {'_id': 'B', 'value': 10, 'n': 10, 'mean': 1.0, 'stddev': 0.0}]
+    counts = apply_sample_estimates(rows, 'count', 20, 200)
+    assert [row['value'] for row in counts] == [100.0, 100.0]
+    assert counts[0]['margin'] > 0
+
+    sums = apply_sample_estimates(rows, 'sum', 20, 200)
+    assert [row['value'] for row in sums] == [300.0, 100.0]
+
+    # A sample of the whole source is exact
+    exact = apply_sample_estimates(rows, 'avg', 20, 20)
+    assert [row['margin'] for row in exact] == [0.0, 0.0]
+    assert [row['value'] for row in exact] == [30, 10]
+
+def test_sampled_preview_is_marked_and_not_cached(client, dashboard, monkeypatch):
+    pipelines = []
+
+    def sampled(self, db, pipeline, deadline):
+        pipelines.append(pipeline)
+        return [{'_id': 'A', 'value': 91.0, 'n': 2, 'mean': 91.0, 'stddev': 1.0}]
+
+    monkeypatch.setattr(DashboardData, '_aggregate', sampled)
+    url = f"/dashboard/{dashboard['id']}/data?charts=Glucose by lab&sample=2"
+    body = client.get(url, headers=dashboard['headers']).get_json()['Glucose by lab']
+    assert pipelines[0][1] == {'$sample': {'size': 2}}
+    assert body['sample']['population'] == 3
+    assert body['sample']['size'] == 2
+    assert body['sample']['margin_of_error'][0] > 0
+
+    client.get(url, headers=dashboard['headers'])
+    assert len(pipelines) == 2
+
+def test_fill_time_gaps():
+    rows = [{'_id': '2024-01-01T10:00:00', 'value': 2}, {'_id': '2024-01-01T13:00:00', 'value': 5}]
+    filled = fill_time_gaps(rows, 'hour', fill='zero')
+    assert [row['value'] for row in filled] == [2, 0, 0, 5]
+    assert filled[1]['_id'] == '2024-01-01T11:00:00'
+
+    previous = fill_time_gaps(rows, 'hour', end=datetime(2024, 1, 1, 15), fill='previous')
+    assert [row['value'] for row in previous] == [2, 2, 2, 5, 5]
+
+def test_time_bucketed_chart_over_range(client, app, dashboard):
+    now = datetime.utcnow()
+    chart = {
+        'type': 'line',
+        'title': 'Admissions per hour',
+        'data_source': 'admissions',
+        'config': {'time_bucket': 'hour', 'aggregate': 'count'}
+    }
+    with app.app_context():
+        db = get_db()
+        db.raw_data.insert_many([
+            {'data_source': 'admissions', 'timestamp': now - timedelta(hours=hours), 'data': {'ward': 'A'}}
+            for hours in (2, 2, 5, 30)
+        ])
+        db.dashboards.update_one({}, {'$set': {'charts': [chart]}})
+
+    response = client.get(f"/dashboard/{dashboard['id']}/data?range=24h", headers=dashboard['headers'])
+    assert response.status_code == 200
+    body = response.get_json()['Admissions per hour']['data']
+    values = body['datasets'][0]['data']
+    assert len(body['labels']) == 25
+    assert body['labels'] == sorted(body['labels'])
+    assert sum(values) == 3
+    assert values[body['labels'].index((now - timedelta(hours=2)).strftime('%Y-%m-%dT%H:00:00'))] == 2
+
+    # Without a range every row is included
+    body = client.get(f"/dashboard/{dashboard['id']}/data", headers=dashboard['headers']).get_json()
+    assert sum(body['Admissions per hour']['data']['datasets'][0]['data']) == 4
+
+    # Bucketed charts ignore ?sample= rather than plot unscaled sample totals
+    response = client.get(f"/dashboard/{dashboard['id']}/data?range=24h&sample=1", headers=dashboard['headers'])
+    chart = response.get_json()['Admissions per hour']
+    assert sum(chart['data']['datasets'][0]['data']) == 3
+    assert 'sample' not in chart
+
+def test_sample_population_is_the_charts_time_range(client, app, dashboard, monkeypatch):
+    with app.app_context():
+        get_db().raw_data.insert_many([
+            {'data_source': 'labs', 'timestamp': datetime.utcnow() - timedelta(days=3), 'data': {'lab': 'A', 'glucose': 1}}
+            for _ in range(7)
+        ])
+    monkeypatch.setattr(
+        DashboardData, '_aggregate',
+        lambda self, db, pipeline, deadline: [{'_id': 'A', 'value': 2, 'n': 2, 'mean': 91.0, 'stddev': 1.0}]
+    )
+    url = f"/dashboard/{dashboard['id']}/data?charts=Glucose by lab&sample=2"
+    assert client.get(url, headers=dashboard['headers']).get_json()['Glucose by lab']['sample']['population'] == 10
+    body = client.get(f'{url}&range=1d', headers=dashboard['headers']).get_json()['Glucose by lab']
+    assert body['sample']['population'] == 3
+
+def test_invalid_time_range(client, dashboard):
+    response = client.get(f"/dashboard/{dashboard['id']}/data?from=yesterday", headers=dashboard['headers'])
+    assert response.status_code == 400
+
+def test_charts_with_invalid_time_range_are_not_saved(client, dashboard):
+    charts = [dict(CHARTS[2], config=dict(CHARTS[2]['config'], to='tomorrow'))]
+    body = {'name': 'Labs', 'charts': charts}
+    response = client.post('/dashboard', json=body, headers=dashboard['headers'])
+    assert response.status_code == 400
+    assert 'Glucose by lab' in response.get_json()['message']
+    response = client.put(f"/dashboard/{dashboard['id']}", json=body, headers=dashboard['headers'])
+    assert response.status_code == 400
+
+def test_stored_invalid_time_range_fails_only_its_chart(client, app, dashboard):
+    charts = CHARTS[:2] + [dict(CHARTS[2], config=dict(CHARTS[2]['config'], **{'from': 'yesterday'}))]
+    with app.app_context():
+        get_db().dashboards.update_one({}, {'$set': {'charts': charts}})
+    response = client.get(f"/dashboard/{dashboard['id']}/data", headers=dashboard['headers'])
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['Glucose by lab']['status'] == 'invalid'
+    assert body['Glucose by lab']['partial'] is True
+    assert len(body['Patients by ward']['data']['labels']) == 3
+
+def test_line_chart_is_downsampled(client, app, dashboard):
+    chart = {
+        'type': 'line',
+        'title': 'Heart rate',
+        'data_source': 'monitor',
+        'config': {'group_by': 'second', 'measure': 'bpm', 'aggregate': 'avg'}
+    }
+    with app.app_context():
+        db = get_db()
+        db.raw_data.insert_many([
+            {'data_source': 'monitor', 'timestamp': datetime.utcnow(), 'data': {'second': i, 'bpm': 60 + i % 7}}
+            for i in range(500)
+        ])
+        db.dashboards.update_one({}, {'$set': {'charts': [chart]}})
+
+    url = f"/dashboard/{dashboard['id']}/data"
+    full = client.get(url, headers=dashboard['headers']).get_json()['Heart rate']['data']
+    assert full['labels'] == [str(i) for i in range(500)]
+
+    body = client.get(f'{url}?width=50', headers=dashboard['headers']).get_json()['Heart rate']['data']
+    assert len(body['labels']) == 50
+    assert body['labels'][0] == '0' and body['labels'][-1] == '499'
+    assert [int(label) for label in body['labels']] == sorted(int(label) for label in body['labels'])
+
+def test_unchanged_chart_data_is_not_modified(client, app, dashboard, monkeypatch):
+    url = f"/dashboard/{dashboard['id']}/data"
+    first = client.get(url, headers=dashboard['headers'])
+    etag = first.headers['ETag']
+    assert first.headers['Cache-Control'] == 'private, no-cache'
+    assert first.headers['Last-Modified']
+
+    calls = []
+    monkeypatch.setattr(DashboardData, '_evaluate_charts', lambda self, *args: calls.append(args))
+    again = client.get(url, headers=dict(dashboard['headers'], **{'If-None-Match': etag}))
+    assert again.status_code == 304
+    assert again.data == b''
+    assert calls == []
+
+    since = client.get(url, headers=dict(dashboard['headers'], **{'If-Modified-Since': first.headers['Last-Modified']}))
+    assert since.status_code == 304
+
+    # New rows bump the source version and with it the tag
+    with app.app_context():
+        bump_source_versions(get_db(), ['labs'])
+    monkeypatch.undo()
+    changed = client.get(url, headers=dict(dashboard['headers'], **{'If-None-Match': etag}))
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+def test_dashboard_etag_follows_updated_at(client, app, dashboard):
+    url = f"/dashboard/{dashboard['id']}"
+    etag = client.get(url, headers=dashboard['headers']).headers['ETag']
+    assert client.get(url, headers=dict(dashboard['headers'], **{'If-None-Match': etag})).status_code == 304
+
+    listing = client.get('/dashboard', headers=dashboard['headers'])
+    assert client.get('/dashboard', headers=dict(dashboard['headers'], **{'If-None-Match': listing.headers['ETag']})).status_code == 304
+
+    with app.app_context():
+        get_db().dashboards.update_one({}, {'$set': {'updated_at': datetime.utcnow() + timedelta(seconds=5)}})
+    assert client.get(url, headers=dict(dashboard['headers'], **{'If-None-Match': etag})).status_code == 200
+    assert client.get('/dashboard', headers=dict(dashboard['headers'], **{'If-None-Match': listing.headers['ETag']})).status_code == 200
+
+def test_sampled_chart_data_is_not_stored(client, dashboard):
+    response = client.get(f"/dashboard/{dashboard['id']}/data?sample=10", headers=dashboard['headers'])
+    assert response.headers['Cache-Control'] == 'no-store'
+    assert 'ETag' not in response.headers
+
+def embed_id(dashboard_id, title):
+    return base64.b64encode(json.dumps({'d': dashboard_id, 'c': title}).encode()).decode()
+
+def publish(client, dashboard, title, public=True):
+    url = f"/dashboard/{dashboard['id']}/chart/{title}/public"
+    method = client.put if public else client.delete
+    return method(url, headers=dashboard['headers'])
+
+def test_public_chart_served_from_snapshot(client, app, dashboard, monkeypatch):
+    url = f"/dashboard/public/chart/{embed_id(dashboard['id'], 'Glucose by lab')}"
+    assert publish(client, dashboard, 'Glucose by lab').get_json() == {'title': 'Glucose by lab', 'public': True}
+    first = client.get(url)
+    assert first.status_code == 200
+    assert first.get_json()['data']['labels'] == ['A']
+    assert first.headers['Access-Control-Allow-Origin'] == '*'
+    assert first.headers['Cache-Control'].startswith('public, max-age=')
+    with app.app_context():
+        assert get_db().chart_snapshots.count_documents({}) == 1
+
+    calls = []
+    monkeypatch.setattr(DashboardData, '_evaluate_charts', lambda self, *args: calls.append(args))
+    assert client.get(url).get_json() == first.get_json()
+    assert client.get(url, headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    # A cold worker reuses the stored snapshot while its version matches
+    public_snapshots.clear()
+    assert client.get(url).get_json() == first.get_json()
+    assert calls == []
+
+def test_public_chart_not_found(client, dashboard):
+    assert client.get('/dashboard/public/chart/nope').status_code == 404
+    assert client.get(f"/dashboard/public/chart/{embed_id(dashboard['id'], 'Missing')}").status_code == 404
+    assert publish(client, dashboard, 'Missing').status_code == 404
+
+def test_only_published_charts_are_public(client, dashboard):
+    url = f"/dashboard/public/chart/{embed_id(dashboard['id'], 'Glucose by lab')}"
+    assert client.get(url).status_code == 404
+    publish(client, dashboard, 'Glucose by lab')
+    assert client.get(url).status_code == 200
+    assert client.get(f"/dashboard/public/chart/{embed_id(dashboard['id'], 'Patients by ward')}").status_code == 404
+
+    assert publish(client, dashboard, 'Glucose by lab', public=False).get_json()['public'] is False
+    public_snapshots.clear()
+    assert client.get(url).status_code == 404
+
+def test_snapshot_cache_serves_stale_while_refreshing():
+    cache = SnapshotCache(fresh_seconds=0, stale_seconds=60)
+    versions = iter(['v1', 'v2'])
+    load = lambda previous: {'version': next(versions), 'source': 'labs'}
+    assert cache.get('chart', load)['version'] == 'v1'
+    # Due for refresh: the stale copy is returned and v2 loaded in the background
+    assert cache.get('chart', load)['version'] == 'v1'
+    deadline = time.monotonic() + 5
+    while cache._entries['chart']['value']['version'] != 'v2' and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cache._entries['chart']['value']['version'] == 'v2'
+    assert cache.stats()['stale_hits'] == 1
+
+def test_snapshot_cache_marks_changed_sources_stale():
+    cache = SnapshotCache(fresh_seconds=60, stale_seconds=60)
+    cache.get('chart', lambda previous: {'version': 'v1', 'source': 'labs'})
+    cache.mark_stale(['census'])
+    assert cache.get('chart', lambda previous: None)['version'] == 'v1'
+    assert cache.stats()['hits'] == 1
+    cache.mark_stale(['labs'])
+    assert cache._entries['chart']['fresh_until'] <= time.monotonic()
+
+def test_live_updates_are_coalesced_per_source(app, dashboard):
+    hub = LiveUpdateHub(poll_interval=60, debounce_seconds=0)
+    with app.app_context():
+        db = get_db()
+        subscription = hub.subscribe(db, ['labs', 'census'])
+        assert subscription.wait(0) == {}
+        bump_source_versions(db, ['labs'])
+        bump_source_versions(db, ['labs'])
+        hub.poll()
+        assert subscription.wait(0) == {'labs': 2}
+        hub.poll()
+        assert subscription.wait(0) == {}
+    subscription.close()
+    assert hub.stats()['subscribers'] == 0
+
+def stream_token(client, dashboard, ids=None):
+    response = client.post(
+        '/dashboard/events/token',
+        json={'dashboards': ids or [dashboard['id']]},
+        headers=dashboard['headers']
+    )
+    return response.status_code, response.get_json()
+
+def test_dashboard_events_send_missed_chart_updates(client, app, dashboard):
+    with app.app_context():
+        bump_source_versions(get_db(), ['labs'])
+    status, body = stream_token(client, dashboard)
+    assert status == 200
+    response = client.get(
+        f"/dashboard/events?token={body['token']}",
+        headers={'Last-Event-ID': 'census=0&labs=0'}
+    )
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    chunks = response.iter_encoded()
+    assert next(chunks).startswith(b'retry:')
+    event = next(chunks).decode('utf-8').split('\n')
+    assert event[0] == 'id: census=0&labs=1'
+    assert event[1] == 'event: charts'
+    body = json.loads(event[2][len('data: '):])
+    assert body['dashboard_id'] == dashboard['id']
+    assert body['versions'] == {'labs': 1}
+    assert list(body['charts']) == ['Glucose by lab']
+    response.close()
+    assert live_updates.stats()['subscribers'] == 0
+
+def test_stream_tokens_cover_known_dashboards_only(client, dashboard):
+    assert stream_token(client, dashboard, ['nope'])[0] == 400
+    assert stream_token(client, dashboard, [dashboard['id'], str(ObjectId())])[0] == 404
+    assert client.post('/dashboard/events/token', json={'dashboards': [dashboard['id']]}).status_code == 401
+
+def test_dashboard_events_accept_only_stream_tokens(client, dashboard):
+    login_token = dashboard['headers']['Authorization'].split()[1]
+    assert client.get(f'/dashboard/events?token={login_token}').status_code == 401
+    assert client.get(f'/dashboard/events?jwt={login_token}').status_code == 401
+    assert client.get('/dashboard/events', headers=dashboard['headers']).status_code == 401
+
+    token = stream_token(client, dashboard)[1]['token']
+    response = client.get('/dashboard', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code in (401, 422)
+
+def test_concurrent_requests_share_one_query_pool(app, monkeypatch):
+    import threading
+    monkeypatch.setattr(dashboard_api, 'query_executor', None)
+    pools = []
+    start = threading.Barrier(8)
+
+    def first_request():
+        with app.app_context():
+            start.wait()
+            pools.append(dashboard_api.get_query_executor())
+
+    threads = [threading.Thread(target=first_request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(pool) for pool in pools}) == 1
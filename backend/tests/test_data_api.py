@@ -0,0 +1,546 @@
+import pytest
+import io
+import os
+import json
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token
+from flask_restx import Api
+from datetime import datetime
+from api.data import data_ns
+from models.db import get_db
+from models.indexes import ensure_indexes
+from services.serialization import init_json
+from services.auth_cache import credential_cache
+from services.jobs import job_runner
+from services.broker import InMemoryBroker
+from services.circuit_breaker import CircuitBreaker
+from services.kafka_producer import KafkaPublisher, kafka_publisher
+from services.stream_sink import StreamSink, INGEST_TOPIC, to_message
+from services.ingest_log import IngestLog, encode_frame
+import api.data
+
+@pytest.fixture
+def app(monkeypatch, tmp_path):
+    app = Flask(__name__)
+    app.config['TESTING'] = True
+    app.config['JWT_SECRET_KEY'] = 'test-secret-key'
+    app.config['UPLOAD_DIR'] = str(tmp_path)
+    app.config['STREAM_BATCH_MAX_RECORDS'] = 100
+    JWTManager(app)
+
+    api = Api(app)
+    init_json(api)
+    api.add_namespace(data_ns, path='/data')
+
+    # No broker in tests
+    monkeypatch.setattr(kafka_publisher, 'factory', lambda: None)
+    monkeypatch.setattr(kafka_publisher, 'breaker', CircuitBreaker())
+    monkeypatch.setattr(kafka_publisher, 'spool', None)
+    kafka_publisher.close()
+
+    with app.app_context():
+        db = get_db()
+        for name in db.list_collection_names():
+            db[name].delete_many({})
+    credential_cache.clear()
+    return app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def user(app):
+    with app.app_context():
+        db = get_db()
+        user_id = db.users.insert_one({
+            'email': 'data@example.com',
+            'name': 'Data User',
+            'organization': 'Test Org',
+            'role': 'user'
+        }).inserted_id
+        db.api_keys.insert_one({
+            'user_id': user_id,
+            'name': 'gateway',
+            'key': 'gatewaykey',
+            'created_at': datetime.utcnow(),
+            'is_active': True
+        })
+        token = create_access_token(identity=str(user_id))
+    return {
+        'id': user_id,
+        'api_headers': {'Authorization': 'Bearer gatewaykey'},
+        'jwt_headers': {'Authorization': f'Bearer {token}'}
+    }
+
+def test_stream_single_record(client, app, user):
+    response = client.post('/data/stream', headers=user['api_headers'], json={
+        'data_source': 'vitals',
+        'data': {'heart_rate': 72}
+    })
+    assert response.status_code == 201
+
+    with app.app_context():
+        db = get_db()
+        assert db.raw_data.count_documents({'data_source': 'vitals'}) == 1
+        assert db.data_sources.find_one({'name': 'vitals'})['record_count'] == 1
+
+def test_stream_batch_json_array(client, app, user):
+    records = [{'data_source': 'vitals', 'data': {'heart_rate': 60 + i}} for i in range(10)]
+    records += [{'data_source': 'labs', 'data': {'glucose': 90}} for _ in range(5)]
+    records.append({'data': {'missing': 'source'}})
+
+    response = client.post('/data/stream/batch', headers=user['api_headers'], json=records)
+    assert response.status_code == 201
+    body = response.get_json()
+    assert body['records_processed'] == 15
+    assert body['records_failed'] == 1
+    assert body['errors'][0]['index'] == 15
+    assert body['data_sources']['vitals']['records'] == 10
+
+    with app.app_context():
+        db = get_db()
+        assert db.raw_data.count_documents({}) == 15
+        assert db.data_sources.find_one({'name': 'vitals'})['record_count'] == 10
+        assert db.data_sources.find_one({'name': 'labs'})['record_count'] == 5
+
+def test_stream_batch_ndjson(client, app, user):
+    lines = [json.dumps({'data_source': 'vitals', 'data': {'spo2': 98}}) for _ in range(3)]
+    lines.insert(1, '{not json')
+    response = client.post(
+        '/data/stream/batch',
+        headers=dict(user['api_headers'], **{'Content-Type': 'application/x-ndjson'}),
+        data='\n'.join(lines) + '\n'
+    )
+    assert response.status_code == 201
+    body = response.get_json()
+    assert body['records_processed'] == 3
+    assert body['errors'][0]['index'] == 1
+
+def test_stream_batch_single_source_shorthand(client, user):
+    response = client.post('/data/stream/batch', headers=user['api_headers'], json={
+        'data_source': 'vitals',
+        'records': [{'heart_rate': 70}, {'heart_rate': 71}]
+    })
+    assert response.status_code == 201
+    assert response.get_json()['records_processed'] == 2
+
+def test_stream_batch_rejects_oversized_batch(client, user):
+    records = [{'data_source': 'vitals', 'data': {'n': i}} for i in range(101)]
+    response = client.post('/data/stream/batch', headers=user['api_headers'], json=records)
+    assert response.status_code == 400
+
+def make_csv(rows):
+    lines = ['ward,patients,notes']
+    for i in range(rows):
+        lines.append(f"W{i % 3},{i},{'' if i % 2 else 'ok'}")
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+def test_upload_csv_in_chunks(client, app, user, monkeypatch):
+    app.config['UPLOAD_CHUNK_ROWS'] = 4
+    batch_sizes = []
+    with app.app_context():
+        raw_data = get_db().raw_data
+        original_insert_many = type(raw_data).insert_many
+
+        def recording_insert_many(self, documents, *args, **kwargs):
+            documents = list(documents)
+            batch_sizes.append(len(documents))
+            return original_insert_many(self, documents, *args, **kwargs)
+
+        monkeypatch.setattr(type(raw_data), 'insert_many', recording_insert_many)
+
+    response = client.post(
+        '/data/upload?async=false',
+        headers=user['jwt_headers'],
+        data={'file': (io.BytesIO(make_csv(10)), 'census.csv'), 'data_source': 'census'},
+        content_type='multipart/form-data'
+    )
+    assert response.status_code == 201
+    assert response.get_json()['records_processed'] == 10
+    assert batch_sizes == [4, 4, 2]
+
+    with app.app_context():
+        db = get_db()
+        source = db.data_sources.find_one({'name': 'census'})
+        assert source['status'] == 'ready'
+        assert source['record_count'] == 10
+        assert source['numeric_columns'] == ['patients']
+        assert source['progress']['rows_processed'] == 10
+        record = db.raw_data.find_one({'data.patients': 1})
+        assert record['data']['notes'] is None
+
+def test_upload_empty_csv_leaves_no_source(client, app, user):
+    response = client.post(
+        '/data/upload?async=false',
+        headers=user['jwt_headers'],
+        data={'file': (io.BytesIO(b''), 'empty.csv'), 'data_source': 'empty'},
+        content_type='multipart/form-data'
+    )
+    assert response.status_code == 400
+    with app.app_context():
+        assert get_db().data_sources.find_one({'name': 'empty'}) is None
+
+def test_upload_runs_as_background_job(client, app, user):
+    response = client.post(
+        '/data/upload',
+        headers=user['jwt_headers'],
+        data={'file': (io.BytesIO(make_csv(25)), 'census.csv'), 'data_source': 'census'},
+        content_type='multipart/form-data'
+    )
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+
+    job_runner.drain(timeout=10)
+
+    response = client.get(f'/data/jobs/{job_id}', headers=user['jwt_headers'])
+    assert response.status_code == 200
+    job = response.get_json()
+    assert job['status'] == 'completed'
+    assert job['rows_processed'] == 25
+    assert job['percent_complete'] == 100.0
+    assert job['rows_per_second'] is not None
+    assert job['result']['records_processed'] == 25
+
+    with app.app_context():
+        assert get_db().data_sources.find_one({'name': 'census'})['status'] == 'ready'
+    assert os.listdir(app.config['UPLOAD_DIR']) == []
+
+def test_failed_background_job_reports_error(client, app, user):
+    response = client.post(
+        '/data/upload',
+        headers=user['jwt_headers'],
+        data={'file': (io.BytesIO(b''), 'empty.csv'), 'data_source': 'empty'},
+        content_type='multipart/form-data'
+    )
+    job_id = response.get_json()['job_id']
+    job_runner.drain(timeout=10)
+
+    job = client.get(f'/data/jobs/{job_id}', headers=user['jwt_headers']).get_json()
+    assert job['status'] == 'failed'
+    assert job['errors'] == ['The uploaded file is empty']
+    with app.app_context():
+        assert get_db().data_sources.find_one({'name': 'empty'}) is None
+
+def test_job_not_visible_to_other_users(client, app, user):
+    with app.app_context():
+        other = create_access_token(identity='0' * 24)
+    response = client.post(
+        '/data/upload',
+        headers=user['jwt_headers'],
+        data={'file': (io.BytesIO(make_csv(3)), 'census.csv'), 'data_source': 'census'},
+        content_type='multipart/form-data'
+    )
+    job_id = response.get_json()['job_id']
+    job_runner.drain(timeout=10)
+    response = client.get(f'/data/jobs/{job_id}', headers={'Authorization': f'Bearer {other}'})
+    assert response.status_code == 404
+
+def test_malformed_job_id_is_not_found(client, user):
+    assert client.get('/data/jobs/not-a-job', headers=user['jwt_headers']).status_code == 404
+
+@pytest.fixture
+def source(app, user):
+    with app.app_context():
+        db = get_db()
+        source_id = db.data_sources.insert_one({
+            'name': 'vitals',
+            'user_id': user['id'],
+            'created_at': datetime.utcnow(),
+            'columns': ['heart_rate']
+        }).inserted_id
+        db.raw_data.insert_many([{
+            'data_source_id': source_id,
+            'data_source': 'vitals',
+            'timestamp': datetime.utcnow(),
+            'data': {'heart_rate': 60 + i},
+            'user_id': user['id']
+        } for i in range(25)])
+    return str(source_id)
+
+def test_source_data_keyset_pages(client, user, source):
+    url = f'/data/source/{source}/data'
+    seen = []
+    params = {'limit': 10}
+    while True:
+        response = client.get(url, headers=user['api_headers'], query_string=params)
+        assert response.status_code == 200
+        page = response.get_json()
+        seen += [record['data']['heart_rate'] for record in page]
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+        assert 'rel="next"' in response.headers['Link']
+        params = {'limit': 10, 'after': cursor}
+    assert seen == [60 + i for i in range(25)]
+
+def test_source_data_rejects_bad_cursor(client, user, source):
+    response = client.get(f'/data/source/{source}/data?after=nope', headers=user['api_headers'])
+    assert response.status_code == 400
+
+def test_source_data_ndjson_stream(client, user, source):
+    response = client.get(f'/data/source/{source}/data?format=ndjson', headers=user['api_headers'])
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(lines) == 25
+    assert 'user_id' not in lines[0]
+    assert lines[-1]['data'] == {'heart_rate': 84}
+
+def test_export_csv(client, user, source):
+    response = client.get(f'/data/source/{source}/export', headers=user['api_headers'])
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    assert 'vitals.csv' in response.headers['Content-Disposition']
+    lines = response.get_data(as_text=True).splitlines()
+    assert lines[0] == 'heart_rate'
+    assert lines[1:] == [str(60 + i) for i in range(25)]
+
+def test_export_arrow_and_parquet(client, app, user, source):
+    pa = pytest.importorskip('pyarrow')
+    import pyarrow.parquet as pq
+    app.config['EXPORT_BATCH_ROWS'] = 10
+
+    response = client.get(f'/data/source/{source}/export?format=arrow', headers=user['api_headers'])
+    assert response.status_code == 200
+    table = pa.ipc.open_stream(response.get_data()).read_all()
+    assert table.num_rows == 25
+    assert table.schema.field('heart_rate').type == pa.float64()
+
+    response = client.get(f'/data/source/{source}/export?format=parquet', headers=user['api_headers'])
+    assert response.status_code == 200
+    parquet = pq.ParquetFile(io.BytesIO(response.get_data()))
+    assert parquet.metadata.num_row_groups == 3
+    assert parquet.read().column('heart_rate').to_pylist() == [60.0 + i for i in range(25)]
+
+def test_export_unknown_format(client, user, source):
+    response = client.get(f'/data/source/{source}/export?format=xml', headers=user['api_headers'])
+    assert response.status_code == 400
+
+def test_sources_revalidate_until_ingestion(client, app, user, source):
+    with app.app_context():
+        get_db().data_sources.update_one({'name': 'vitals'}, {'$set': {'type': 'stream'}})
+    first = client.get('/data/sources', headers=user['jwt_headers'])
+    etag = first.headers['ETag']
+    conditional = dict(user['jwt_headers'], **{'If-None-Match': etag})
+    assert client.get('/data/sources', headers=conditional).status_code == 304
+
+    client.post('/data/stream', json={'data_source': 'vitals', 'data': {'heart_rate': 70}},
+                headers=user['api_headers'])
+    assert client.get('/data/sources', headers=conditional).status_code == 200
+
+def test_kafka_mode_acks_before_the_sink_writes(client, app, user, monkeypatch):
+    broker = InMemoryBroker()
+    monkeypatch.setattr(kafka_publisher, 'factory', broker.producer)
+    kafka_publisher.close()
+    app.config['INGEST_MODE'] = 'kafka'
+
+    response = client.post('/data/stream/batch', headers=user['api_headers'], json=[
+        {'data_source': 'vitals', 'data': {'heart_rate': 60 + i}} for i in range(5)
+    ])
+    assert response.status_code == 202
+    assert response.get_json()['records_accepted'] == 5
+    single = client.post('/data/stream', headers=user['api_headers'],
+                         json={'data_source': 'vitals', 'data': {'heart_rate': 90}})
+    assert single.status_code == 202
+
+    with app.app_context():
+        db = get_db()
+        assert db.raw_data.count_documents({}) == 0
+        # The source is created by the sink, not on the request path
+        assert db.data_sources.count_documents({}) == 0
+        sink = StreamSink(db, broker.consumer(INGEST_TOPIC, 'sink'), batch_size=100, max_wait_ms=10)
+        assert sink.run_once() == 6
+        assert db.raw_data.count_documents({'data_source': 'vitals'}) == 6
+        assert db.raw_data.find_one({'ingest_id': single.get_json()['ingest_id']})['data'] == {'heart_rate': 90}
+        assert db.data_sources.find_one({'name': 'vitals'})['record_count'] == 6
+    assert broker.lag(INGEST_TOPIC, 'sink') == 0
+
+def test_sink_resolves_sources_of_queued_records(client, app, user, monkeypatch):
+    broker = InMemoryBroker()
+    monkeypatch.setattr(kafka_publisher, 'factory', broker.producer)
+    kafka_publisher.close()
+    app.config['INGEST_MODE'] = 'kafka'
+    with app.app_context():
+        existing = get_db().data_sources.insert_one({
+            'name': 'vitals', 'user_id': user['id'], 'record_count': 0
+        }).inserted_id
+
+    response = client.post('/data/stream/batch', headers=user['api_headers'], json=[
+        {'data_source': 'vitals', 'data': {'heart_rate': 70}},
+        {'data_source': 'steps', 'data': {'count': 12}},
+        {'data_source': 'steps', 'data': {'count': 30}}
+    ])
+    assert response.status_code == 202
+    assert response.get_json()['data_sources'] == {'vitals': {'records': 1}, 'steps': {'records': 2}}
+
+    with app.app_context():
+        db = get_db()
+        sink = StreamSink(db, broker.consumer(INGEST_TOPIC, 'sink'), max_wait_ms=10)
+        assert sink.run_once() == 3
+        steps = db.data_sources.find_one({'name': 'steps'})
+        assert steps['columns'] == ['count']
+        assert steps['record_count'] == 2
+        assert db.data_sources.find_one({'_id': existing})['record_count'] == 1
+        assert db.raw_data.count_documents({'data_source_id': steps['_id']}) == 2
+        assert db.raw_data.count_documents({'data_source_id': existing}) == 1
+
+def test_kafka_mode_without_broker_is_unavailable(client, app, user):
+    app.config['INGEST_MODE'] = 'kafka'
+    response = client.post('/data/stream', headers=user['api_headers'],
+                           json={'data_source': 'vitals', 'data': {'heart_rate': 90}})
+    assert response.status_code == 503
+    assert response.headers['Retry-After']
+
+def test_sink_redelivery_is_not_stored_twice(client, app, user, monkeypatch):
+    broker = InMemoryBroker()
+    monkeypatch.setattr(kafka_publisher, 'factory', broker.producer)
+    kafka_publisher.close()
+    app.config['INGEST_MODE'] = 'kafka'
+    client.post('/data/stream/batch', headers=user['api_headers'], json=[
+        {'data_source': 'vitals', 'data': {'heart_rate': i}} for i in range(3)
+    ])
+    # Legacy fan-out messages on the same topic are already stored
+    broker.append(INGEST_TOPIC, None, {'data_source': 'vitals', 'timestamp': '2024-01-01T00:00:00', 'data': {}})
+
+    with app.app_context():
+        db = get_db()
+        ensure_indexes(db)
+        # Written, then the sink dies before committing its offsets
+        crashed = StreamSink(db, broker.consumer(INGEST_TOPIC, 'sink'), max_wait_ms=10)
+        crashed.write_batch(crashed.poll_batch())
+
+        sink = StreamSink(db, broker.consumer(INGEST_TOPIC, 'sink'), max_wait_ms=10)
+        assert sink.run_once() == 4
+        assert sink.stats()['duplicates'] == 3
+        assert sink.stats()['skipped'] == 1
+        assert db.raw_data.count_documents({}) == 3
+        assert db.data_sources.find_one({'name': 'vitals'})['record_count'] == 3
+
+def test_sink_applies_updates_of_a_batch_that_failed_after_insert(client, app, user, monkeypatch):
+    broker = InMemoryBroker()
+    monkeypatch.setattr(kafka_publisher, 'factory', broker.producer)
+    kafka_publisher.close()
+    app.config['INGEST_MODE'] = 'kafka'
+    client.post('/data/stream/batch', headers=user['api_headers'], json=[
+        {'data_source': 'vitals', 'data': {'heart_rate': i}} for i in range(3)
+    ])
+
+    with app.app_context():
+        db = get_db()
+        ensure_indexes(db)
+
+        def step_down(db, documents):
+            raise ConnectionError('primary stepped down')
+        monkeypatch.setattr('services.stream_sink.apply_rollups', step_down)
+        crashed = StreamSink(db, broker.consumer(INGEST_TOPIC, 'sink'), max_wait_ms=10)
+        with pytest.raises(ConnectionError):
+            crashed.run_once()
+        assert db.raw_data.count_documents({}) == 3
+        assert db.data_sources.find_one({'name': 'vitals'})['record_count'] == 0
+
+        applied = []
+        monkeypatch.setattr('services.stream_sink.apply_rollups', lambda db, documents: applied.extend(documents))
+        sink = StreamSink(db, broker.consumer(INGEST_TOPIC, 'sink'), max_wait_ms=10)
+        assert sink.run_once() == 3
+        assert sink.stats()['duplicates'] == 3
+        assert sink.stats()['recovered'] == 3
+        assert len(applied) == 3
+        assert db.data_sources.find_one({'name': 'vitals'})['record_count'] == 3
+        assert db.raw_data.count_documents({'effects_pending': True}) == 0
+
+        # Once applied, another redelivery changes nothing
+        again = StreamSink(db, broker.consumer(INGEST_TOPIC, 'replay'), max_wait_ms=10)
+        assert again.run_once() == 3
+        assert again.stats()['recovered'] == 0
+        assert len(applied) == 3
+        assert db.data_sources.find_one({'name': 'vitals'})['record_count'] == 3
+
+def test_wal_mode_acks_before_the_flusher_writes(client, app, user, monkeypatch, tmp_path):
+    log = IngestLog(str(tmp_path / 'wal'), segment_bytes=4096, flush_interval=60)
+    monkeypatch.setattr(api.data, 'ingest_log', log)
+    app.config['INGEST_MODE'] = 'wal'
+
+    response = client.post('/data/stream/batch', headers=user['api_headers'], json=[
+        {'data_source': 'vitals', 'data': {'heart_rate': 60 + i}} for i in range(50)
+    ])
+    assert response.status_code == 202
+    single = client.post('/data/stream', headers=user['api_headers'],
+                         json={'data_source': 'vitals', 'data': {'heart_rate': 90}})
+    assert single.status_code == 202
+    assert log.stats()['pending_commit'] == 0
+
+    with app.app_context():
+        db = get_db()
+        assert db.raw_data.count_documents({}) == 0
+        # The flusher creates the source; the append never touched MongoDB
+        assert db.data_sources.count_documents({}) == 0
+        assert log.flush() == 51
+        assert db.raw_data.find_one({'ingest_id': single.get_json()['ingest_id']})['data'] == {'heart_rate': 90}
+        assert db.data_sources.find_one({'name': 'vitals'})['record_count'] == 51
+    assert os.listdir(tmp_path / 'wal') == []
+    log.close()
+
+def test_wal_append_does_not_wait_on_mongo(client, app, user, monkeypatch, tmp_path):
+    log = IngestLog(str(tmp_path / 'wal'), segment_bytes=4096, flush_interval=60)
+    monkeypatch.setattr(api.data, 'ingest_log', log)
+    app.config['INGEST_MODE'] = 'wal'
+
+    def unavailable(*args, **kwargs):
+        raise ConnectionError('no primary')
+    monkeypatch.setattr(api.data, 'get_or_create_data_sources', unavailable)
+    response = client.post('/data/stream/batch', headers=user['api_headers'], json=[
+        {'data_source': 'steps', 'data': {'count': i}} for i in range(3)
+    ])
+    assert response.status_code == 202
+    assert response.get_json()['data_sources'] == {'steps': {'records': 3}}
+
+    with app.app_context():
+        db = get_db()
+        assert log.flush() == 3
+        steps = db.data_sources.find_one({'name': 'steps'})
+        assert steps['record_count'] == 3
+        assert steps['columns'] == ['count']
+        assert db.raw_data.count_documents({'data_source_id': steps['_id']}) == 3
+    log.close()
+
+def test_wal_replays_segments_of_exited_workers(app, user, tmp_path):
+    directory = tmp_path / 'wal'
+    directory.mkdir()
+    with app.app_context():
+        db = get_db()
+        source = db.data_sources.insert_one({'name': 'vitals', 'record_count': 0}).inserted_id
+        document = {
+            'data_source_id': source,
+            'data_source': 'vitals',
+            'timestamp': datetime.utcnow(),
+            'data': {'heart_rate': 80},
+            'user_id': source
+        }
+        frames = b''.join(encode_frame(to_message(document, f'ingest-{i}')) for i in range(3))
+        # An active segment of a worker that died: preallocated, torn last frame
+        (directory / 'wal-999999999-000000000001.log').write_bytes(frames + frames[:10] + b'\0' * 64)
+
+        log = IngestLog(str(directory), flush_interval=60)
+        log.start(db)
+        assert log.flush() == 3
+        assert db.raw_data.count_documents({'data_source': 'vitals'}) == 3
+        log.close()
+    assert os.listdir(directory) == []
+
+def test_publisher_delivers_asynchronously():
+    broker = InMemoryBroker()
+    publisher = KafkaPublisher(factory=broker.producer)
+    futures = [publisher.publish(INGEST_TOPIC, {'n': i}, key='vitals') for i in range(3)]
+    assert [future.result(timeout=5).offset for future in futures] == [0, 1, 2]
+    assert broker.topics[INGEST_TOPIC][0].key == 'vitals'
+    assert publisher.stats()['delivered'] == 3
+    publisher.close()
+
+def test_publisher_fails_fast_without_broker():
+    publisher = KafkaPublisher(factory=lambda: None, reconnect_seconds=60)
+    future = publisher.publish(INGEST_TOPIC, {'n': 1})
+    assert isinstance(future.exception(timeout=5), ConnectionError)
+    publisher.publish(INGEST_TOPIC, {'n': 2}).exception(timeout=5)
+    assert publisher.stats()['failed'] == 2
+    publisher.close()
@@ -0,0 +1,62 @@
+import os
+import pytest
+from flask import Flask
+from types import SimpleNamespace
+from models.db import MongoClientManager, PoolStats, get_db, get_client
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['TESTING'] = True
+    return app
+
+def test_get_db_reuses_client_across_app_contexts(app):
+    with app.app_context():
+        first = get_db()
+    with app.app_context():
+        second = get_db()
+        assert second.client is get_client()
+    assert first.client is second.client
+
+def test_manager_reuses_client_in_same_process(monkeypatch):
+    monkeypatch.setenv('MONGODB_URI', 'mongodb://localhost:27017/')
+    manager = MongoClientManager()
+    client = manager.get_client()
+    assert manager.get_client() is client
+    manager.close()
+
+def test_manager_recreates_client_after_fork(monkeypatch):
+    monkeypatch.setenv('MONGODB_URI', 'mongodb://localhost:27017/')
+    manager = MongoClientManager()
+    parent_client = manager.get_client()
+
+    # Simulate running inside a forked worker
+    monkeypatch.setattr(os, 'getpid', lambda: -1)
+    child_client = manager.get_client()
+
+    assert child_client is not parent_client
+    assert manager.pool_stats()['pid'] == -1
+    child_client.close()
+    parent_client.close()
+
+def test_manager_pool_options_from_env(monkeypatch):
+    monkeypatch.setenv('MONGODB_MAX_POOL_SIZE', '25')
+    monkeypatch.setenv('MONGODB_MIN_POOL_SIZE', '5')
+    monkeypatch.setenv('MONGODB_WAIT_QUEUE_TIMEOUT_MS', '2000')
+    options = MongoClientManager().client_options()
+    assert options == {'maxPoolSize': 25, 'minPoolSize': 5, 'waitQueueTimeoutMS': 2000}
+
+def test_pool_stats_counters():
+    stats = PoolStats()
+    event = SimpleNamespace()
+    stats.connection_created(event)
+    stats.connection_created(event)
+    stats.connection_checked_out(event)
+    stats.connection_closed(event)
+    stats.connection_check_out_failed(event)
+
+    snapshot = stats.snapshot()
+    assert snapshot['connections_created'] == 2
+    assert snapshot['connections_open'] == 1
+    assert snapshot['connections_in_use'] == 1
+    assert snapshot['checkout_failures'] == 1
@@ -0,0 +1,31 @@
+import numpy as np
+from services.downsample import lttb, min_max, downsample
+
+def test_lttb_keeps_endpoints_and_spikes():
+    x = np.arange(1000, dtype=float)
+    y = np.sin(x / 50.0)
+    y[437] = 25.0
+    keep = lttb(x, y, 100)
+    assert len(keep) == 100
+    assert keep[0] == 0 and keep[-1] == 999
+    assert np.all(np.diff(keep) > 0)
+    assert 437 in keep
+
+def test_lttb_returns_everything_below_threshold():
+    assert list(lttb(np.arange(5.0), np.arange(5.0), 10)) == [0, 1, 2, 3, 4]
+
+def test_min_max_keeps_extremes():
+    rng = np.random.default_rng(7)
+    y = rng.normal(size=10000)
+    keep = min_max(np.arange(10000.0), y, 200)
+    assert len(keep) <= 202
+    assert np.argmin(y) in keep and np.argmax(y) in keep
+    assert np.all(np.diff(keep) > 0)
+
+def test_downsample_skips_missing_values():
+    keys = [f'2024-01-01T{hour:02d}:00:00' for hour in range(24)]
+    values = [None if hour % 3 == 0 else float(hour) for hour in range(24)]
+    values[23] = 100.0
+    keep = downsample(keys, values, 6)
+    assert len(keep) == 6
+    assert all(values[i] is not None for i in keep[1:-1])
@@ -0,0 +1,43 @@
+import mongomock
+from pymongo import ASCENDING, IndexModel
+from models.indexes import INDEXES, ensure_indexes, ensure_indexes_in_background, report_indexes
+
+def test_ensure_indexes_creates_registry():
+    db = mongomock.MongoClient()['hospital_dashboard']
+    ensure_indexes(db)
+
+    raw_data = db.raw_data.index_information()
+    assert 'data_source_1_timestamp_1' in raw_data
+    assert 'data_source_id_1_user_id_1__id_1' in raw_data
+    assert 'organization_1_action_type_1_timestamp_-1' in db.audit_log.index_information()
+    assert db.api_keys.index_information()['key_1']['unique'] is True
+    assert db.chart_cache.index_information()['expires_at_1']['expireAfterSeconds'] == 0
+
+def test_ensure_indexes_is_idempotent():
+    db = mongomock.MongoClient()['hospital_dashboard']
+    # An index created earlier by an init script is recognised, not duplicated
+    db.users.create_index('email', unique=True)
+    first = ensure_indexes(db)
+    second = ensure_indexes(db)
+    assert first == second
+    assert sorted(db.users.index_information()) == ['_id_', 'email_1', 'organization_1']
+
+def test_ensure_indexes_in_background():
+    db = mongomock.MongoClient()['hospital_dashboard']
+    thread = ensure_indexes_in_background(db)
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert 'user_id_1_created_at_-1' in db.jobs.index_information()
+
+def test_report_indexes_missing_and_undeclared():
+    db = mongomock.MongoClient()['hospital_dashboard']
+    registry = {'raw_data': INDEXES['raw_data']}
+    db.raw_data.create_index([('data_source', ASCENDING), ('timestamp', ASCENDING)])
+    db.raw_data.create_index('legacy_field')
+
+    report = report_indexes(db, registry)
+    assert report['raw_data']['missing'] == ['data_source_id_1_user_id_1__id_1', 'ingest_id_1']
+    assert report['raw_data']['undeclared'] == ['legacy_field_1']
+
+    ensure_indexes(db, {'extra': [IndexModel([('name', ASCENDING)])]})
+    assert report_indexes(db, registry)['extra']['undeclared'] == ['name_1']
@@ -0,0 +1,91 @@
+import pytest
+import mongomock
+from datetime import datetime
+from services import rollups
+from services.jobs import job_runner
+from services.rollups import register_rollups, apply_rollups, rebuild_rollups, read_rollups, prune_rollups
+
+CHART = {
+    'type': 'bar',
+    'title': 'Patients by ward',
+    'data_source': 'census',
+    'config': {'group_by': 'ward', 'measure': 'patients', 'aggregate': 'sum', 'rollup': True}
+}
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(rollups, 'ROLLUP_SPEC_CACHE_SECONDS', 0)
+    rollups.clear_spec_cache()
+    return mongomock.MongoClient()['hospital_dashboard']
+
+def ingest(db, rows):
+    documents = [{'data_source': 'census', 'timestamp': datetime.utcnow(), 'data': row} for row in rows]
+    db.raw_data.insert_many(documents)
+    apply_rollups(db, documents)
+
+def chart_with(aggregate):
+    return dict(CHART, config=dict(CHART['config'], aggregate=aggregate))
+
+def test_backfill_and_ingest_count_each_row_once(db):
+    ingest(db, [{'ward': 'A', 'patients': 1}, {'ward': 'B', 'patients': 2}])
+    register_rollups(db, [CHART, CHART])
+
+    # Rows landing while the backfill waits for its watermark
+    ingest(db, [{'ward': 'A', 'patients': 3}])
+    job_runner.drain(timeout=10)
+    assert db.rollup_specs.find_one()['status'] == 'ready'
+
+    # Rows after the rollup is ready
+    ingest(db, [{'ward': 'A', 'patients': 5}, {'ward': 'B', 'patients': 'n/a'}])
+
+    assert read_rollups(db, [CHART]) == {0: [{'_id': 'A', 'value': 9}, {'_id': 'B', 'value': 2}]}
+    assert read_rollups(db, [chart_with('count')])[0] == [{'_id': 'A', 'value': 3}, {'_id': 'B', 'value': 2}]
+    assert read_rollups(db, [chart_with('avg')])[0] == [{'_id': 'A', 'value': 3.0}, {'_id': 'B', 'value': 2.0}]
+    assert read_rollups(db, [chart_with('max')])[0][0] == {'_id': 'A', 'value': 5}
+
+def test_charts_without_opt_in_are_ignored(db):
+    plain = dict(CHART, config={'group_by': 'ward', 'measure': 'patients', 'aggregate': 'sum'})
+    first = chart_with('none')
+    register_rollups(db, [plain, first])
+    assert db.rollup_specs.count_documents({}) == 0
+    assert read_rollups(db, [plain]) == {}
+
+def test_rebuild_after_delete(db):
+    ingest(db, [{'ward': 'A', 'patients': 1}, {'ward': 'A', 'patients': 10}])
+    register_rollups(db, [chart_with('max')])
+    job_runner.drain(timeout=10)
+    assert read_rollups(db, [chart_with('max')])[0] == [{'_id': 'A', 'value': 10}]
+
+    db.raw_data.delete_many({'data.patients': 10})
+    rebuild_rollups(db, ['census'])
+    assert read_rollups(db, [chart_with('max')]) == {}
+    job_runner.drain(timeout=10)
+
+    assert read_rollups(db, [chart_with('max')])[0] == [{'_id': 'A', 'value': 1}]
+    assert db.rollups.count_documents({}) == 1
+
+def test_prune_removes_specs_no_chart_uses(db):
+    ingest(db, [{'ward': 'A', 'patients': 1}])
+    register_rollups(db, [CHART])
+    job_runner.drain(timeout=10)
+    db.dashboards.insert_many([{'name': 'Census', 'charts': [CHART]}, {'name': 'Wards', 'charts': [CHART]}])
+
+    # Still used by the other dashboard
+    db.dashboards.delete_one({'name': 'Census'})
+    prune_rollups(db, [CHART])
+    job_runner.drain(timeout=10)
+    assert db.rollup_specs.count_documents({}) == 1
+    assert db.rollups.count_documents({}) == 1
+
+    db.dashboards.delete_one({'name': 'Wards'})
+    prune_rollups(db, [CHART])
+    job_runner.drain(timeout=10)
+    assert db.rollup_specs.count_documents({}) == 0
+    assert db.rollups.count_documents({}) == 0
+
+    # Ingest no longer maintains it, and registering again starts afresh
+    ingest(db, [{'ward': 'A', 'patients': 2}])
+    assert db.rollups.count_documents({}) == 0
+    register_rollups(db, [CHART])
+    job_runner.drain(timeout=10)
+    assert read_rollups(db, [CHART]) == {0: [{'_id': 'A', 'value': 3}]}
@@ -0,0 +1,44 @@
+import gzip
+import json
+import numpy as np
+from bson import ObjectId
+from datetime import datetime
+from flask import Flask
+from services.serialization import dumps
+from services.compression import init_compression
+
+def test_dumps_encodes_mongo_types():
+    object_id = ObjectId()
+    when = datetime(2024, 5, 1, 12, 30, 15, 250000)
+    body = json.loads(dumps({'id': object_id, 'at': when, 'n': np.float64(1.5), 'values': [1, None]}))
+    assert body == {'id': str(object_id), 'at': when.isoformat(), 'n': 1.5, 'values': [1, None]}
+
+def make_app():
+    app = Flask(__name__)
+    app.config['COMPRESS_MIN_BYTES'] = 100
+
+    @app.route('/big')
+    def big():
+        response = app.response_class(dumps({'values': list(range(500))}), mimetype='application/json')
+        response.set_etag('abc')
+        return response
+
+    @app.route('/small')
+    def small():
+        return {'ok': True}
+
+    init_compression(app)
+    return app
+
+def test_gzip_when_accepted():
+    client = make_app().test_client()
+    response = client.get('/big', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert response.headers['ETag'] == 'W/"abc"'
+    assert json.loads(gzip.decompress(response.data))['values'][-1] == 499
+
+def test_identity_when_not_accepted_or_small():
+    client = make_app().test_client()
+    assert 'Content-Encoding' not in client.get('/big').headers
+    assert 'Content-Encoding' not in client.get('/small', headers={'Accept-Encoding': 'gzip'}).headers
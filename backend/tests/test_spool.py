@@ -0,0 +1,100 @@
+import os
+import time
+import pytest
+from services.broker import InMemoryBroker
+from services.circuit_breaker import CircuitBreaker
+from services.kafka_producer import KafkaPublisher, SPOOLED
+from services.spool import DiskSpool, SpoolFull
+
+def test_breaker_opens_after_consecutive_failures_and_probes_once():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.stats()['trips'] == 2
+
+def test_spool_rotates_segments_and_refuses_when_full(tmp_path):
+    spool = DiskSpool(str(tmp_path), segment_bytes=100, max_bytes=400)
+    for i in range(3):
+        spool.append('topic', 'key', {'n': i, 'padding': 'x' * 40})
+    assert len([name for name in os.listdir(tmp_path) if name.endswith('.ndjson')]) == 1
+    with pytest.raises(SpoolFull):
+        for i in range(10):
+            spool.append('topic', 'key', {'n': i, 'padding': 'x' * 40})
+
+    segments = spool.claim_segments()
+    messages = [message for path in segments for message in spool.read(path)]
+    assert messages[0] == ('topic', 'key', {'n': 0, 'padding': 'x' * 40})
+    for path in segments:
+        spool.release(path, True, 1)
+    assert spool.stats()['bytes'] == 0
+    assert os.listdir(tmp_path) == []
+
+def test_spool_claims_only_segments_no_writer_holds(tmp_path):
+    writer = DiskSpool(str(tmp_path))
+    writer.append('topic', None, {'n': 1})
+    replayer = DiskSpool(str(tmp_path))
+    assert replayer.claim_segments() == []
+
+    # The writer exits without sealing; its lock goes with it
+    writer._file.close()
+    segments = replayer.claim_segments()
+    assert [list(replayer.read(path)) for path in segments] == [[('topic', None, {'n': 1})]]
+    assert DiskSpool(str(tmp_path)).claim_segments() == []
+    replayer.release(segments[0], True, 1)
+    assert os.listdir(tmp_path) == []
+
+def test_publisher_spools_while_broker_is_down_and_replays(tmp_path):
+    broker = InMemoryBroker()
+    available = {'up': False}
+    publisher = KafkaPublisher(
+        factory=lambda: broker.producer() if available['up'] else None,
+        reconnect_seconds=0,
+        breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0),
+        spool=DiskSpool(str(tmp_path)),
+        replay_seconds=60
+    )
+    futures = [publisher.publish('events', {'n': i}, key='vitals') for i in range(3)]
+    assert [future.result(timeout=5) for future in futures] == [SPOOLED] * 3
+    assert publisher.stats()['spooled'] == 3
+    assert publisher.stats()['breaker']['state'] != CircuitBreaker.CLOSED
+
+    available['up'] = True
+    assert publisher.replay() == 3
+    assert [record.value['n'] for record in broker.topics['events']] == [0, 1, 2]
+    assert publisher.stats()['breaker']['state'] == CircuitBreaker.CLOSED
+    assert publisher.stats()['spool']['segments'] == 0
+    publisher.close()
+
+def test_publisher_syncs_spooled_durable_messages(tmp_path, monkeypatch):
+    synced = []
+    fsync = os.fsync
+    monkeypatch.setattr(os, 'fsync', lambda fd: synced.append(os.fstat(fd).st_size) or fsync(fd))
+    publisher = KafkaPublisher(
+        factory=lambda: None,
+        reconnect_seconds=0,
+        breaker=CircuitBreaker(failure_threshold=1, reset_timeout=60),
+        spool=DiskSpool(str(tmp_path)),
+        replay_seconds=60
+    )
+    assert publisher.publish('events', {'n': 1}).result(timeout=5) == SPOOLED
+    fan_out_syncs = len(synced)
+    assert publisher.publish('ingest', {'n': 2}, durable=True).result(timeout=5) == SPOOLED
+    assert len(synced) > fan_out_syncs
+    assert synced[-1] == os.path.getsize(os.path.join(tmp_path, os.listdir(tmp_path)[0]))
+    publisher.close()
@@ -0,0 +1,28 @@
+from services.transform import top_group_totals
+
+def test_top_group_totals_matches_per_record_loop():
+    records = [
+        {'ward': 'A', 'patients': 3},
+        {'ward': 1, 'patients': '4'},
+        {'ward': '1', 'patients': 2},
+        {'ward': None, 'patients': 1},
+        {'patients': 9},
+        {'ward': 'A', 'patients': 'unknown'},
+        'not a record',
+    ]
+    labels, values = top_group_totals(records, 'ward', 'patients')
+    assert labels == ['', '1', 'A', 'None']
+    assert values == [9.0, 6.0, 3.0, 1.0]
+
+def test_top_group_totals_breaks_ties_by_label():
+    records = [{'g': g, 'v': v} for g, v in (('d', 5), ('c', 7), ('b', 5), ('a', 5))]
+    assert top_group_totals(records, 'g', 'v', k=3) == (['c', 'a', 'b'], [7.0, 5.0, 5.0])
+
+def test_top_group_totals_limits_to_k():
+    records = [{'g': f'G{i:03d}', 'v': i} for i in range(100)]
+    labels, values = top_group_totals(records, 'g', 'v', k=20)
+    assert labels == [f'G{i:03d}' for i in range(99, 79, -1)]
+    assert values == [float(i) for i in range(99, 79, -1)]
+
+def test_top_group_totals_empty():
+    assert top_group_totals([], 'g', 'v') == ([], [])
@@ -0,0 +1,58 @@
+import pytest
+import mongomock
+from datetime import datetime, timedelta
+from services.write_behind import WriteBehindBuffer
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient()['hospital_dashboard']
+
+@pytest.fixture
+def buffer():
+    buffer = WriteBehindBuffer(flush_interval=60, max_audit_entries=3, max_keys=2)
+    yield buffer
+    buffer.close()
+
+def test_last_used_updates_are_coalesced_per_key(db, buffer):
+    key_id = db.api_keys.insert_one({'key': 'abc', 'is_active': True}).inserted_id
+    start = datetime(2024, 1, 1)
+    for minute in range(50):
+        buffer.touch_key(db, key_id, start + timedelta(minutes=minute))
+    assert buffer.stats()['pending_keys'] == 1
+
+    buffer.flush()
+    assert db.api_keys.find_one({'_id': key_id})['last_used'] == start + timedelta(minutes=49)
+    assert buffer.stats()['keys_written'] == 1
+
+def test_audit_entries_flushed_in_one_batch(db, buffer):
+    for i in range(3):
+        buffer.record_audit(db, {'action': 'api_request_get', 'n': i})
+    assert db.audit_log.count_documents({}) == 0
+
+    buffer.flush()
+    assert db.audit_log.count_documents({}) == 3
+    assert buffer.stats()['flushes'] == 1
+
+def test_drop_policy_bounds_memory(db, buffer):
+    for i in range(5):
+        buffer.record_audit(db, {'action': 'api_request_get', 'n': i})
+    stats = buffer.stats()
+    assert stats['pending_audit_entries'] == 3
+    assert stats['dropped'] == 2
+
+def test_block_policy_flushes_inline(db):
+    buffer = WriteBehindBuffer(flush_interval=60, max_audit_entries=2, overflow_policy='block')
+    for i in range(5):
+        buffer.record_audit(db, {'action': 'api_request_get', 'n': i})
+    assert buffer.stats()['dropped'] == 0
+    buffer.close()
+    assert db.audit_log.count_documents({}) == 5
+
+def test_close_flushes_pending_writes(db):
+    buffer = WriteBehindBuffer(flush_interval=60)
+    key_id = db.api_keys.insert_one({'key': 'abc', 'is_active': True}).inserted_id
+    buffer.touch_key(db, key_id)
+    buffer.record_audit(db, {'action': 'api_request_post'})
+    buffer.close()
+    assert 'last_used' in db.api_keys.find_one({'_id': key_id})
+    assert db.audit_log.count_documents({}) == 1
@@ -374,9 +374,47 @@ const Charts: React.FC = () => {
     }
   };
 
-  const handleEmbedClick = (dashboardId: string, chartTitle: string) => {
-    setEmbedChart({ dashboardId, chartTitle });
-    setEmbedDialogOpen(true);
+  // Embed ids only resolve for published charts, so the chart is
+  // published before its embed code is shown
+  const setChartPublic = async (
+    dashboardId: string,
+    chartTitle: string,
+    isPublic: boolean
+  ) => {
+    const token = localStorage.getItem("token");
+    if (!token) throw new Error("No authentication token found");
+
+    const url = `${API_URL}/dashboard/${dashboardId}/chart/${encodeURIComponent(
+      chartTitle
+    )}/public`;
+    const config = { headers: { Authorization: `Bearer ${token}` } };
+    if (isPublic) {
+      await axios.put(url, {}, config);
+    } else {
+      await axios.delete(url, config);
+    }
+  };
+
+  const handleEmbedClick = async (dashboardId: string, chartTitle: string) => {
+    try {
+      await setChartPublic(dashboardId, chartTitle, true);
+      setEmbedChart({ dashboardId, chartTitle });
+      setEmbedDialogOpen(true);
+    } catch (err) {
+      console.error("Error publishing chart:", err);
+      setError("Failed to publish chart for embedding");
+    }
+  };
+
+  const handleUnpublish = async () => {
+    if (!embedChart) return;
+    try {
+      await setChartPublic(embedChart.dashboardId, embedChart.chartTitle, false);
+      handleEmbedDialogClose();
+    } catch (err) {
+      console.error("Error unpublishing chart:", err);
+      setError("Failed to stop sharing chart");
+    }
   };
 
   const handleEmbedDialogClose = () => {
@@ -802,8 +840,8 @@ const Charts: React.FC = () => {
           <DialogTitle>Embed Chart</DialogTitle>
           <DialogContent>
             <Typography variant="body2" color="text.secondary" sx={{ mb: 2 }}>
-              Copy the code below to embed this chart in your website or
-              application:
+              This chart is now public: anyone with the code below can view
+              it. Copy it to embed this chart in your website or application:
             </Typography>
             <Box
               sx={{
@@ -832,6 +870,9 @@ const Charts: React.FC = () => {
             </Box>
           </DialogContent>
           <DialogActions>
+            <Button onClick={handleUnpublish} color="error">
+              Stop sharing
+            </Button>
             <Button onClick={handleEmbedDialogClose}>Close</Button>
           </DialogActions>
         </Dialog>
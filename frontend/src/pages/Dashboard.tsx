@@ -214,6 +214,82 @@ const Dashboard: React.FC = () => {
     fetchDashboards();
   }, []);
 
+  // Live updates: one stream for every dashboard on the page, so a page
+  // with many dashboards doesn't use up the browser's connections per host.
+  // The server pushes fresh data for the charts whose data source received
+  // new records, so only those charts are replaced. EventSource can't send
+  // the Authorization header, so the stream is opened with a short-lived
+  // token scoped to these dashboards, fetched again whenever it reconnects
+  useEffect(() => {
+    const token = localStorage.getItem("token");
+    const ids = dashboards
+      .filter((dashboard) => dashboard && dashboard.id)
+      .map((dashboard) => dashboard.id);
+    if (!token || ids.length === 0) {
+      return;
+    }
+    let source: EventSource | null = null;
+    let retry: ReturnType<typeof setTimeout> | undefined;
+    let lastEventId = "";
+    let closed = false;
+
+    const connect = async () => {
+      try {
+        const response = await axios.post(
+          `${API_URL}/dashboard/events/token`,
+          { dashboards: ids },
+          { headers: { Authorization: `Bearer ${token}` } }
+        );
+        if (closed) {
+          return;
+        }
+        const params = new URLSearchParams({ token: response.data.token });
+        if (lastEventId) {
+          params.set("last_event_id", lastEventId);
+        }
+        const stream = new EventSource(
+          `${API_URL}/dashboard/events?${params}`
+        );
+        source = stream;
+        listen(stream);
+      } catch (err) {
+        console.error("Error opening live updates:", err);
+        retry = setTimeout(connect, 5000);
+      }
+    };
+
+    const listen = (stream: EventSource) => {
+      stream.addEventListener("charts", (event) => {
+        const message = event as MessageEvent;
+        if (message.lastEventId) {
+          lastEventId = message.lastEventId;
+        }
+        const update = JSON.parse(message.data);
+        setChartsData((prev) => ({
+          ...prev,
+          [update.dashboard_id]: {
+            ...prev[update.dashboard_id],
+            ...update.charts,
+          },
+        }));
+      });
+      stream.onerror = () => {
+        // A stream refused with an expired token is not retried by the
+        // browser; reopen it with a fresh one
+        if (stream.readyState === EventSource.CLOSED && !closed) {
+          retry = setTimeout(connect, 5000);
+        }
+      };
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retry);
+      source?.close();
+    };
+  }, [dashboards]);
+
   const renderChart = (chartType: string, chartData: any) => {
     console.log("Rendering chart:", { type: chartType, data: chartData });
     const ChartComponent = {
@@ -32,6 +32,9 @@ const Data: React.FC = () => {
   const [rows, setRows] = useState<any[]>([]);
   const [columns, setColumns] = useState<GridColDef[]>([]);
   const [loading, setLoading] = useState(false);
+  // Cursor of the next page of the selected source, if there is one
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState("");
   const [success, setSuccess] = useState("");
 
@@ -71,19 +74,34 @@ const Data: React.FC = () => {
     }
   };
 
+  // The API returns a page of rows at a time; X-Next-Cursor names the last
+  // row of the page, and ?after= fetches the rows that follow it
+  const fetchSourcePage = async (sourceId: string, after?: string) => {
+    const response = await axios.get(
+      `${API_URL}/data/source/${sourceId}/data`,
+      {
+        params: after ? { after } : {},
+        withCredentials: true,
+      }
+    );
+    setNextCursor(response.headers["x-next-cursor"] || null);
+    return response.data;
+  };
+
+  const toGridRows = (data: any[]) =>
+    data.map((record: any, index: number) => ({
+      id: record.id || index,
+      ...record.data,
+    }));
+
   const fetchSourceData = async (sourceId: string) => {
     try {
       setLoading(true);
       setError("");
-      const response = await axios.get(
-        `${API_URL}/data/source/${sourceId}/data`,
-        {
-          withCredentials: true,
-        }
-      );
+      setNextCursor(null);
+      const data = await fetchSourcePage(sourceId);
 
       // Transform the data for DataGrid
-      const data = response.data;
       console.log("Received data:", data); // Debug log
 
       if (data && data.length > 0) {
@@ -106,10 +124,7 @@ const Data: React.FC = () => {
         );
 
         // Transform data into rows with unique IDs
-        const gridRows = data.map((record: any, index: number) => ({
-          id: record.id || index,
-          ...record.data,
-        }));
+        const gridRows = toGridRows(data);
 
         console.log("Transformed columns:", gridColumns); // Debug log
         console.log("Transformed rows:", gridRows); // Debug log
@@ -134,6 +149,22 @@ const Data: React.FC = () => {
     }
   };
 
+  const loadMoreSourceData = async () => {
+    if (!selectedSource || !nextCursor) return;
+    try {
+      setLoadingMore(true);
+      const data = await fetchSourcePage(selectedSource, nextCursor);
+      setRows((prev) => [...prev, ...toGridRows(data)]);
+    } catch (err: any) {
+      console.error("Error fetching more source data:", err);
+      setError(
+        err.response?.data?.message || err.message || "Failed to fetch data"
+      );
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleSourceChange = (event: React.ChangeEvent<HTMLInputElement>) => {
     const sourceId = event.target.value;
     setSelectedSource(sourceId);
@@ -142,6 +173,7 @@ const Data: React.FC = () => {
     } else {
       setColumns([]);
       setRows([]);
+      setNextCursor(null);
     }
   };
 
@@ -220,6 +252,28 @@ const Data: React.FC = () => {
             />
           </Box>
         )}
+
+        {!loading && nextCursor && (
+          <Box
+            sx={{
+              display: "flex",
+              justifyContent: "space-between",
+              alignItems: "center",
+              mt: 2,
+            }}
+          >
+            <Typography variant="body2" color="text.secondary">
+              Showing the first {rows.length} records
+            </Typography>
+            <Button
+              variant="outlined"
+              onClick={loadMoreSourceData}
+              disabled={loadingMore}
+            >
+              {loadingMore ? "Loading..." : "Load more"}
+            </Button>
+          </Box>
+        )}
       </Paper>
     </Box>
   );
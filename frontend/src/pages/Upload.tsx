@@ -122,33 +122,25 @@ const Upload: React.FC = () => {
 
   const handleDownload = async (sourceId: string, fileName: string) => {
     try {
+      // The server streams the CSV, so large sources are not built in the browser
       const response = await axios.get(
-        `${API_URL}/data/source/${sourceId}/data`,
+        `${API_URL}/data/source/${sourceId}/export?format=csv`,
         {
           withCredentials: true,
+          responseType: "blob",
         }
       );
 
-      // Convert the data to CSV
-      const data = response.data;
-      if (data && data.length > 0) {
-        const headers = Object.keys(data[0].data).join(",");
-        const rows = data.map((record: any) =>
-          Object.values(record.data).join(",")
-        );
-        const csv = [headers, ...rows].join("\n");
-
-        // Create and download the file
-        const blob = new Blob([csv], { type: "text/csv" });
-        const url = window.URL.createObjectURL(blob);
-        const a = document.createElement("a");
-        a.href = url;
-        a.download = fileName;
-        document.body.appendChild(a);
-        a.click();
-        document.body.removeChild(a);
-        window.URL.revokeObjectURL(url);
-      }
+      // Create and download the file
+      const blob = response.data;
+      const url = window.URL.createObjectURL(blob);
+      const a = document.createElement("a");
+      a.href = url;
+      a.download = fileName;
+      document.body.appendChild(a);
+      a.click();
+      document.body.removeChild(a);
+      window.URL.revokeObjectURL(url);
     } catch (err: any) {
       console.error("Error downloading file:", err);
       setError(err.response?.data?.message || "Error downloading file");
@@ -188,6 +180,12 @@ const Upload: React.FC = () => {
       });
 
       console.log("Upload response:", response.data);
+      if (response.status === 202 && response.data.job_id) {
+        const completed = await waitForUploadJob(response.data.job_id, token);
+        if (!completed) {
+          return;
+        }
+      }
       setSuccess("File uploaded successfully!");
       setFile(null);
       setDataSource("");
@@ -209,6 +207,35 @@ const Upload: React.FC = () => {
     }
   };
 
+  // Large uploads are processed as background jobs; poll until done
+  const waitForUploadJob = async (
+    jobId: string,
+    token: string
+  ): Promise<boolean> => {
+    while (true) {
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+      const response = await axios.get(`${API_URL}/data/jobs/${jobId}`, {
+        headers: { Authorization: `Bearer ${token}` },
+        withCredentials: true,
+      });
+      const job = response.data;
+      if (job.status === "completed") {
+        return true;
+      }
+      if (job.status === "failed" || job.status === "stalled") {
+        setError(job.errors?.[0] || "Error processing file. Please try again.");
+        return false;
+      }
+      const percent =
+        job.percent_complete !== null ? ` ${job.percent_complete}%` : "";
+      const eta =
+        job.eta_seconds !== null ? `, about ${Math.ceil(job.eta_seconds)}s left` : "";
+      setSuccess(
+        `Processing file...${percent} (${job.rows_processed} rows${eta})`
+      );
+    }
+  };
+
   const handleDeleteClick = (source: DataSource) => {
     setSelectedSource(source);
     setDeleteDialogOpen(true);